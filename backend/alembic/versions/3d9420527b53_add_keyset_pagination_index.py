@@ -0,0 +1,31 @@
+"""add_keyset_pagination_index
+
+Revision ID: 3d9420527b53
+Revises: e94eb8073562
+Create Date: 2026-10-16 09:12:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9420527b53'
+down_revision: Union[str, None] = 'e94eb8073562'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Composite index for keyset pagination within an organization:
+    # WHERE organization_id = ? AND id > ? ORDER BY id LIMIT ?
+    op.create_index(
+        'idx_diagnostic_codes_org_id_id',
+        'diagnostic_codes',
+        ['organization_id', 'id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_diagnostic_codes_org_id_id', table_name='diagnostic_codes')
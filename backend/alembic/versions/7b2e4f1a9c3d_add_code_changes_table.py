@@ -0,0 +1,47 @@
+"""add_code_changes_table
+
+Revision ID: 7b2e4f1a9c3d
+Revises: 3d9420527b53
+Create Date: 2026-10-16 11:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b2e4f1a9c3d'
+down_revision: Union[str, None] = '3d9420527b53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Change log for delta sync: the id is the change sequence clients resume from.
+    # Deletes leave tombstone rows, so there is no FK to diagnostic_codes.
+    op.create_table(
+        'code_changes',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('organization_id', sa.Integer(), nullable=False),
+        sa.Column('diagnostic_code_id', sa.Integer(), nullable=False),
+        sa.Column('operation', sa.String(10), nullable=False),
+        sa.Column('changed_at', sa.DateTime(), nullable=False),
+    )
+    
+    # WHERE organization_id = ? AND id > ? ORDER BY id LIMIT ?
+    op.create_index('idx_code_changes_org_id', 'code_changes', ['organization_id', 'id'])
+    
+    # Backfill one upsert per existing code so since=0 returns the full catalog
+    op.execute("""
+        INSERT INTO code_changes (organization_id, diagnostic_code_id, operation, changed_at)
+        SELECT organization_id, id, 'upsert', COALESCE(updated_at, CURRENT_TIMESTAMP)
+        FROM diagnostic_codes
+        ORDER BY id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_code_changes_org_id', table_name='code_changes')
+    op.drop_table('code_changes')
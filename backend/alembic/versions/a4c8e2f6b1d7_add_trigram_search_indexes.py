@@ -0,0 +1,37 @@
+"""add_trigram_search_indexes
+
+Revision ID: a4c8e2f6b1d7
+Revises: 7b2e4f1a9c3d
+Create Date: 2026-10-16 13:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c8e2f6b1d7'
+down_revision: Union[str, None] = '7b2e4f1a9c3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Trigram indexes serve both substring search (ILIKE '%q%') and typo-tolerant
+    # matching (similarity operators %, <%) in SearchService.advanced_search
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_diagnostic_codes_code_trgm
+        ON diagnostic_codes USING gin (code gin_trgm_ops)
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_diagnostic_codes_description_trgm
+        ON diagnostic_codes USING gin (description gin_trgm_ops)
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_diagnostic_codes_description_trgm")
+    op.execute("DROP INDEX IF EXISTS idx_diagnostic_codes_code_trgm")
@@ -0,0 +1,68 @@
+"""add_weighted_search_tsv
+
+Revision ID: c7d1e9b3f5a2
+Revises: a4c8e2f6b1d7
+Create Date: 2026-10-16 15:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d1e9b3f5a2'
+down_revision: Union[str, None] = 'a4c8e2f6b1d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Weighted document for ranked full-text search:
+    # code (A), description (B), category/subcategory (C)
+    op.add_column('diagnostic_codes',
+                  sa.Column('search_tsv', sa.dialects.postgresql.TSVECTOR(), nullable=True))
+    
+    # tsvector_update_trigger cannot weight columns, so use a trigger function
+    op.execute("""
+        CREATE OR REPLACE FUNCTION diagnostic_codes_search_tsv_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_tsv :=
+                setweight(to_tsvector('simple', COALESCE(NEW.code, '')), 'A') ||
+                setweight(to_tsvector('english', COALESCE(NEW.description, '')), 'B') ||
+                setweight(to_tsvector('english',
+                    COALESCE(NEW.category, '') || ' ' || COALESCE(NEW.subcategory, '')), 'C');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER search_tsv_update_diagnostic_codes
+        BEFORE INSERT OR UPDATE OF code, description, category, subcategory ON diagnostic_codes
+        FOR EACH ROW EXECUTE FUNCTION diagnostic_codes_search_tsv_update()
+    """)
+    
+    # Backfill existing rows
+    op.execute("""
+        UPDATE diagnostic_codes SET search_tsv =
+            setweight(to_tsvector('simple', COALESCE(code, '')), 'A') ||
+            setweight(to_tsvector('english', COALESCE(description, '')), 'B') ||
+            setweight(to_tsvector('english',
+                COALESCE(category, '') || ' ' || COALESCE(subcategory, '')), 'C')
+    """)
+    
+    # Multicolumn GIN (needs btree_gin for the integer column): one index scan
+    # resolves both the tenant filter and the text match
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_diagnostic_codes_org_search_tsv
+        ON diagnostic_codes USING gin (organization_id, search_tsv)
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_diagnostic_codes_org_search_tsv")
+    op.execute("DROP TRIGGER IF EXISTS search_tsv_update_diagnostic_codes ON diagnostic_codes")
+    op.execute("DROP FUNCTION IF EXISTS diagnostic_codes_search_tsv_update()")
+    op.drop_column('diagnostic_codes', 'search_tsv')
@@ -0,0 +1,45 @@
+"""add_webhook_outbox
+
+Revision ID: e3f7a9c1d5b8
+Revises: c7d1e9b3f5a2
+Create Date: 2026-10-17 09:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3f7a9c1d5b8'
+down_revision: Union[str, None] = 'c7d1e9b3f5a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Transactional outbox: written with the change, drained by the webhook worker
+    op.create_table(
+        'webhook_outbox',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('webhook_id', sa.Integer(), sa.ForeignKey('webhooks.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('event_type', sa.String(50), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    )
+    
+    # Oldest queued row per webhook (per-endpoint ordering) and the worker's due scan
+    op.create_index(
+        'idx_webhook_outbox_status_webhook', 'webhook_outbox', ['status', 'webhook_id', 'id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_webhook_outbox_status_webhook', table_name='webhook_outbox')
+    op.drop_table('webhook_outbox')
@@ -0,0 +1,37 @@
+"""add_code_changes_txid
+
+Revision ID: f2b6d8e4a1c9
+Revises: e3f7a9c1d5b8
+Create Date: 2026-10-17 15:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b6d8e4a1c9'
+down_revision: Union[str, None] = 'e3f7a9c1d5b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Writing transaction of each change: ids are assigned at insert, not commit,
+    # so readers resume from (txid, id) instead. Existing rows keep txid 0.
+    op.add_column(
+        'code_changes',
+        sa.Column('txid', sa.BigInteger(), nullable=False, server_default='0'),
+    )
+    
+    # WHERE organization_id = ? AND (txid, id) > (?, ?) ORDER BY txid, id LIMIT ?
+    op.drop_index('idx_code_changes_org_id', table_name='code_changes')
+    op.create_index('idx_code_changes_org_cursor', 'code_changes', ['organization_id', 'txid', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_code_changes_org_cursor', table_name='code_changes')
+    op.create_index('idx_code_changes_org_id', 'code_changes', ['organization_id', 'id'])
+    op.drop_column('code_changes', 'txid')
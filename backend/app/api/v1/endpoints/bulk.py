@@ -159,7 +159,7 @@ async def bulk_update_codes(
     
     for code_id in code_ids:
         try:
-            code = service.update_code(code_id, update_data)
+            code = service.update_code(code_id, update_data, defer_invalidation=True)
             if code:
                 updated_count += 1
                 
@@ -175,6 +175,9 @@ async def bulk_update_codes(
         except Exception as e:
             errors.append(f"Code ID {code_id}: {str(e)}")
     
+    # One cache invalidation per affected organization, not per code
+    service.invalidate_caches()
+    
     return {
         "success": True,
         "updated": updated_count,
@@ -210,7 +213,7 @@ async def bulk_delete_codes(
                     "is_active": code.is_active
                 }
                 
-                if service.delete_code(code_id):
+                if service.delete_code(code_id, defer_invalidation=True):
                     deleted_count += 1
                     
                     # Log deletion
@@ -223,6 +226,9 @@ async def bulk_delete_codes(
         except Exception as e:
             errors.append(f"Code ID {code_id}: {str(e)}")
     
+    # One cache invalidation per affected organization, not per code
+    service.invalidate_caches()
+    
     return {
         "success": True,
         "deleted": deleted_count,
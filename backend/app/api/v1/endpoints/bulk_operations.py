@@ -98,6 +98,9 @@ def bulk_import_codes(
             detail=f"Failed to commit changes: {str(e)}"
         )
     
+    # Rows were written directly; drop the organization's cached listings
+    service.invalidate_caches(current_user.organization_id)
+    
     return BulkImportResponse(
         total=total,
         created=created,
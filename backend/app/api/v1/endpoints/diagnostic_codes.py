@@ -1,8 +1,10 @@
 """
 Diagnostic Codes API endpoints.
 """
+import hashlib
+import json
 from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
@@ -13,12 +15,16 @@ from app.schemas.diagnostic_code import (
     DiagnosticCodeUpdate,
     DiagnosticCodeResponse,
     DiagnosticCodeList,
+    DiagnosticCodeChange,
+    DiagnosticCodeChanges,
 )
 from app.services.diagnostic_code_service import DiagnosticCodeService
 from app.services.audit_service import AuditService
 from app.services.version_service import VersionService
 from app.services.webhook_service import WebhookService
 from app.services.ai_search import ai_search_codes, get_ai_suggestions
+from app.core.cache import cache
+from app.core.config import settings
 from app.core.deps import get_current_active_user
 from app.core.rbac import require_editor, require_viewer
 from app.models.user import User
@@ -27,6 +33,42 @@ router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
 
 
+def _list_response_key(organization_id: Optional[int], version: int, params: Dict[str, Any]) -> str:
+    """Cache key for an encoded list response: org + catalog version + query params."""
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return f"codes:response:{organization_id}:g{version}:{digest}"
+
+
+def _etag(*parts: Any) -> str:
+    """Strong ETag over the catalog version and whatever identifies the resource."""
+    return '"' + hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest() + '"'
+
+
+def _etag_headers(etag: Optional[str]) -> Dict[str, str]:
+    # Responses depend on the caller's organization: only private caches may
+    # store them, and they must revalidate (cheaply, via If-None-Match) each time
+    headers = {"Cache-Control": "private, no-cache"}
+    if etag is not None:
+        headers["ETag"] = etag
+    return headers
+
+
+def _not_modified(request: Request, etag: Optional[str]) -> Optional[Response]:
+    """
+    A 304 response if the client's If-None-Match already matches etag.
+    
+    Runs before the resource is loaded, so "*" (any existing representation)
+    is not honoured: it would answer 304 for codes that do not exist.
+    """
+    header = request.headers.get("if-none-match")
+    if not header or etag is None:
+        return None
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    if etag in candidates:
+        return Response(status_code=304, headers=_etag_headers(etag))
+    return None
+
+
 @router.get("", response_model=DiagnosticCodeList)
 @limiter.limit("100/minute")
 async def get_diagnostic_codes(
@@ -37,6 +79,14 @@ async def get_diagnostic_codes(
     category: Optional[str] = Query(None),
     severity: Optional[str] = Query(None),
     is_active: Optional[bool] = Query(None),
+    after: Optional[str] = Query(
+        None, description="Keyset cursor from a previous page's next_cursor; overrides skip"
+    ),
+    include_total: bool = Query(True, description="Set to false to skip computing the total"),
+    sort: str = Query(
+        "id", pattern="^(id|relevance)$",
+        description="relevance: best search matches first (offset pages only, no cursor)"
+    ),
     db: Session = Depends(get_db),
     current_user: User = Depends(require_viewer),
 ):
@@ -46,58 +96,157 @@ async def get_diagnostic_codes(
     # Filter by user's organization
     organization_id = current_user.organization_id if current_user else None
     
-    codes = service.get_codes(
+    # Repeat requests are served from the encoded response bytes, skipping the
+    # ORM and Pydantic entirely. Writes bump the version and so retire old keys.
+    shared_version = await service.ashared_catalog_version(organization_id)
+    version = shared_version if shared_version is not None else await service.acatalog_version(organization_id)
+    response_key = _list_response_key(organization_id, version, {
+        "skip": skip,
+        "limit": limit,
+        "search": search,
+        "category": category,
+        "severity": severity,
+        "is_active": is_active,
+        "after": after,
+        "include_total": include_total,
+        "sort": sort,
+    })
+    
+    # Revalidation is answered from the version alone, before any query runs.
+    # No ETag without a shared version: other workers' writes would not change it.
+    etag = _etag(response_key) if shared_version is not None else None
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    headers = _etag_headers(etag)
+    
+    body = await cache.aget_bytes(response_key)
+    if body is not None:
+        return Response(content=body, media_type="application/json", headers={**headers, "X-Cache": "HIT"})
+    
+    filters = {
+        "search": search,
+        "category": category,
+        "severity": severity,
+        "is_active": is_active,
+        "organization_id": organization_id,
+    }
+    
+    # Cursor mode seeks through the id index instead of using OFFSET
+    after_id = None
+    if after is not None:
+        try:
+            after_id = service.decode_cursor(after, **filters)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        skip = 0
+    
+    codes = await service.aget_codes(
         skip=skip,
         limit=limit,
-        search=search,
-        category=category,
-        severity=severity,
-        is_active=is_active,
-        organization_id=organization_id,
-    )
-    total = service.count_codes(
-        search=search,
-        category=category,
-        severity=severity,
-        is_active=is_active,
-        organization_id=organization_id,
+        after_id=after_id,
+        sort=sort,
+        **filters,
     )
+    total, total_is_estimate = None, False
+    if include_total:
+        total, total_is_estimate = await service.aget_total(**filters)
+    
+    # Cursors seek by id, so they are only issued for id-ordered pages
+    ranked = sort == "relevance" and bool(search) and after_id is None
+    next_cursor = None
+    if len(codes) == limit and not ranked:
+        next_cursor = service.encode_cursor(codes[-1].id, **filters)
     
-    return DiagnosticCodeList(
+    body = DiagnosticCodeList(
         total=total,
+        total_is_estimate=total_is_estimate,
         items=codes,
         skip=skip,
         limit=limit,
+        next_cursor=next_cursor,
+    ).model_dump_json().encode()
+    await cache.aset_bytes(response_key, body, ttl=settings.RESPONSE_CACHE_TTL)
+    return Response(content=body, media_type="application/json", headers={**headers, "X-Cache": "MISS"})
+
+
+@router.get("/changes", response_model=DiagnosticCodeChanges)
+async def get_diagnostic_code_changes(
+    since: str = Query("0", description="next_since of the last page already applied (0 = full sync)"),
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_viewer),
+):
+    """
+    Get codes inserted, updated or deleted since a change token.
+    
+    Offline clients store next_since and pass it back as `since`, repeating
+    while has_more is true. Deletes are returned as tombstones (code is null).
+    """
+    service = DiagnosticCodeService(db)
+    try:
+        entries, next_since, has_more = service.get_changes(
+            current_user.organization_id, since=since, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return DiagnosticCodeChanges(
+        changes=[
+            DiagnosticCodeChange(sequence=sequence, operation=operation, id=code_id, code=code)
+            for sequence, operation, code_id, code in entries
+        ],
+        next_since=next_since,
+        has_more=has_more,
     )
 
 
 @router.get("/{code_id}", response_model=DiagnosticCodeResponse)
 async def get_diagnostic_code(
     code_id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(require_viewer),
     db: Session = Depends(get_db),
 ):
     """Get a specific diagnostic code by ID."""
     service = DiagnosticCodeService(db)
     organization_id = current_user.organization_id if current_user else None
-    code = service.get_code_by_id(code_id, organization_id)
+    
+    version = await service.ashared_catalog_version(organization_id)
+    etag = _etag("id", organization_id, version, code_id) if version is not None else None
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    
+    code = await service.aget_code_by_id(code_id, organization_id)
     if not code:
         raise HTTPException(status_code=404, detail="Diagnostic code not found")
+    response.headers.update(_etag_headers(etag))
     return code
 
 
 @router.get("/by-code/{code}", response_model=DiagnosticCodeResponse)
 async def get_diagnostic_code_by_code(
     code: str,
+    request: Request,
+    response: Response,
     current_user: User = Depends(require_viewer),
     db: Session = Depends(get_db),
 ):
     """Get a specific diagnostic code by code string."""
     service = DiagnosticCodeService(db)
     organization_id = current_user.organization_id if current_user else None
+    
+    version = await service.ashared_catalog_version(organization_id)
+    etag = _etag("code", organization_id, version, code) if version is not None else None
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    
     diagnostic_code = service.get_code_by_code(code, organization_id)
     if not diagnostic_code:
         raise HTTPException(status_code=404, detail="Diagnostic code not found")
+    response.headers.update(_etag_headers(etag))
     return diagnostic_code
 
 
@@ -122,8 +271,23 @@ async def create_diagnostic_code(
             detail=f"Diagnostic code '{code_data.code}' already exists in this organization"
         )
     
+    def queue_webhooks(code):
+        # Committed with the code itself; the webhook worker delivers them
+        WebhookService.enqueue_event(
+            db,
+            "code.created",
+            {
+                "id": code.id,
+                "code": code.code,
+                "description": code.description,
+                "category": code.category,
+                "severity": code.severity,
+                "user_id": current_user.id
+            }
+        )
+    
     try:
-        new_code = service.create_code(code_data, organization_id)
+        new_code = service.create_code(code_data, organization_id, before_commit=queue_webhooks)
     except ValueError as e:
         # Organization limit exceeded
         raise HTTPException(status_code=400, detail=str(e))
@@ -138,20 +302,6 @@ async def create_diagnostic_code(
         changed_fields=["all"]
     )
     
-    # Trigger webhooks
-    await WebhookService.trigger_webhooks(
-        db=db,
-        event_type="code.created",
-        payload={
-            "id": new_code.id,
-            "code": new_code.code,
-            "description": new_code.description,
-            "category": new_code.category,
-            "severity": new_code.severity,
-            "user_id": current_user.id
-        }
-    )
-    
     # Log the creation
     AuditService.log_code_create(
         db=db,
@@ -188,8 +338,6 @@ async def update_diagnostic_code(
         "is_active": old_code.is_active
     }
     
-    updated_code = service.update_code(code_id, code_data)
-    
     # Track changed fields
     changed_fields = {}
     update_dict = code_data.dict(exclude_unset=True)
@@ -198,27 +346,31 @@ async def update_diagnostic_code(
         if old_value != new_value:
             changed_fields[field] = {"old": str(old_value), "new": str(new_value)}
     
+    def queue_webhooks(code):
+        # Committed with the update itself; the webhook worker delivers them
+        if changed_fields:
+            WebhookService.enqueue_event(
+                db,
+                "code.updated",
+                {
+                    "id": code.id,
+                    "code": code.code,
+                    "changed_fields": list(changed_fields.keys()),
+                    "user_id": current_user.id
+                }
+            )
+    
+    updated_code = service.update_code(code_id, code_data, before_commit=queue_webhooks)
+    
     # Create version snapshot
     if changed_fields:
         VersionService.create_version(
             db=db,
-            code_id=code_id,
-            user_id=current_user.id,
+            diagnostic_code=updated_code,
             change_type="UPDATE",
-            changed_fields=changed_fields,
-            comment="Code updated"
-        )
-        
-        # Trigger webhooks
-        await WebhookService.trigger_webhooks(
-            db=db,
-            event_type="code.updated",
-            payload={
-                "id": updated_code.id,
-                "code": updated_code.code,
-                "changed_fields": list(changed_fields.keys()),
-                "user_id": current_user.id
-            }
+            user_id=current_user.id,
+            change_summary="Code updated",
+            changed_fields=list(changed_fields.keys())
         )
     
     # Log the update
@@ -267,19 +419,20 @@ async def delete_diagnostic_code(
         changed_fields=["status"]
     )
     
-    # Trigger webhooks
-    await WebhookService.trigger_webhooks(
-        db=db,
-        event_type="code.deleted",
-        payload={
-            "id": code_id,
-            "code": code_data["code"],
-            "user_id": current_user.id
-        }
+    # Webhooks are queued in the delete's transaction and delivered by the worker
+    service.delete_code(
+        code_id,
+        before_commit=lambda code: WebhookService.enqueue_event(
+            db,
+            "code.deleted",
+            {
+                "id": code_id,
+                "code": code_data["code"],
+                "user_id": current_user.id
+            }
+        )
     )
     
-    service.delete_code(code_id)
-    
     # Log the deletion
     AuditService.log_code_delete(
         db=db,
@@ -308,7 +461,7 @@ async def ai_search(
     - "shortness of breath with wheezing"
     """
     try:
-        codes = await ai_search_codes(query, db, limit)
+        codes = await ai_search_codes(query, db, limit, current_user.organization_id)
         return codes
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI search failed: {str(e)}")
@@ -328,7 +481,7 @@ async def suggest_from_symptoms(
     Returns suggestions with explanations and confidence level.
     """
     try:
-        result = await get_ai_suggestions(symptoms, db, limit)
+        result = await get_ai_suggestions(symptoms, db, limit, current_user.organization_id)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI suggestions failed: {str(e)}")
@@ -2,6 +2,10 @@
 from fastapi import APIRouter, status
 from sqlalchemy import text
 from app.db.database import get_db
+from app.core.cache import cache
+from app.services.ai_search import prompt_metrics
+from app.services.llm_cache import llm_cache
+from app.services.search_cache import search_cache
 
 router = APIRouter()
 
@@ -30,3 +34,14 @@ async def database_health_check():
             "database": "disconnected",
             "error": str(e)
         }
+
+@router.get("/health/cache", status_code=status.HTTP_200_OK)
+async def cache_health_check():
+    """Cache availability, hit/miss counters (per tier, search endpoint, LLM) and prompt sizes."""
+    return {
+        "status": "healthy" if cache.is_available() else "degraded",
+        "tiers": cache.get_stats(),
+        "search": search_cache.get_stats(),
+        "llm": llm_cache.get_stats(),
+        "prompts": prompt_metrics.get_stats()
+    }
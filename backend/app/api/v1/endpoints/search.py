@@ -2,13 +2,17 @@
 Advanced search endpoints with autocomplete.
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, Query, Request
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
 from app.db.database import get_db
 from app.services.search_service import SearchService
+from app.services.search_cache import normalize_query, search_cache
+from app.services.search_history import search_history
 from app.schemas.search import (
     SearchSuggestion,
     SearchResult,
@@ -16,12 +20,19 @@ from app.schemas.search import (
     SavedSearchCreate,
     SavedSearchResponse,
 )
-from app.core.deps import get_current_active_user
+from app.core.deps import get_current_active_user, get_optional_current_user
 from app.models.user import User
 
 router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
 
+_suggestions_adapter = TypeAdapter(List[SearchSuggestion])
+_results_adapter = TypeAdapter(List[SearchResult])
+
+
+def _json_response(body: bytes, hit: bool) -> Response:
+    return Response(content=body, media_type="application/json", headers={"X-Cache": "HIT" if hit else "MISS"})
+
 
 @router.get("/autocomplete", response_model=List[SearchSuggestion])
 @limiter.limit("100/minute")
@@ -30,10 +41,23 @@ async def autocomplete(
     query: str = Query(..., min_length=1),
     limit: int = Query(10, ge=1, le=50),
     db: Session = Depends(get_db),
+    current_user: Optional[User] = Depends(get_optional_current_user),
 ):
     """Get autocomplete suggestions for search query."""
+    # Signed-in users get their organization's codes; anonymous callers the whole catalog
+    organization_id = current_user.organization_id if current_user else None
+    query = normalize_query(query)
+    
+    key, body = await search_cache.get("autocomplete", organization_id, {"query": query, "limit": limit})
+    if body is not None:
+        return _json_response(body, hit=True)
+    
     service = SearchService(db)
-    return service.get_autocomplete_suggestions(query, limit)
+    # A stale index is refreshed (or rebuilt) from the database: keep that off the event loop
+    suggestions = await run_in_threadpool(service.get_autocomplete_suggestions, query, limit, organization_id)
+    body = _suggestions_adapter.dump_json(suggestions)
+    await search_cache.set("autocomplete", key, body)
+    return _json_response(body, hit=False)
 
 
 @router.get("/advanced", response_model=List[SearchResult])
@@ -47,24 +71,52 @@ async def advanced_search(
     severity: Optional[str] = None,
     is_active: Optional[bool] = None,
     limit: int = Query(20, ge=1, le=100),
+    mode: str = Query(
+        "default", pattern="^(default|ranked)$",
+        description="ranked: BM25 over the whole catalog (ignores fuzzy)"
+    ),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """Advanced search with fuzzy matching and highlighting."""
     service = SearchService(db)
     
-    # Track search
-    service.track_search(current_user.id, query)
+    # Track search: buffered for the background writer when it is running
+    if not search_history.record(current_user.id, query):
+        service.track_search(current_user.id, query)
+    
+    # Results depend only on the normalized query, the filters and the catalog version
+    query = normalize_query(query)
+    organization_id = current_user.organization_id
+    key, body = await search_cache.get("advanced", organization_id, {
+        "query": query,
+        "fuzzy": fuzzy,
+        "highlight": highlight,
+        "category": category,
+        "severity": severity,
+        "is_active": is_active,
+        "limit": limit,
+        "mode": mode,
+    })
+    if body is not None:
+        return _json_response(body, hit=True)
     
-    return service.advanced_search(
+    # mode="ranked" may build or refresh the BM25 index: keep that off the event loop
+    results = await run_in_threadpool(
+        service.advanced_search,
         query=query,
         fuzzy=fuzzy,
         highlight=highlight,
         category=category,
         severity=severity,
         is_active=is_active,
-        limit=limit
+        limit=limit,
+        mode=mode,
+        organization_id=organization_id,
     )
+    body = _results_adapter.dump_json(results)
+    await search_cache.set("advanced", key, body)
+    return _json_response(body, hit=False)
 
 
 @router.get("/recent", response_model=List[RecentSearchResponse])
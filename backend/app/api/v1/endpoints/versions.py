@@ -141,7 +141,7 @@ async def restore_version(
     if versions:
         await WebhookService.trigger_webhooks(
             db=db,
-            event="code.restored",
+            event_type="code.restored",
             payload={
                 "code_id": code_id,
                 "version_id": restore_data.version_id,
@@ -178,7 +178,7 @@ async def create_comment(
     # Trigger webhook for comment creation
     await WebhookService.trigger_webhooks(
         db=db,
-        event="comment.created",
+        event_type="comment.created",
         payload={
             "id": comment.id,
             "code_id": code_id,
@@ -2,7 +2,7 @@
 API endpoints for webhook management.
 """
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 from app.core.deps import get_current_active_user
@@ -190,7 +190,6 @@ def get_webhook_deliveries(
 async def test_webhook(
     webhook_id: int,
     test_data: WebhookTestRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(allow_user)
 ):
@@ -217,11 +216,9 @@ async def test_webhook(
         "message": "This is a test webhook delivery"
     }
     
-    # Trigger webhook in background
-    background_tasks.add_task(
-        WebhookService._deliver_webhook,
-        db, webhook, test_data.event_type, payload
-    )
+    # Queue for this webhook only; the webhook worker delivers it
+    WebhookService.enqueue_event(db, test_data.event_type, payload, webhooks=[webhook])
+    db.commit()
     
     return {
         "message": "Test webhook queued for delivery",
@@ -1,25 +1,138 @@
 """
 Redis cache configuration and utilities.
 """
+import asyncio
+import inspect
 import json
-from typing import Optional, Any
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import Optional, Any, Callable, Dict, Tuple
 from redis import Redis
+from redis.asyncio import ConnectionPool as AsyncConnectionPool, Redis as AsyncRedis
 from app.core.config import Settings
+from app.core.serialization import CacheCodec
 
 settings = Settings()
 
+# Redis pub/sub channel used to drop entries from every worker's local tier
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+_MISSING = object()
+
+# Compare-and-delete so a worker only releases a recompute lock it still owns
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LocalCache:
+    """Size-bounded in-process LRU with per-entry TTL (thread-safe)."""
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        """Return the cached value, or _MISSING if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """Store a value; the TTL is capped at the tier's own TTL."""
+        ttl = min(ttl, self.ttl) if ttl else self.ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> bool:
+        """Drop a single key."""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def delete_pattern(self, pattern: str) -> int:
+        """Drop all keys matching a glob pattern."""
+        with self._lock:
+            keys = [k for k in self._entries if fnmatchcase(k, pattern)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        """Drop everything."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _Flight:
+    """An in-progress recompute that other threads in this process can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
 
 class CacheService:
-    """Service for caching operations using Redis."""
+    """
+    Service for caching operations using Redis.
+
+    When Redis is available, a small in-process LRU tier sits in front of it so
+    hot keys are served without a network round trip or decode. Deletes
+    are broadcast over Redis pub/sub so every worker drops its local copy.
+    Values returned from the local tier are shared; callers must not mutate them.
+
+    Every operation has an ``a``-prefixed coroutine twin (``aget``, ``aset``,
+    ``aget_or_set``...) backed by a pooled redis.asyncio client, for use from
+    ``async def`` routes so a slow Redis never blocks the event loop. The sync
+    methods remain for sync code paths.
+    """
 
     def __init__(self):
         """Initialize Redis connection."""
         self.redis: Optional[Redis] = None
+        self.aredis: Optional[AsyncRedis] = None
+        self.local: Optional[LocalCache] = None
+        # Value encoding (json/msgpack, optional compression); see serialization.py
+        self.codec = CacheCodec.from_settings(settings)
+        self._instance_id = uuid.uuid4().hex
+        self._pubsub_thread = None
+        # In-process single-flight registries for get_or_set / aget_or_set
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[str, "asyncio.Future[Any]"] = {}
+        self._flights_lock = threading.Lock()
+        self._flight_stats = {"leaders": 0, "coalesced": 0, "stale_served": 0}
+        # Generation counters used when Redis is unavailable (single process)
+        self._local_generations: Dict[str, int] = {}
+        self._stats: Dict[str, Dict[str, int]] = {
+            "local": {"hits": 0, "misses": 0},
+            "redis": {"hits": 0, "misses": 0},
+        }
         try:
             if hasattr(settings, 'REDIS_URL') and settings.REDIS_URL:
                 self.redis = Redis.from_url(
                     settings.REDIS_URL,
-                    decode_responses=True,
+                    decode_responses=False,
                     socket_connect_timeout=5
                 )
                 # Test connection
@@ -28,16 +141,85 @@ class CacheService:
             print(f"Redis connection failed: {e}. Caching disabled.")
             self.redis = None
 
+        if self.redis:
+            # Connections bind to the running event loop lazily on first use
+            self.aredis = AsyncRedis(connection_pool=AsyncConnectionPool.from_url(
+                settings.REDIS_URL,
+                decode_responses=False,
+                socket_connect_timeout=5,
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+            ))
+
+        if self.redis and settings.LOCAL_CACHE_SIZE > 0:
+            self.local = LocalCache(settings.LOCAL_CACHE_SIZE, settings.LOCAL_CACHE_TTL)
+            self._subscribe_invalidations()
+
+    def _subscribe_invalidations(self) -> None:
+        """Listen for invalidations published by other workers."""
+        try:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATION_CHANNEL: self._handle_invalidation})
+            self._pubsub_thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        except Exception as e:
+            # Without cross-worker invalidation the local tier could serve stale data
+            print(f"Cache invalidation subscribe failed: {e}. Local cache disabled.")
+            self.local = None
+
+    def _handle_invalidation(self, message: Dict[str, Any]) -> None:
+        """Apply an invalidation message from the pub/sub channel."""
+        try:
+            data = json.loads(message["data"])
+        except Exception:
+            return
+        if data.get("src") == self._instance_id or self.local is None:
+            return
+        if data.get("op") == "pattern":
+            self.local.delete_pattern(data["key"])
+        else:
+            self.local.delete(data["key"])
+
+    def _publish_invalidation(self, op: str, key: str) -> None:
+        """Tell other workers to drop a key (or pattern) from their local tier."""
+        if self.local is None:
+            return
+        try:
+            self.redis.publish(
+                INVALIDATION_CHANNEL,
+                json.dumps({"src": self._instance_id, "op": op, "key": key})
+            )
+        except Exception as e:
+            print(f"Cache invalidation publish error: {e}")
+
+    def _local_lookup(self, key: str) -> Any:
+        """Check the in-process tier, recording the hit or miss."""
+        if self.local is None:
+            return _MISSING
+        value = self.local.get(key)
+        self._stats["local"]["hits" if value is not _MISSING else "misses"] += 1
+        return value
+
+    def _decode(self, key: str, raw: Optional[bytes]) -> Optional[Any]:
+        """Decode a Redis value and promote it to the in-process tier."""
+        if not raw:
+            self._stats["redis"]["misses"] += 1
+            return None
+        self._stats["redis"]["hits"] += 1
+        decoded = self.codec.decode(raw)
+        if self.local is not None:
+            self.local.set(key, decoded)
+        return decoded
+
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache."""
         if not self.redis:
             return None
 
+        value = self._local_lookup(key)
+        if value is not _MISSING:
+            return value
+
         try:
-            value = self.redis.get(key)
-            if value:
-                return json.loads(value)
-            return None
+            return self._decode(key, self.redis.get(key))
         except Exception as e:
             print(f"Cache get error: {e}")
             return None
@@ -48,8 +230,11 @@ class CacheService:
             return False
 
         try:
-            serialized = json.dumps(value)
-            return bool(self.redis.setex(key, ttl, serialized))
+            serialized = self.codec.encode(value)
+            stored = bool(self.redis.setex(key, ttl, serialized))
+            if stored and self.local is not None:
+                self.local.set(key, value, ttl)
+            return stored
         except Exception as e:
             print(f"Cache set error: {e}")
             return False
@@ -59,6 +244,10 @@ class CacheService:
         if not self.redis:
             return False
 
+        if self.local is not None:
+            self.local.delete(key)
+            self._publish_invalidation("delete", key)
+
         try:
             return bool(self.redis.delete(key))
         except Exception as e:
@@ -66,19 +255,457 @@ class CacheService:
             return False
 
     def delete_pattern(self, pattern: str) -> int:
-        """Delete all keys matching pattern."""
+        """
+        Delete all keys matching pattern.
+
+        Uses incremental SCAN rather than KEYS so Redis is never blocked, but it
+        is still O(keyspace); hot write paths should bump a generation instead.
+        """
         if not self.redis:
             return 0
 
+        if self.local is not None:
+            self.local.delete_pattern(pattern)
+            self._publish_invalidation("pattern", pattern)
+
         try:
-            keys = self.redis.keys(pattern)
-            if keys:
-                return self.redis.delete(*keys)
-            return 0
+            deleted = 0
+            batch = []
+            for key in self.redis.scan_iter(match=pattern, count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    deleted += self.redis.delete(*batch)
+                    batch = []
+            if batch:
+                deleted += self.redis.delete(*batch)
+            return deleted
         except Exception as e:
             print(f"Cache delete pattern error: {e}")
             return 0
 
+    @staticmethod
+    def _generation_key(tag: str) -> str:
+        return f"gen:{tag}"
+
+    @staticmethod
+    def _generation_seed() -> int:
+        # Seed from the clock so counters never go backwards across restarts or
+        # Redis flushes; versions derived from them (e.g. in keys) stay unique.
+        return int(time.time() * 1000)
+
+    def get_generation(self, tag: str) -> int:
+        """
+        Current generation for an invalidation tag.
+
+        Cache keys embed the generations of the tags they depend on, so bumping
+        a tag invalidates every dependent entry in O(1) without touching them;
+        orphaned entries simply age out via their TTL.
+        """
+        key = self._generation_key(tag)
+        if not self.redis:
+            return self._local_generations.setdefault(tag, self._generation_seed())
+
+        if self.local is not None:
+            value = self.local.get(key)
+            if value is not _MISSING:
+                return value
+
+        try:
+            value = self.redis.get(key)
+            if value is None:
+                self.redis.set(key, self._generation_seed(), nx=True)
+                value = self.redis.get(key)
+            generation = int(value)
+            if self.local is not None:
+                self.local.set(key, generation)
+            return generation
+        except Exception as e:
+            print(f"Cache generation error: {e}")
+            return 0
+
+    def bump_generation(self, *tags: str) -> None:
+        """Invalidate everything keyed on the given tags."""
+        for tag in tags:
+            key = self._generation_key(tag)
+            if not self.redis:
+                current = self._local_generations.get(tag, self._generation_seed())
+                self._local_generations[tag] = max(current + 1, self._generation_seed())
+                continue
+
+            if self.local is not None:
+                self.local.delete(key)
+                self._publish_invalidation("delete", key)
+            try:
+                if not self.redis.set(key, self._generation_seed(), nx=True):
+                    self.redis.incr(key)
+            except Exception as e:
+                print(f"Cache generation bump error: {e}")
+
+    def get_or_set(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: int = 300,
+        stale_key: Optional[str] = None,
+    ) -> Any:
+        """
+        Return the cached value for ``key`` or compute it with single-flight.
+
+        On a miss only one caller recomputes: concurrent threads in this process
+        wait for the leader's result, and other workers wait on a short Redis
+        lock and then read the freshly cached value. If ``stale_key`` is given
+        and CACHE_STALE_TTL > 0, the last computed value is also kept there and
+        served to waiters instead of blocking (stale-while-revalidate).
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            stale = self._get_stale(stale_key)
+            if stale is not None:
+                return stale
+            if flight.done.wait(settings.CACHE_LOCK_TIMEOUT) and flight.error is None:
+                self._flight_stats["coalesced"] += 1
+                return flight.value
+            # Leader failed or is stuck; don't pile onto it
+            return loader()
+
+        self._flight_stats["leaders"] += 1
+        try:
+            flight.value = self._load_with_lock(key, loader, ttl, stale_key)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            flight.done.set()
+            with self._flights_lock:
+                self._flights.pop(key, None)
+
+    def _get_stale(self, stale_key: Optional[str]) -> Optional[Any]:
+        """Last known value for stale-while-revalidate, if enabled."""
+        if not stale_key or settings.CACHE_STALE_TTL <= 0:
+            return None
+        stale = self.get(stale_key)
+        if stale is not None:
+            self._flight_stats["stale_served"] += 1
+        return stale
+
+    def _load_with_lock(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: int,
+        stale_key: Optional[str],
+    ) -> Any:
+        """Recompute a key while holding a cross-worker Redis lock."""
+        if not self.redis:
+            return loader()
+
+        lock_key = f"lock:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.redis.set(
+                lock_key, token, nx=True, px=int(settings.CACHE_LOCK_TIMEOUT * 1000)
+            )
+        except Exception as e:
+            print(f"Cache lock error: {e}")
+            acquired = True
+
+        if not acquired:
+            stale = self._get_stale(stale_key)
+            if stale is not None:
+                return stale
+            # Another worker is recomputing; wait for it to publish the value
+            deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = self.get(key)
+                if value is not None:
+                    self._flight_stats["coalesced"] += 1
+                    return value
+            return loader()
+
+        try:
+            value = loader()
+            self.set(key, value, ttl)
+            if stale_key and settings.CACHE_STALE_TTL > 0:
+                self.set(stale_key, value, ttl + settings.CACHE_STALE_TTL)
+            return value
+        finally:
+            try:
+                self.redis.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+            except Exception as e:
+                print(f"Cache unlock error: {e}")
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """Async version of get()."""
+        if not self.aredis:
+            return None
+
+        value = self._local_lookup(key)
+        if value is not _MISSING:
+            return value
+
+        try:
+            return self._decode(key, await self.aredis.get(key))
+        except Exception as e:
+            print(f"Cache get error: {e}")
+            return None
+
+    async def aset(self, key: str, value: Any, ttl: int = 300) -> bool:
+        """Async version of set()."""
+        if not self.aredis:
+            return False
+
+        try:
+            serialized = self.codec.encode(value)
+            stored = bool(await self.aredis.setex(key, ttl, serialized))
+            if stored and self.local is not None:
+                self.local.set(key, value, ttl)
+            return stored
+        except Exception as e:
+            print(f"Cache set error: {e}")
+            return False
+
+    async def aget_bytes(self, key: str) -> Optional[bytes]:
+        """
+        Get an opaque byte string (e.g. an encoded HTTP response body).
+        
+        Bytes bypass the codec entirely, so a hit costs one lookup and no decoding.
+        """
+        if not self.aredis:
+            return None
+
+        value = self._local_lookup(key)
+        if value is not _MISSING:
+            return value
+
+        try:
+            raw = await self.aredis.get(key)
+        except Exception as e:
+            print(f"Cache get error: {e}")
+            return None
+        if not raw:
+            self._stats["redis"]["misses"] += 1
+            return None
+        self._stats["redis"]["hits"] += 1
+        if self.local is not None:
+            self.local.set(key, raw)
+        return raw
+
+    async def aset_bytes(self, key: str, value: bytes, ttl: int = 300) -> bool:
+        """Store an opaque byte string as-is (see aget_bytes)."""
+        if not self.aredis:
+            return False
+
+        try:
+            stored = bool(await self.aredis.setex(key, ttl, value))
+            if stored and self.local is not None:
+                self.local.set(key, value, ttl)
+            return stored
+        except Exception as e:
+            print(f"Cache set error: {e}")
+            return False
+
+    async def adelete(self, key: str) -> bool:
+        """Async version of delete()."""
+        if not self.aredis:
+            return False
+
+        try:
+            if self.local is not None:
+                self.local.delete(key)
+                await self.aredis.publish(
+                    INVALIDATION_CHANNEL,
+                    json.dumps({"src": self._instance_id, "op": "delete", "key": key})
+                )
+            return bool(await self.aredis.delete(key))
+        except Exception as e:
+            print(f"Cache delete error: {e}")
+            return False
+
+    async def aget_generation(self, tag: str) -> int:
+        """Async version of get_generation()."""
+        return (await self._aget_generation(tag))[0]
+
+    async def aget_shared_generation(self, tag: str) -> Optional[int]:
+        """
+        Generation as stored in Redis, or None when it is process-local (no
+        Redis) or a fallback after a Redis error. Other workers may never see
+        bumps to those, so they must not be handed out, e.g. in ETags.
+        """
+        generation, shared = await self._aget_generation(tag)
+        return generation if shared else None
+
+    async def _aget_generation(self, tag: str) -> Tuple[int, bool]:
+        """(generation, whether it came from Redis)."""
+        key = self._generation_key(tag)
+        if not self.aredis:
+            return self._local_generations.setdefault(tag, self._generation_seed()), False
+
+        value = self.local.get(key) if self.local is not None else _MISSING
+        if value is not _MISSING:
+            return value, True
+
+        try:
+            value = await self.aredis.get(key)
+            if value is None:
+                await self.aredis.set(key, self._generation_seed(), nx=True)
+                value = await self.aredis.get(key)
+            generation = int(value)
+            if self.local is not None:
+                self.local.set(key, generation)
+            return generation, True
+        except Exception as e:
+            print(f"Cache generation error: {e}")
+            return 0, False
+
+    async def aget_or_set(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: int = 300,
+        stale_key: Optional[str] = None,
+    ) -> Any:
+        """
+        Async version of get_or_set(). ``loader`` may be sync or async.
+
+        Concurrent coroutines in this worker await the leader's future instead
+        of taking a thread lock.
+        """
+        value = await self.aget(key)
+        if value is not None:
+            return value
+
+        flight = self._async_flights.get(key)
+        if flight is not None:
+            stale = await self._aget_stale(stale_key)
+            if stale is not None:
+                return stale
+            try:
+                value = await asyncio.wait_for(
+                    asyncio.shield(flight), settings.CACHE_LOCK_TIMEOUT
+                )
+                self._flight_stats["coalesced"] += 1
+                return value
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise  # This waiter was cancelled, not the leader
+                # Leader was cancelled: start over (joining a new leader or leading)
+                return await self.aget_or_set(key, loader, ttl, stale_key)
+            except Exception:
+                # Leader failed or is stuck; don't pile onto it
+                return await self._acall(loader)
+
+        flight = asyncio.get_running_loop().create_future()
+        self._async_flights[key] = flight
+        self._flight_stats["leaders"] += 1
+        try:
+            value = await self._aload_with_lock(key, loader, ttl, stale_key)
+            flight.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            # Waiters retry rather than inherit the leader's cancellation
+            flight.cancel()
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            # Mark retrieved so a failure nobody waited on is not logged
+            flight.exception()
+            raise
+        finally:
+            self._async_flights.pop(key, None)
+
+    @staticmethod
+    async def _acall(loader: Callable[[], Any]) -> Any:
+        result = loader()
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def _aget_stale(self, stale_key: Optional[str]) -> Optional[Any]:
+        """Async version of _get_stale()."""
+        if not stale_key or settings.CACHE_STALE_TTL <= 0:
+            return None
+        stale = await self.aget(stale_key)
+        if stale is not None:
+            self._flight_stats["stale_served"] += 1
+        return stale
+
+    async def _aload_with_lock(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: int,
+        stale_key: Optional[str],
+    ) -> Any:
+        """Async version of _load_with_lock()."""
+        if not self.aredis:
+            return await self._acall(loader)
+
+        lock_key = f"lock:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self.aredis.set(
+                lock_key, token, nx=True, px=int(settings.CACHE_LOCK_TIMEOUT * 1000)
+            )
+        except Exception as e:
+            print(f"Cache lock error: {e}")
+            acquired = True
+
+        if not acquired:
+            stale = await self._aget_stale(stale_key)
+            if stale is not None:
+                return stale
+            deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                value = await self.aget(key)
+                if value is not None:
+                    self._flight_stats["coalesced"] += 1
+                    return value
+            return await self._acall(loader)
+
+        try:
+            value = await self._acall(loader)
+            await self.aset(key, value, ttl)
+            if stale_key and settings.CACHE_STALE_TTL > 0:
+                await self.aset(stale_key, value, ttl + settings.CACHE_STALE_TTL)
+            return value
+        finally:
+            try:
+                await self.aredis.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+            except Exception as e:
+                print(f"Cache unlock error: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters per tier, for tuning the local tier size and TTL."""
+        stats: Dict[str, Any] = {}
+        for tier, counters in self._stats.items():
+            lookups = counters["hits"] + counters["misses"]
+            stats[tier] = {
+                **counters,
+                "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else None,
+            }
+        stats["local"]["enabled"] = self.local is not None
+        stats["local"]["size"] = len(self.local) if self.local is not None else 0
+        stats["redis"]["enabled"] = self.redis is not None
+        stats["single_flight"] = dict(self._flight_stats)
+        return stats
+
+    async def close(self) -> None:
+        """Release pooled async connections (call on application shutdown)."""
+        if self.aredis is not None:
+            await self.aredis.aclose()
+
     def is_available(self) -> bool:
         """Check if Redis is available."""
         if not self.redis:
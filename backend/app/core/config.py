@@ -28,6 +28,22 @@ class Settings(BaseSettings):
     # Cache Settings
     REDIS_URL: str = "redis://localhost:6379/0"
     CACHE_TTL: int = 300  # 5 minutes default
+    CACHE_SERIALIZER: str = "msgpack"  # msgpack or json (falls back to json if not installed)
+    CACHE_COMPRESSION: str = "none"  # none, zlib, zstd or lz4
+    CACHE_COMPRESS_MIN_BYTES: int = 2048  # Only compress values at least this large
+    REDIS_MAX_CONNECTIONS: int = 50  # Async connection pool size per worker
+    LOCAL_CACHE_SIZE: int = 10000  # Entries in the in-process tier (0 disables it)
+    LOCAL_CACHE_TTL: int = 30  # Upper bound on staleness of in-process entries
+    CACHE_LOCK_TIMEOUT: float = 5.0  # Max seconds to wait on another worker's recompute
+    CACHE_STALE_TTL: int = 0  # Serve last value this long while recomputing (0 disables)
+    RESPONSE_CACHE_TTL: int = 300  # Encoded list responses; keyed by catalog version
+    COUNT_ESTIMATE_THRESHOLD: int = 50000  # Use planner estimates above this many rows
+    
+    # Search Settings
+    SEARCH_HISTORY_LIMIT: int = 50  # Recent searches kept per user
+    SEARCH_HISTORY_FLUSH_INTERVAL: float = 2.0  # Seconds between background history writes
+    SEARCH_CACHE_TTL: int = 120  # Cached /search/advanced results; keyed by catalog version
+    AUTOCOMPLETE_CACHE_TTL: int = 300  # Cached /search/autocomplete suggestions
     
     # Security Settings
     SECRET_KEY: str = "your-secret-key-change-in-production-must-be-at-least-32-characters-long"
@@ -36,6 +52,31 @@ class Settings(BaseSettings):
     
     # AI Settings
     GEMINI_API_KEY: str = ""  # Optional: Set for AI-powered search
+    SEMANTIC_EMBEDDING_MODEL: str = ""  # sentence-transformers model; empty uses the hashing embedder
+    SEMANTIC_HASH_DIMENSIONS: int = 512  # Hashing embedder width; 4 bytes per code per dimension
+    AI_RERANK_CANDIDATES: int = 30  # Semantic candidates the LLM re-ranks per query
+    AI_MAX_CONCURRENCY: int = 4  # LLM calls in flight per worker; more wait their turn
+    AI_TIMEOUT: float = 15.0  # Seconds an LLM call may take, including the wait for a slot
+    AI_CACHE_TTL: int = 86400  # Cached LLM responses; keyed by catalog version and model
+    AI_CACHE_SIMILARITY: float = 0.0  # Query cosine similarity that counts as a near-duplicate (0 disables)
+    AI_CACHE_LOCAL_SIZE: int = 1000  # In-process entries used when Redis is unavailable
+    AI_BATCH_WINDOW: float = 0.02  # Seconds concurrent AI prompts wait to share one call (0 disables)
+    AI_BATCH_MAX_SIZE: int = 8  # Prompts per batched call; a full batch is sent at once
+    
+    # Webhook Delivery Settings
+    WEBHOOK_WORKER_PROCESSES: int = 2  # Worker processes started by `python -m app.services.webhook_worker`
+    WEBHOOK_WORKER_CONCURRENCY: int = 16  # Deliveries in flight per worker process
+    WEBHOOK_POLL_INTERVAL: float = 1.0  # Seconds an idle worker waits before looking for due events
+    WEBHOOK_LEASE_SECONDS: int = 360  # A claimed event is retried if not settled by then (> max timeout)
+    WEBHOOK_RETRY_MAX_DELAY: int = 3600  # Cap on the exponential retry backoff, in seconds
+    WEBHOOK_EMBEDDED_WORKER: bool = True  # Drain the outbox inside each API process; False when dedicated workers run
+    
+    # Outgoing HTTP (shared pooled client, one per process)
+    HTTP_CLIENT_HTTP2: bool = True  # Used when the optional h2 package is installed
+    HTTP_CLIENT_MAX_CONNECTIONS: int = 100  # Open connections across all hosts
+    HTTP_CLIENT_MAX_KEEPALIVE: int = 50  # Idle connections kept for reuse
+    HTTP_CLIENT_KEEPALIVE_EXPIRY: float = 30.0  # Seconds an idle connection is kept
+    HTTP_CLIENT_MAX_PER_HOST: int = 10  # Requests in flight to any one host
     
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -12,6 +12,8 @@ from app.models.user import User
 from app.schemas.user import TokenData
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
+# Same scheme without the automatic 401, for endpoints that also serve anonymous callers
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login", auto_error=False)
 
 
 async def get_current_user(
@@ -67,7 +69,7 @@ async def get_current_superuser(
 
 
 async def get_optional_current_user(
-    token: Optional[str] = Depends(oauth2_scheme),
+    token: Optional[str] = Depends(optional_oauth2_scheme),
     db: Session = Depends(get_db)
 ) -> Optional[User]:
     """Get current user if authenticated, otherwise None."""
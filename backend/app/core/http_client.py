@@ -0,0 +1,112 @@
+"""
+Shared outgoing HTTP client.
+
+Webhook deliveries used to open a new httpx.AsyncClient per attempt, paying
+a TCP (and TLS) handshake every time. One long-lived client per process
+keeps connections alive between deliveries: HTTP/2 when the optional `h2`
+package is installed (requests to a host are multiplexed over one
+connection), pooled keep-alive HTTP/1.1 otherwise.
+
+httpx limits the pool as a whole; host_slot() additionally caps the
+requests in flight to any one host, so a burst of events for one receiver
+cannot take every connection.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Set
+
+import httpx
+
+from app.core.config import settings
+
+try:
+    import h2
+except ImportError:  # pragma: no cover - optional dependency
+    h2 = None
+
+
+class HTTPClientManager:
+    """Owns the process's pooled AsyncClient (one per event loop)."""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        # Closes of clients left behind by a previous loop
+        self._closing: Set[asyncio.Task] = set()
+
+    @property
+    def http2(self) -> bool:
+        return settings.HTTP_CLIENT_HTTP2 and h2 is not None
+
+    def _create(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE,
+                keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(30.0, connect=10.0),
+        )
+
+    def get(self) -> httpx.AsyncClient:
+        """
+        The shared client, created on first use.
+
+        Connections belong to the event loop they were opened on, so a
+        different loop (a worker process, a test) gets a client of its own
+        and the previous one is closed.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._discard(self._client, self._loop)
+            self._client = self._create()
+            self._loop = loop
+            self._host_slots = {}
+        return self._client
+
+    def _discard(self, client: Optional[httpx.AsyncClient], loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """Close a client replaced by get(), on its own loop if that is still running."""
+        if client is None or client.is_closed:
+            return
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._aclose_quietly(client), loop)
+        else:
+            task = asyncio.get_running_loop().create_task(self._aclose_quietly(client))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _aclose_quietly(client: httpx.AsyncClient) -> None:
+        try:
+            await client.aclose()
+        except Exception:
+            # Connections opened on a loop that has since closed cannot shut down cleanly
+            pass
+
+    async def start(self) -> httpx.AsyncClient:
+        return self.get()
+
+    async def close(self) -> None:
+        client, self._client = self._client, None
+        self._loop = None
+        self._host_slots = {}
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+    @asynccontextmanager
+    async def host_slot(self, url: str):
+        """Hold one of the HTTP_CLIENT_MAX_PER_HOST request slots of the url's host."""
+        self.get()
+        parsed = httpx.URL(url)
+        key = f"{parsed.scheme}://{parsed.host}:{parsed.port}"
+        slot = self._host_slots.get(key)
+        if slot is None:
+            slot = self._host_slots[key] = asyncio.Semaphore(settings.HTTP_CLIENT_MAX_PER_HOST)
+        async with slot:
+            yield
+
+
+# Global HTTP client manager instance
+http_client = HTTPClientManager()
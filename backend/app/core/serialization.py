@@ -0,0 +1,137 @@
+"""
+Pluggable value encodings for the cache.
+
+Every encoded value starts with a 3-byte header (magic, serializer id,
+compression id) so entries written with different settings - or by older
+releases that stored plain JSON text - can always be decoded.
+"""
+import json
+import zlib
+from typing import Any, Dict, Optional, Union
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - optional dependency
+    lz4_frame = None
+
+# 0xCA is never the first byte of UTF-8 JSON text, so legacy entries are unambiguous
+MAGIC = b"\xca"
+
+SERIALIZER_IDS = {"json": b"j", "msgpack": b"m"}
+COMPRESSION_IDS = {"none": b"-", "zlib": b"z", "zstd": b"s", "lz4": b"l"}
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def _msgpack_dumps(value: Any) -> bytes:
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _msgpack_loads(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False)
+
+
+def _compress(name: str, data: bytes) -> bytes:
+    if name == "zlib":
+        return zlib.compress(data, 1)
+    if name == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if name == "lz4":
+        return lz4_frame.compress(data)
+    return data
+
+
+def _decompress(name: str, data: bytes) -> bytes:
+    if name == "zlib":
+        return zlib.decompress(data)
+    if name == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    if name == "lz4":
+        return lz4_frame.decompress(data)
+    return data
+
+
+def available_serializers() -> Dict[str, bool]:
+    """Which serializers can be used in this environment."""
+    return {"json": True, "msgpack": msgpack is not None}
+
+
+def available_compressions() -> Dict[str, bool]:
+    """Which compression codecs can be used in this environment."""
+    return {
+        "none": True,
+        "zlib": True,
+        "zstd": zstandard is not None,
+        "lz4": lz4_frame is not None,
+    }
+
+
+class CacheCodec:
+    """Encodes cache values with a chosen serializer and optional compression."""
+
+    def __init__(self, serializer: str = "json", compression: str = "none", compress_min_bytes: int = 1024):
+        if serializer not in SERIALIZER_IDS:
+            raise ValueError(f"Unknown cache serializer: {serializer}")
+        if compression not in COMPRESSION_IDS:
+            raise ValueError(f"Unknown cache compression: {compression}")
+        if not available_serializers()[serializer]:
+            print(f"Cache serializer '{serializer}' not installed. Falling back to json.")
+            serializer = "json"
+        if not available_compressions()[compression]:
+            print(f"Cache compression '{compression}' not installed. Compression disabled.")
+            compression = "none"
+
+        self.serializer = serializer
+        self.compression = compression
+        self.compress_min_bytes = compress_min_bytes
+        self._dumps = _msgpack_dumps if serializer == "msgpack" else _json_dumps
+
+    @classmethod
+    def from_settings(cls, settings) -> "CacheCodec":
+        return cls(
+            serializer=settings.CACHE_SERIALIZER,
+            compression=settings.CACHE_COMPRESSION,
+            compress_min_bytes=settings.CACHE_COMPRESS_MIN_BYTES,
+        )
+
+    def encode(self, value: Any) -> bytes:
+        """Serialize (and compress, if large enough) a value."""
+        payload = self._dumps(value)
+        compression = "none"
+        if self.compression != "none" and len(payload) >= self.compress_min_bytes:
+            payload = _compress(self.compression, payload)
+            compression = self.compression
+        return MAGIC + SERIALIZER_IDS[self.serializer] + COMPRESSION_IDS[compression] + payload
+
+    def decode(self, data: Union[bytes, str]) -> Optional[Any]:
+        """Decode a value written by any codec configuration (or legacy JSON text)."""
+        if isinstance(data, str):
+            data = data.encode()
+        if not data.startswith(MAGIC):
+            return json.loads(data)
+
+        serializer = _lookup(SERIALIZER_IDS, data[1:2])
+        compression = _lookup(COMPRESSION_IDS, data[2:3])
+        payload = _decompress(compression, data[3:])
+        if serializer == "msgpack":
+            return _msgpack_loads(payload)
+        return json.loads(payload)
+
+
+def _lookup(ids: Dict[str, bytes], tag: bytes) -> str:
+    for name, value in ids.items():
+        if value == tag:
+            return name
+    raise ValueError(f"Unknown cache encoding tag: {tag!r}")
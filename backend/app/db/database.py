@@ -2,7 +2,7 @@
 Database connection and session management.
 """
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 from app.core.config import settings
 
 # Create database engine with optimized connection pooling
@@ -36,6 +36,11 @@ def get_db():
         db.close()
 
 
+def is_postgresql(db: Session) -> bool:
+    """Whether the session is bound to PostgreSQL (tsvector, pg_trgm, EXPLAIN, ...)."""
+    return db.get_bind().dialect.name == "postgresql"
+
+
 def create_db_and_tables():
     """Create database tables."""
     Base.metadata.create_all(bind=engine)
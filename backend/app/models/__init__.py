@@ -1,9 +1,13 @@
 """Database models."""
 from app.models.user import User
 from app.models.diagnostic_code import DiagnosticCode
+from app.models.code_change import CodeChange
 from app.models.code_version import CodeVersion
 from app.models.audit_log import AuditLog
 from app.models.organization import Organization
 from app.models.notification import Notification
+from app.models.user_favorite import UserFavorite
 
-__all__ = ["User", "DiagnosticCode", "CodeVersion", "AuditLog", "Organization", "Notification"]
+__all__ = [
+    "User", "DiagnosticCode", "CodeChange", "CodeVersion", "AuditLog", "Organization", "Notification", "UserFavorite"
+]
@@ -0,0 +1,198 @@
+"""
+Change log for diagnostic codes, used for delta sync.
+"""
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, Index, and_, event, func, inspect, or_, text
+from sqlalchemy.orm import Session, object_session
+from app.db.database import Base, is_postgresql
+from app.models.diagnostic_code import DiagnosticCode
+
+# Position in the change log: (writing transaction id, change id)
+Cursor = Tuple[int, int]
+START: Cursor = (0, 0)
+
+
+class CodeChange(Base):
+    """
+    One row per insert, update or delete of a diagnostic code.
+
+    Readers (delta-sync clients, in-process indexes) remember the cursor of
+    the last change they applied and ask for everything after it. Ids are
+    assigned at insert, not at commit, so on PostgreSQL change N+1 can become
+    visible before change N; resuming after N+1 would lose N for good. Each
+    row therefore records its writing transaction (txid_current()), changes
+    are read in (txid, id) order, and only once every transaction up to
+    theirs has finished (see changes_after). Deletes leave a row behind (a
+    tombstone), so no foreign key to diagnostic_codes.
+    """
+
+    __tablename__ = "code_changes"
+    __table_args__ = (
+        Index("idx_code_changes_org_cursor", "organization_id", "txid", "id"),
+    )
+
+    UPSERT = "upsert"
+    DELETE = "delete"
+
+    id = Column(Integer, primary_key=True)
+    # Writing transaction on PostgreSQL; 0 elsewhere (SQLite commits writers in id order)
+    txid = Column(BigInteger, nullable=False, default=0, server_default="0")
+    organization_id = Column(Integer, nullable=False)
+    diagnostic_code_id = Column(Integer, nullable=False)
+    operation = Column(String(10), nullable=False)  # upsert, delete
+    changed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    @property
+    def cursor(self) -> Cursor:
+        return (self.txid, self.id)
+
+    def __repr__(self):
+        return f"<CodeChange(id={self.id}, code_id={self.diagnostic_code_id}, operation='{self.operation}')>"
+
+
+def format_cursor(cursor: Cursor) -> str:
+    """Opaque change token handed to clients ("0" = from the beginning)."""
+    return "0" if cursor == START else f"{cursor[0]}:{cursor[1]}"
+
+
+def parse_cursor(token: str) -> Cursor:
+    """
+    Inverse of format_cursor; raises ValueError for malformed tokens.
+
+    A bare change id (the token format before txids were recorded) resumes
+    among the rows logged back then, which all have txid 0.
+    """
+    txid, separator, change_id = token.rpartition(":")
+    try:
+        cursor = (int(txid) if separator else 0, int(change_id))
+    except ValueError:
+        raise ValueError(f"Invalid change token: {token!r}") from None
+    if min(cursor) < 0:
+        raise ValueError(f"Invalid change token: {token!r}")
+    return cursor
+
+
+def _writer_txid(connection):
+    return func.txid_current() if connection.dialect.name == "postgresql" else 0
+
+
+def _settled_txid(db: Session) -> Optional[int]:
+    """
+    Transaction id below which every transaction has committed or rolled back.
+
+    None where no bound is needed: SQLite holds its write lock from a
+    transaction's first write to its commit, so changes commit in id order.
+    """
+    if not is_postgresql(db):
+        return None
+    return db.execute(text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar()
+
+
+def latest_change_cursor(db: Session, organization_id: Optional[int] = None) -> Cursor:
+    """Cursor of the last settled change (None = all organizations)."""
+    query = db.query(CodeChange.txid, CodeChange.id)
+    if organization_id is not None:
+        query = query.filter(CodeChange.organization_id == organization_id)
+    bound = _settled_txid(db)
+    if bound is not None:
+        query = query.filter(CodeChange.txid < bound)
+    row = query.order_by(CodeChange.txid.desc(), CodeChange.id.desc()).first()
+    return (row[0], row[1]) if row else START
+
+
+def changes_after(
+    db: Session, organization_id: Optional[int], cursor: Cursor, limit: int
+) -> Tuple[List[CodeChange], bool]:
+    """
+    Up to `limit` settled changes after cursor, in cursor order.
+
+    Nothing can later appear before a change returned here, so resuming
+    from the last one never skips a change. Also returns whether committed
+    changes are held back behind a transaction that is still running (they
+    are returned once it finishes).
+    """
+    query = db.query(CodeChange).filter(
+        or_(
+            CodeChange.txid > cursor[0],
+            and_(CodeChange.txid == cursor[0], CodeChange.id > cursor[1]),
+        )
+    )
+    if organization_id is not None:
+        query = query.filter(CodeChange.organization_id == organization_id)
+    bound = _settled_txid(db)
+    if bound is None:
+        return query.order_by(CodeChange.txid, CodeChange.id).limit(limit).all(), False
+
+    changes = query.filter(CodeChange.txid < bound).order_by(CodeChange.txid, CodeChange.id).limit(limit).all()
+    held_back = len(changes) < limit and db.query(query.filter(CodeChange.txid >= bound).exists()).scalar()
+    return changes, bool(held_back)
+
+
+# Session.info key: organizations whose codes the session's transaction wrote.
+# Committing the transaction invalidates their catalogs (see
+# app.services.diagnostic_code_service), whichever code path did the write.
+CATALOG_WRITES = "catalog_writes"
+
+
+def mark_catalog_written(session, *organization_ids) -> None:
+    if session is not None:
+        session.info.setdefault(CATALOG_WRITES, set()).update(organization_ids)
+
+
+def _record_change(connection, target: DiagnosticCode, operation: str) -> None:
+    mark_catalog_written(object_session(target), target.organization_id)
+    connection.execute(
+        CodeChange.__table__.insert().values(
+            txid=_writer_txid(connection),
+            organization_id=target.organization_id,
+            diagnostic_code_id=target.id,
+            operation=operation,
+            changed_at=datetime.utcnow(),
+        )
+    )
+
+
+# Recorded inside the flush, so a change row commits or rolls back with the write.
+# Query-level bulk statements bypass these hooks; see record_bulk_changes().
+
+@event.listens_for(DiagnosticCode, "after_insert")
+def _code_inserted(mapper, connection, target):
+    _record_change(connection, target, CodeChange.UPSERT)
+
+
+@event.listens_for(DiagnosticCode, "after_update")
+def _code_updated(mapper, connection, target):
+    # after_update also fires for objects that were dirty without net changes
+    state = inspect(target)
+    if any(state.attrs[column.key].history.has_changes() for column in mapper.column_attrs):
+        _record_change(connection, target, CodeChange.UPSERT)
+
+
+@event.listens_for(DiagnosticCode, "after_delete")
+def _code_deleted(mapper, connection, target):
+    _record_change(connection, target, CodeChange.DELETE)
+
+
+def record_bulk_changes(session, code_query, operation: str) -> None:
+    """
+    Log changes for codes written with bulk statements (which skip ORM events).
+
+    code_query selects the affected DiagnosticCode rows; call it before a bulk
+    delete and after a bulk insert.
+    """
+    now = datetime.utcnow()
+    changes = [
+        {
+            "organization_id": organization_id,
+            "diagnostic_code_id": code_id,
+            "operation": operation,
+            "changed_at": now,
+        }
+        for organization_id, code_id in code_query.with_entities(
+            DiagnosticCode.organization_id, DiagnosticCode.id
+        ).order_by(DiagnosticCode.id)
+    ]
+    if changes:
+        session.execute(CodeChange.__table__.insert().values(txid=_writer_txid(session.connection())), changes)
+        mark_catalog_written(session, *{change["organization_id"] for change in changes})
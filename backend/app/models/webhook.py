@@ -2,7 +2,7 @@
 Webhook model for external integrations.
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, JSON, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.db.database import Base
 
@@ -76,3 +76,43 @@ class WebhookDelivery(Base):
     
     def __repr__(self):
         return f"<WebhookDelivery(id={self.id}, webhook_id={self.webhook_id}, event={self.event_type}, success={self.is_success})>"
+
+
+class WebhookOutbox(Base):
+    """
+    Webhook events waiting to be delivered (transactional outbox).
+
+    Rows are added in the same transaction as the change that raised the
+    event, so an event is queued if and only if the change committed. The
+    webhook worker (app.services.webhook_worker) drains the table: per
+    webhook, only the oldest queued row is eligible, which keeps deliveries
+    to one endpoint in order. Delivered rows are deleted; rows that ran out
+    of attempts stay behind with status "failed".
+    """
+
+    __tablename__ = "webhook_outbox"
+    __table_args__ = (
+        # Head of each webhook's queue: WHERE status IN (...) GROUP BY webhook_id, min(id)
+        Index("idx_webhook_outbox_status_webhook", "status", "webhook_id", "id"),
+    )
+
+    PENDING = "pending"
+    PROCESSING = "processing"
+    FAILED = "failed"
+
+    id = Column(Integer, primary_key=True)
+    webhook_id = Column(Integer, ForeignKey("webhooks.id", ondelete="CASCADE"), nullable=False)
+    event_type = Column(String(50), nullable=False)
+    payload = Column(JSON, nullable=False)
+
+    # Delivery schedule
+    status = Column(String(20), default=PENDING, nullable=False)  # pending, processing, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = Column(DateTime, nullable=True)  # Lease of the worker delivering the row
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<WebhookOutbox(id={self.id}, webhook_id={self.webhook_id}, event={self.event_type}, status={self.status})>"
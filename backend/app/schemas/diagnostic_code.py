@@ -46,7 +46,34 @@ class DiagnosticCodeResponse(DiagnosticCodeBase):
 class DiagnosticCodeList(BaseModel):
     """Schema for list of Diagnostic Codes."""
     
-    total: int
+    total: Optional[int] = Field(
+        None, description="Total matching codes; null when include_total=false"
+    )
+    total_is_estimate: bool = Field(
+        False, description="Whether total is a planner estimate rather than an exact count"
+    )
     items: List[DiagnosticCodeResponse]
     skip: int
     limit: int
+    next_cursor: Optional[str] = Field(
+        None, description="Opaque cursor for the next page (pass as `after`)"
+    )
+
+
+class DiagnosticCodeChange(BaseModel):
+    """A single entry in the delta-sync feed."""
+    
+    sequence: int = Field(..., description="Change sequence number")
+    operation: str = Field(..., description="upsert or delete")
+    id: int = Field(..., description="Diagnostic code id")
+    code: Optional[DiagnosticCodeResponse] = Field(
+        None, description="Current state of the code; null for deletes (tombstones)"
+    )
+
+
+class DiagnosticCodeChanges(BaseModel):
+    """Schema for a page of the delta-sync feed."""
+    
+    changes: List[DiagnosticCodeChange]
+    next_since: str = Field(..., description="Opaque token; pass as `since` to fetch the following changes")
+    has_more: bool = Field(..., description="Whether more changes are available right away")
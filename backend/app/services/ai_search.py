@@ -1,20 +1,36 @@
 """
 AI-powered diagnostic code search service using Google Gemini.
+
+Candidates come from the local semantic index (app.services.semantic_search),
+which covers the whole catalog; Gemini, when configured, only re-ranks them.
+The Gemini client is blocking, so calls run on a small dedicated thread pool
+and never on the event loop. Under load, concurrent prompts are micro-batched
+into one call per window (see LLMBatcher).
 """
+import asyncio
 import json
 import logging
-from typing import List, Optional, Dict, Any
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Dict, Any, Tuple
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
 
 from app.core.config import settings
 from app.models.diagnostic_code import DiagnosticCode
+from app.services.llm_cache import llm_cache
+from app.services.semantic_search import CONTEXT_HEADER, SemanticIndex, semantic_indexes
 
 logger = logging.getLogger(__name__)
 
 # Initialize Gemini (lazy loading)
 _gemini_model = None
 
+# Bounded pool for blocking LLM calls (lazy loading)
+_llm_executor: Optional[ThreadPoolExecutor] = None
+_llm_executor_lock = threading.Lock()
+
 
 def get_gemini_model():
     """Get or initialize Gemini model."""
@@ -36,10 +52,210 @@ def get_gemini_model():
     return _gemini_model
 
 
+def _get_llm_executor() -> ThreadPoolExecutor:
+    global _llm_executor
+    with _llm_executor_lock:
+        if _llm_executor is None:
+            _llm_executor = ThreadPoolExecutor(
+                max_workers=settings.AI_MAX_CONCURRENCY, thread_name_prefix="llm"
+            )
+        return _llm_executor
+
+
+def shutdown_llm_executor() -> None:
+    """Drop queued LLM calls and release the pool (call on application shutdown)."""
+    global _llm_executor
+    with _llm_executor_lock:
+        if _llm_executor is not None:
+            _llm_executor.shutdown(wait=False, cancel_futures=True)
+            _llm_executor = None
+
+
+async def generate_text(model, prompt: str) -> str:
+    """
+    Run one blocking LLM call on the bounded pool and return its text.
+    
+    The pool size (AI_MAX_CONCURRENCY) caps calls in flight per worker;
+    further calls queue. AI_TIMEOUT covers the queueing and the call: a
+    timed-out or cancelled call is dropped if still queued, and abandoned
+    if already running (the client has no per-call timeout), so the
+    request moves on either way. Raises asyncio.TimeoutError on timeout.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_get_llm_executor(), lambda: model.generate_content(prompt).text)
+    return await asyncio.wait_for(future, timeout=settings.AI_TIMEOUT)
+
+
+class PromptMetrics:
+    """
+    Size and build time of prompts sent to the LLM, per prompt kind.
+    
+    Hooks added with add_hook(fn) are called as fn(kind, chars, build_seconds)
+    for every prompt built, e.g. to forward them to a metrics backend.
+    """
+    
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._hooks: List[Callable[[str, int, float], None]] = []
+    
+    def add_hook(self, hook: Callable[[str, int, float], None]) -> None:
+        self._hooks.append(hook)
+    
+    def remove_hook(self, hook: Callable[[str, int, float], None]) -> None:
+        self._hooks.remove(hook)
+    
+    def record(self, kind: str, prompt: str, build_seconds: float) -> None:
+        stats = self._stats.setdefault(kind, {"prompts": 0, "chars": 0, "build_seconds": 0.0})
+        stats["prompts"] += 1
+        stats["chars"] += len(prompt)
+        stats["build_seconds"] += build_seconds
+        for hook in list(self._hooks):
+            try:
+                hook(kind, len(prompt), build_seconds)
+            except Exception as e:
+                logger.error(f"Prompt metrics hook failed: {e}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Prompt count, average size (chars, ~tokens) and build time per kind."""
+        return {
+            kind: {
+                "prompts": stats["prompts"],
+                "avg_chars": round(stats["chars"] / stats["prompts"]),
+                # ~4 characters per token for English text
+                "avg_tokens_estimate": round(stats["chars"] / stats["prompts"] / 4),
+                "avg_build_ms": round(stats["build_seconds"] / stats["prompts"] * 1000, 3),
+            }
+            for kind, stats in self._stats.items()
+        }
+    
+    def reset(self) -> None:
+        self._stats.clear()
+
+
+# Global prompt metrics instance
+prompt_metrics = PromptMetrics()
+
+
+def _json_object(text: str) -> Dict[str, Any]:
+    """The JSON object in an LLM response (handles extra text around it), or {}."""
+    try:
+        if "{" in text and "}" in text:
+            value = json.loads(text[text.index("{"):text.rindex("}") + 1])
+            if isinstance(value, dict):
+                return value
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse AI batch response: {e}. Response: {text}")
+    return {}
+
+
+class _Batch:
+    """Prompts collected for one LLM call, with the futures of their callers."""
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.items: List[Any] = []
+        self.futures: List["asyncio.Future[str]"] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class LLMBatcher:
+    """
+    Coalesces concurrent prompts of one kind into a single LLM call.
+    
+    The first request for a (model, group) pair opens a batch; requests
+    arriving within AI_BATCH_WINDOW seconds join it, up to AI_BATCH_MAX_SIZE.
+    A batch of one is sent as the usual single prompt (build_single). Larger
+    batches share one multi-query prompt (build_batch), and split() cuts its
+    answer back into one response text per caller, in submission order.
+    """
+    
+    def __init__(
+        self,
+        kind: str,
+        build_single: Callable[[Any], str],
+        build_batch: Callable[[List[Any]], str],
+        split: Callable[[str, int], List[str]],
+    ):
+        self.kind = kind
+        self.build_single = build_single
+        self.build_batch = build_batch
+        self.split = split
+        self._pending: Dict[Any, _Batch] = {}
+        # Running batch calls, referenced so they are not garbage collected
+        self._tasks: set = set()
+    
+    async def submit(self, model, group: Any, item: Any) -> str:
+        """Queue one prompt item and wait for its share of the batched answer."""
+        if settings.AI_BATCH_WINDOW <= 0:
+            return (await self._generate(model, [item]))[0]
+        
+        loop = asyncio.get_running_loop()
+        key = (id(model), group)
+        batch = self._pending.get(key)
+        if batch is None or batch.loop is not loop:
+            batch = self._pending[key] = _Batch(loop)
+            batch.timer = loop.call_later(settings.AI_BATCH_WINDOW, self._flush, key, batch, model)
+        future = loop.create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+        if len(batch.items) >= settings.AI_BATCH_MAX_SIZE:
+            batch.timer.cancel()
+            self._flush(key, batch, model)
+        return await future
+    
+    def _flush(self, key: Any, batch: _Batch, model) -> None:
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+        task = batch.loop.create_task(self._run(model, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, model, batch: _Batch) -> None:
+        try:
+            texts = await self._generate(model, batch.items)
+        except Exception as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # Callers that gave up (cancelled) have done futures; skip them
+        for future, text in zip(batch.futures, texts):
+            if not future.done():
+                future.set_result(text)
+    
+    async def _generate(self, model, items: List[Any]) -> List[str]:
+        start = time.perf_counter()
+        if len(items) == 1:
+            kind, prompt = self.kind, self.build_single(items[0])
+        else:
+            kind, prompt = f"{self.kind}_batch", self.build_batch(items)
+        prompt_metrics.record(kind, prompt, time.perf_counter() - start)
+        text = await generate_text(model, prompt)
+        return [text] if len(items) == 1 else self.split(text, len(items))
+
+
+async def _cached_generate(scope: str, query: str, generate: Callable[[], Awaitable[str]]) -> str:
+    """Answer from the LLM response cache, or call generate() and cache its result."""
+    text = await llm_cache.get(scope, query)
+    if text is None:
+        text = await generate()
+        # Empty answers (e.g. a query missing from a batched reply) are not kept
+        if text:
+            await llm_cache.set(scope, query, text)
+    return text
+
+
+def _retrieve(db: Session, organization_id: Optional[int], query: str, pool: int) -> Tuple[SemanticIndex, List[int]]:
+    """The organization's semantic index and the ids of its `pool` nearest codes."""
+    index = semantic_indexes.get(db, organization_id)
+    return index, [code_id for code_id, _ in index.search(query, pool)]
+
+
 async def ai_search_codes(
     query: str,
-    db: AsyncSession,
-    limit: int = 10
+    db: Session,
+    limit: int = 10,
+    organization_id: Optional[int] = None
 ) -> List[DiagnosticCode]:
     """
     Use AI to search for diagnostic codes based on natural language query.
@@ -48,135 +264,178 @@ async def ai_search_codes(
         query: Natural language search query (e.g., "chest pain radiating to left arm")
         db: Database session
         limit: Maximum number of results to return
+        organization_id: Organization whose catalog is searched (None = all)
     
     Returns:
         List of matching diagnostic codes
     """
     model = get_gemini_model()
     
-    if not model:
-        logger.warning("Gemini not configured, falling back to regular search")
-        return await _fallback_search(query, db, limit)
+    # Retrieve by embedding similarity; the LLM gets a wider pool to re-rank
+    pool = max(limit, settings.AI_RERANK_CANDIDATES) if model else limit
+    # Refreshing the index and scoring the catalog are blocking work: keep them off the event loop
+    index, candidate_ids = await asyncio.to_thread(_retrieve, db, organization_id, query, pool)
+    if not candidate_ids:
+        return _fallback_search(query, db, limit, organization_id)
     
-    try:
-        # Get all available codes from database for context
-        result = await db.execute(
-            select(DiagnosticCode)
-            .where(DiagnosticCode.is_active == True)
-            .limit(200)  # Get sample of codes for AI context
-        )
-        all_codes = result.scalars().all()
-        
-        # Create a structured list of codes for the AI
-        codes_context = [
-            {
-                "code": code.code,
-                "description": code.description,
-                "category": code.category,
-                "subcategory": code.subcategory,
-                "severity": code.severity
-            }
-            for code in all_codes[:100]  # Limit context to avoid token limits
-        ]
-        
-        # Create prompt for Gemini
-        prompt = f"""You are a medical coding assistant. Given the following diagnostic codes database and a search query, identify the most relevant diagnostic codes.
+    if model:
+        try:
+            scope = await llm_cache.scope("rerank", organization_id, model)
+            lines = [index.context[code_id][1] for code_id in candidate_ids if code_id in index.context]
+            response_text = await _cached_generate(
+                scope, query, lambda: rerank_batcher.submit(model, organization_id, (query, lines))
+            )
+            candidate_ids = _rerank(query, index, candidate_ids, response_text)
+        except asyncio.TimeoutError:
+            logger.warning(f"AI re-rank timed out after {settings.AI_TIMEOUT}s")
+        except Exception as e:
+            logger.error(f"AI re-rank error: {e}")
+    
+    # The prompt came from the index; only the codes returned are loaded
+    result_ids = candidate_ids[:limit]
+    rows = {code.id: code for code in db.query(DiagnosticCode).filter(DiagnosticCode.id.in_(result_ids))}
+    return [rows[code_id] for code_id in result_ids if code_id in rows]
 
-Available codes (sample):
-{json.dumps(codes_context, indent=2)}
+
+def _rerank_prompt(item: Tuple[str, List[str]]) -> str:
+    """Prompt asking the LLM to order one query's candidates (one line per code)."""
+    query, lines = item
+    codes_context = "\n".join(lines)
+    return f"""You are a medical coding assistant. Given a search query and candidate diagnostic codes retrieved for it, order the candidates by relevance.
+
+Candidate codes ({CONTEXT_HEADER}):
+{codes_context}
 
 User query: "{query}"
 
-Based on the query, return a JSON array of the most relevant code identifiers (just the code values like "ICD-E11.9", "ICD-I10", etc.) in order of relevance. Return ONLY the JSON array, no other text.
+Return a JSON array of the relevant code identifiers (just the code values like "ICD-E11.9", "ICD-I10", etc.) from the candidates above, most relevant first. Return ONLY the JSON array, no other text.
 
 Example response format: ["ICD-I21.9", "ICD-I25.10", "ICD-I20.0"]
 
-If the query doesn't match any codes well, return an empty array: []
+If no candidate matches the query, return an empty array: []
 """
-        
-        # Get AI response
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # Parse AI response
-        try:
-            # Extract JSON from response (handle cases where AI adds extra text)
-            if "[" in response_text and "]" in response_text:
-                start = response_text.index("[")
-                end = response_text.rindex("]") + 1
-                json_str = response_text[start:end]
-                suggested_codes = json.loads(json_str)
-            else:
-                suggested_codes = []
-            
-            logger.info(f"AI suggested codes: {suggested_codes}")
-            
-            if not suggested_codes:
-                return await _fallback_search(query, db, limit)
-            
-            # Fetch the suggested codes from database
-            result = await db.execute(
-                select(DiagnosticCode)
-                .where(
-                    DiagnosticCode.code.in_(suggested_codes),
-                    DiagnosticCode.is_active == True
-                )
-            )
-            codes = result.scalars().all()
-            
-            # Sort codes by AI suggestion order
-            code_dict = {code.code: code for code in codes}
-            sorted_codes = [code_dict[c] for c in suggested_codes if c in code_dict]
-            
-            # If we got fewer results than expected, supplement with fallback search
-            if len(sorted_codes) < min(limit, 3):
-                fallback_codes = await _fallback_search(query, db, limit)
-                # Add fallback codes that aren't already in results
-                existing_ids = {code.id for code in sorted_codes}
-                for fb_code in fallback_codes:
-                    if fb_code.id not in existing_ids and len(sorted_codes) < limit:
-                        sorted_codes.append(fb_code)
-            
-            return sorted_codes[:limit]
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse AI response: {e}. Response: {response_text}")
-            return await _fallback_search(query, db, limit)
-            
-    except Exception as e:
-        logger.error(f"AI search error: {e}")
-        return await _fallback_search(query, db, limit)
 
 
-async def _fallback_search(
+def _batch_rerank_prompt(items: List[Tuple[str, List[str]]]) -> str:
+    """One prompt re-ranking several queries; candidates they share are listed once."""
+    codes_context = "\n".join(dict.fromkeys(line for _, lines in items for line in lines))
+    queries = "\n".join(f'{number}. "{query}"' for number, (query, _) in enumerate(items, 1))
+    return f"""You are a medical coding assistant. Given several numbered search queries and candidate diagnostic codes retrieved for them, order the relevant candidates for each query.
+
+Candidate codes ({CONTEXT_HEADER}):
+{codes_context}
+
+Queries:
+{queries}
+
+Return a JSON object mapping each query number to a JSON array of the relevant code identifiers (just the code values like "ICD-E11.9") from the candidates above, most relevant first. Return ONLY the JSON object, no other text.
+
+Example response format: {{"1": ["ICD-I21.9", "ICD-I20.0"], "2": []}}
+"""
+
+
+def _split_rerank(text: str, count: int) -> List[str]:
+    """Per-query JSON arrays from a batched re-rank answer ("" where missing)."""
+    answers = _json_object(text)
+    return [
+        json.dumps(answers[str(number)]) if isinstance(answers.get(str(number)), list) else ""
+        for number in range(1, count + 1)
+    ]
+
+
+rerank_batcher = LLMBatcher("rerank", _rerank_prompt, _batch_rerank_prompt, _split_rerank)
+
+
+def _rerank(query: str, index: SemanticIndex, candidate_ids: List[int], response_text: str) -> List[int]:
+    """
+    Order candidate ids as the LLM response lists their codes.
+    
+    Candidates the LLM left out follow in retrieval order, so a partial or
+    unparseable answer degrades to plain semantic ranking.
+    """
+    response_text = response_text.strip()
+    suggested_codes: List[str] = []
+    try:
+        # Extract JSON from response (handle cases where AI adds extra text)
+        if "[" in response_text and "]" in response_text:
+            start = response_text.index("[")
+            end = response_text.rindex("]") + 1
+            suggested_codes = [c for c in json.loads(response_text[start:end]) if isinstance(c, str)]
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse AI response: {e}. Response: {response_text}")
+    
+    logger.info(f"AI ranked codes for {query!r}: {suggested_codes}")
+    
+    # Only retrieved candidates can be returned; invented codes are ignored
+    by_code = {index.context[code_id][0]: code_id for code_id in candidate_ids if code_id in index.context}
+    ranked = list(dict.fromkeys(by_code[c] for c in suggested_codes if c in by_code))
+    ranked_set = set(ranked)
+    return ranked + [code_id for code_id in candidate_ids if code_id not in ranked_set]
+
+
+def _fallback_search(
     query: str,
-    db: AsyncSession,
-    limit: int = 10
+    db: Session,
+    limit: int = 10,
+    organization_id: Optional[int] = None
 ) -> List[DiagnosticCode]:
-    """Fallback to regular fuzzy search if AI is not available."""
+    """Fallback to regular substring search when retrieval finds nothing."""
     search_term = f"%{query}%"
     
-    result = await db.execute(
-        select(DiagnosticCode)
-        .where(
-            or_(
-                DiagnosticCode.code.ilike(search_term),
-                DiagnosticCode.description.ilike(search_term),
-                DiagnosticCode.category.ilike(search_term),
-                DiagnosticCode.subcategory.ilike(search_term)
-            ),
-            DiagnosticCode.is_active == True
-        )
-        .limit(limit)
+    db_query = db.query(DiagnosticCode).filter(
+        or_(
+            DiagnosticCode.code.ilike(search_term),
+            DiagnosticCode.description.ilike(search_term),
+            DiagnosticCode.category.ilike(search_term),
+            DiagnosticCode.subcategory.ilike(search_term)
+        ),
+        DiagnosticCode.is_active == True
     )
+    if organization_id is not None:
+        db_query = db_query.filter(DiagnosticCode.organization_id == organization_id)
     
-    return result.scalars().all()
+    return db_query.limit(limit).all()
+
+
+def _explanation_prompt(item: Tuple[str, str]) -> str:
+    symptoms, code_list = item
+    return f"""Given the symptoms: "{symptoms}"
+And these suggested diagnostic codes: {code_list}
+
+Provide a brief 1-2 sentence explanation of why these codes are relevant. Keep it concise and professional."""
+
+
+def _batch_explanation_prompt(items: List[Tuple[str, str]]) -> str:
+    cases = "\n".join(
+        f'{number}. Symptoms: "{symptoms}". Suggested codes: {code_list}'
+        for number, (symptoms, code_list) in enumerate(items, 1)
+    )
+    return f"""For each numbered case below, provide a brief 1-2 sentence explanation of why the suggested diagnostic codes are relevant to the symptoms. Keep it concise and professional.
+
+{cases}
+
+Return ONLY a JSON object mapping each case number to its explanation, no other text.
+
+Example response format: {{"1": "Explanation for case 1.", "2": "Explanation for case 2."}}"""
+
+
+def _split_explanations(text: str, count: int) -> List[str]:
+    """Per-case explanations from a batched answer ("" where missing)."""
+    answers = _json_object(text)
+    return [
+        answers[str(number)] if isinstance(answers.get(str(number)), str) else ""
+        for number in range(1, count + 1)
+    ]
+
+
+explanation_batcher = LLMBatcher("explain", _explanation_prompt, _batch_explanation_prompt, _split_explanations)
 
 
 async def get_ai_suggestions(
     symptoms: str,
-    db: AsyncSession,
-    limit: int = 5
+    db: Session,
+    limit: int = 5,
+    organization_id: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     Get AI-powered diagnostic code suggestions based on symptoms.
@@ -185,6 +444,7 @@ async def get_ai_suggestions(
         symptoms: Natural language description of symptoms
         db: Database session
         limit: Maximum number of suggestions
+        organization_id: Organization whose catalog is searched (None = all)
     
     Returns:
         Dictionary with suggestions and explanations
@@ -193,24 +453,23 @@ async def get_ai_suggestions(
     
     if not model:
         return {
-            "suggestions": await _fallback_search(symptoms, db, limit),
-            "explanation": "AI suggestions not available. Showing fuzzy search results.",
+            "suggestions": await ai_search_codes(symptoms, db, limit, organization_id),
+            "explanation": "AI suggestions not available. Showing semantic search results.",
             "confidence": "low"
         }
     
     try:
-        codes = await ai_search_codes(symptoms, db, limit)
+        codes = await ai_search_codes(symptoms, db, limit, organization_id)
         
         # Get AI explanation for the suggestions
         if codes:
             code_list = ", ".join([f"{c.code} ({c.description})" for c in codes[:3]])
-            explanation_prompt = f"""Given the symptoms: "{symptoms}"
-And these suggested diagnostic codes: {code_list}
-
-Provide a brief 1-2 sentence explanation of why these codes are relevant. Keep it concise and professional."""
             
-            response = model.generate_content(explanation_prompt)
-            explanation = response.text.strip()
+            # The explanation also depends on which codes it explains
+            scope = await llm_cache.scope("explain", organization_id, model, *(c.code for c in codes[:3]))
+            explanation = (await _cached_generate(
+                scope, symptoms, lambda: explanation_batcher.submit(model, organization_id, (symptoms, code_list))
+            )).strip() or "No explanation available for these suggestions."
         else:
             explanation = "No matching diagnostic codes found for the given symptoms."
         
@@ -223,7 +482,7 @@ Provide a brief 1-2 sentence explanation of why these codes are relevant. Keep i
     except Exception as e:
         logger.error(f"Error getting AI suggestions: {e}")
         return {
-            "suggestions": await _fallback_search(symptoms, db, limit),
+            "suggestions": _fallback_search(symptoms, db, limit, organization_id),
             "explanation": "AI service temporarily unavailable. Showing fuzzy search results.",
             "confidence": "low"
         }
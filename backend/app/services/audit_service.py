@@ -45,7 +45,7 @@ class AuditService:
         # Trigger webhook for audit log created
         await WebhookService.trigger_webhooks(
             db=db,
-            event="audit.logged",
+            event_type="audit.logged",
             payload={
                 "id": log.id,
                 "action": action,
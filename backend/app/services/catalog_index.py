@@ -0,0 +1,330 @@
+"""
+In-process catalog indexes, kept per organization.
+
+Autocomplete runs on every keystroke, and its LIKE '%q%' filters cannot use a
+btree index. Instead each worker keeps sorted arrays of codes, categories and
+description words and answers prefix lookups with binary search.
+
+CatalogIndexRegistry keeps any CatalogIndex subclass fresh (see also
+app.services.ranked_search). Builds and refreshes query the database, so
+async endpoints call into the registry from a worker thread.
+"""
+import re
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.cache import cache
+from app.models.code_change import START, Cursor, changes_after, latest_change_cursor
+from app.models.diagnostic_code import DiagnosticCode
+from app.services.diagnostic_code_service import DiagnosticCodeService
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Sorts after any character that can follow a prefix, closing a bisect range
+_PREFIX_END = "\U0010ffff"
+
+# (code, description, category) of an indexed code
+Entry = Tuple[str, str, str]
+
+# Larger change batches are cheaper to apply by rebuilding
+MAX_INCREMENTAL_CHANGES = 1000
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase word tokens of a text."""
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+class _PrefixArray:
+    """Sorted (key, entry index) pairs answering prefix range queries."""
+
+    def __init__(self, pairs: List[Tuple[str, int]]):
+        pairs.sort()
+        self.keys = [sys.intern(key) for key, _ in pairs]
+        self.entries = array("I", (entry for _, entry in pairs))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def updated(self, removed: List[Tuple[str, int]], added: List[Tuple[str, int]]) -> "_PrefixArray":
+        """
+        A copy with pairs removed and added; readers of this one are unaffected.
+
+        Added entry indexes must be higher than any already present.
+        """
+        copy = _PrefixArray.__new__(_PrefixArray)
+        keys = copy.keys = list(self.keys)
+        entries = copy.entries = array("I", self.entries)
+        for key, entry in removed:
+            for position in range(bisect_left(keys, key), bisect_right(keys, key)):
+                if entries[position] == entry:
+                    del keys[position]
+                    del entries[position]
+                    break
+        for key, entry in added:
+            position = bisect_right(keys, key)
+            keys.insert(position, sys.intern(key))
+            entries.insert(position, entry)
+        return copy
+
+    def range(self, prefix: str) -> Tuple[int, int]:
+        return (
+            bisect_left(self.keys, prefix),
+            bisect_left(self.keys, prefix + _PREFIX_END),
+        )
+
+    def matches(self, prefix: str) -> Iterator[int]:
+        """Entry indexes whose key starts with prefix, in key order."""
+        start, end = self.range(prefix)
+        for position in range(start, end):
+            yield self.entries[position]
+
+
+class CatalogIndex:
+    """Base class for indexes managed by CatalogIndexRegistry."""
+
+    # Set by refresh() when committed changes wait behind a running transaction
+    behind = False
+
+    @classmethod
+    def build(cls, db: Session, organization_id: Optional[int] = None) -> "CatalogIndex":
+        """Build the index from the database (None = all organizations)."""
+        raise NotImplementedError
+
+    def refresh(self, db: Session) -> bool:
+        """
+        Bring the index up to date in place, if the index supports that.
+
+        Returns False when the registry should rebuild it from scratch instead.
+        """
+        return False
+
+
+class AutocompleteIndex(CatalogIndex):
+    """
+    Prefix index over active codes, categories and description words.
+
+    Refreshed incrementally from code_changes like BM25Index: a changed code's
+    entry is tombstoned and its current row, if still active, appended. The
+    prefix arrays are replaced rather than edited, so concurrent lookups see
+    either the old or the new state.
+    """
+
+    def __init__(
+        self,
+        codes: List[Tuple[int, str, str, Optional[str]]],
+        organization_id: Optional[int] = None,
+        cursor: Cursor = START,
+    ):
+        self.organization_id = organization_id
+        # Last code change reflected in the index
+        self.cursor = cursor
+        codes = sorted(codes, key=lambda row: row[1].lower())
+        self.entries: List[Optional[Entry]] = [
+            (code, description, category or "") for _, code, description, category in codes
+        ]
+        self.slots: Dict[int, int] = {row[0]: i for i, row in enumerate(codes)}
+        pairs = [[], [], []]
+        for i, entry in enumerate(self.entries):
+            for keys, entry_keys in zip(pairs, self._keys(entry)):
+                keys.extend((key, i) for key in entry_keys)
+        self.codes, self.categories, self.tokens = (_PrefixArray(keys) for keys in pairs)
+
+    @staticmethod
+    def _keys(entry: Entry) -> Tuple[List[str], List[str], List[str]]:
+        """Code, category and description-word keys of an entry."""
+        code, description, category = entry
+        return [code.lower()], [category.lower()] if category else [], list(set(tokenize(description)))
+
+    @classmethod
+    def build(cls, db: Session, organization_id: Optional[int] = None) -> "AutocompleteIndex":
+        # Read the cursor first: changes racing with the load are re-applied
+        cursor = latest_change_cursor(db, organization_id)
+        return cls(cls._load(db, organization_id), organization_id, cursor)
+
+    @staticmethod
+    def _load(db: Session, organization_id: Optional[int], code_ids: Optional[List[int]] = None):
+        query = db.query(
+            DiagnosticCode.id, DiagnosticCode.code, DiagnosticCode.description, DiagnosticCode.category
+        ).filter(DiagnosticCode.is_active == True)
+        if organization_id is not None:
+            query = query.filter(DiagnosticCode.organization_id == organization_id)
+        if code_ids is not None:
+            query = query.filter(DiagnosticCode.id.in_(code_ids))
+        return query.all()
+
+    def __len__(self):
+        return len(self.slots)
+
+    def refresh(self, db: Session) -> bool:
+        """Apply code_changes recorded since the index was last refreshed."""
+        changes, self.behind = changes_after(db, self.organization_id, self.cursor, MAX_INCREMENTAL_CHANGES + 1)
+        if len(changes) > MAX_INCREMENTAL_CHANGES:
+            return False
+        if not changes:
+            return True
+        if len(self.entries) - len(self.slots) > len(self.slots):
+            return False
+
+        changed_ids = list({change.diagnostic_code_id for change in changes})
+        removed = [[], [], []]
+        added = [[], [], []]
+        tombstones = [self.slots.pop(code_id) for code_id in changed_ids if code_id in self.slots]
+        for i in tombstones:
+            for keys, entry_keys in zip(removed, self._keys(self.entries[i])):
+                keys.extend((key, i) for key in entry_keys)
+        # Current rows of the changed codes; deleted and deactivated ones are absent
+        rows = sorted(self._load(db, self.organization_id, changed_ids), key=lambda row: row[1].lower())
+        for code_id, code, description, category in rows:
+            i = len(self.entries)
+            entry = (code, description, category or "")
+            self.entries.append(entry)
+            self.slots[code_id] = i
+            for keys, entry_keys in zip(added, self._keys(entry)):
+                keys.extend((key, i) for key in entry_keys)
+
+        self.codes = self.codes.updated(removed[0], added[0])
+        self.categories = self.categories.updated(removed[1], added[1])
+        self.tokens = self.tokens.updated(removed[2], added[2])
+        for i in tombstones:
+            self.entries[i] = None
+        self.cursor = changes[-1].cursor
+        return True
+
+    def suggest(self, query: str, limit: int = 10) -> List[Tuple[Entry, str]]:
+        """
+        Up to limit (entry, match_type) pairs for a partial query.
+
+        Code-prefix matches rank first, then category-prefix, then codes whose
+        description has words starting with every query word. Each code is
+        reported once, under its best match type.
+        """
+        query_lower = query.lower()
+        results: List[Tuple[Entry, str]] = []
+        seen = set()
+
+        def collect(indexes, match_type: str) -> bool:
+            for i in indexes:
+                entry = self.entries[i]
+                # None: tombstoned by a refresh after this lookup took its arrays
+                if entry is not None and i not in seen:
+                    seen.add(i)
+                    results.append((entry, match_type))
+                    if len(results) >= limit:
+                        return True
+            return False
+
+        if collect(self.codes.matches(query_lower), "code"):
+            return results
+        if collect(self.categories.matches(query_lower), "category"):
+            return results
+        collect(self._description_matches(tokenize(query_lower)), "description")
+        return results
+
+    def _description_matches(self, words: List[str]) -> List[int]:
+        if not words:
+            return []
+        # Intersect starting from the narrowest prefix range
+        ranges = sorted((self.tokens.range(word) for word in words), key=lambda r: r[1] - r[0])
+        start, end = ranges[0]
+        candidates = set(self.tokens.entries[start:end])
+        for start, end in ranges[1:]:
+            candidates.intersection_update(self.tokens.entries[start:end])
+            if not candidates:
+                break
+        # Entries appended by refreshes are out of code order
+        entries = self.entries
+        return sorted(candidates, key=lambda i: entries[i][0].lower() if entries[i] else "")
+
+
+class CatalogIndexRegistry:
+    """
+    Per-organization indexes, refreshed when the catalog version changes.
+
+    Code writes bump the organization's catalog version (shared through Redis
+    across workers), which is the change notification: the next lookup sees a
+    new version and refreshes the index in place, or rebuilds it when the
+    index cannot apply the changes incrementally. Changes committed behind a
+    still-running transaction are not visible to refresh() yet; the index is
+    then kept stale and refreshed again on the next lookup. While one thread does so,
+    concurrent lookups keep serving the previous state; only lookups for an
+    organization with no index yet build one themselves.
+
+    get() may query the database and, on a rebuild, scan the catalog, so
+    callers on an event loop run it in a worker thread.
+    """
+
+    def __init__(self, index_class=AutocompleteIndex):
+        self._index_class = index_class
+        self._indexes: Dict[Optional[int], Tuple[Optional[int], CatalogIndex]] = {}
+        self._lock = threading.Lock()
+        self._building: set = set()
+
+    @staticmethod
+    def _version(organization_id: Optional[int]) -> int:
+        return cache.get_generation(DiagnosticCodeService.catalog_tag(organization_id))
+
+    def get(self, db: Session, organization_id: Optional[int] = None) -> CatalogIndex:
+        """Index for an organization (None = all organizations), refreshed if stale."""
+        version = self._version(organization_id)
+        current = self._indexes.get(organization_id)
+        if current is not None and current[0] == version:
+            return current[1]
+
+        with self._lock:
+            rebuild = organization_id not in self._building
+            if rebuild:
+                self._building.add(organization_id)
+        if not rebuild and current is not None:
+            return current[1]
+
+        try:
+            if current is not None and current[1].refresh(db):
+                index = current[1]
+            else:
+                index = self._index_class.build(db, organization_id)
+            # Held-back changes: stay stale so the next lookup refreshes again
+            self._indexes[organization_id] = (None if index.behind else version, index)
+            return index
+        finally:
+            if rebuild:
+                with self._lock:
+                    self._building.discard(organization_id)
+
+    def warm(self, session_factory, include_all: bool = True) -> threading.Thread:
+        """
+        Build indexes for every organization in a background thread (e.g. at startup).
+
+        include_all also builds the cross-organization (None) index.
+        """
+
+        def run():
+            db = session_factory()
+            try:
+                organization_ids = [
+                    organization_id for (organization_id,) in db.query(DiagnosticCode.organization_id).distinct()
+                ]
+                if include_all:
+                    organization_ids.insert(0, None)
+                for organization_id in organization_ids:
+                    self.get(db, organization_id)
+            except Exception as e:
+                print(f"Catalog index warm-up failed: {e}")
+            finally:
+                db.close()
+
+        thread = threading.Thread(target=run, name="catalog-index-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def clear(self) -> None:
+        self._indexes.clear()
+
+
+# Global registry instance
+catalog_indexes = CatalogIndexRegistry()
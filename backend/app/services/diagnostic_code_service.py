@@ -1,17 +1,85 @@
 """
 Business logic for Diagnostic Code operations.
 """
-from typing import List, Optional
+import base64
+import hashlib
+import json
+import logging
+import re
+from collections import namedtuple
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple, Union
+from sqlalchemy import event
 from sqlalchemy.orm import Session, selectinload
-from sqlalchemy import or_, func, text
+from sqlalchemy import or_, func, text, case, literal_column
 
 from app.models.diagnostic_code import DiagnosticCode
+from app.models.code_change import CATALOG_WRITES, CodeChange, changes_after, format_cursor, parse_cursor
 from app.schemas.diagnostic_code import DiagnosticCodeCreate, DiagnosticCodeUpdate
 from app.core.cache import cache
 from app.core.config import Settings
+from app.db.database import is_postgresql
 
 settings = Settings()
 
+logger = logging.getLogger(__name__)
+
+# Weighted tsvector maintained by trigger (code A, description B, category C)
+_SEARCH_TSV = literal_column("diagnostic_codes.search_tsv")
+_WORD_RE = re.compile(r"\w+")
+
+# Session.info keys for deferred invalidation (see DiagnosticCodeService.invalidate_caches)
+_DEFER_INVALIDATION = "defer_catalog_invalidation"
+_DEFERRED_WRITES = "deferred_catalog_writes"
+
+_CACHED_CODE_FIELDS = (
+    "id", "organization_id", "code", "description", "category", "subcategory",
+    "severity", "is_active", "extra_data", "created_at", "updated_at",
+)
+
+
+class CachedDiagnosticCode(namedtuple("CachedDiagnosticCode", _CACHED_CODE_FIELDS)):
+    """
+    Read-only diagnostic code rehydrated from the cache.
+    
+    A tuple rather than a transient ORM instance: no SQLAlchemy instrumentation
+    per hit, yet Pydantic reads it through attribute access just like the model.
+    Cached rows are stored as fixed-order lists (see _CACHED_CODE_FIELDS)
+    instead of dicts, so keys are not repeated for every item.
+    """
+    
+    __slots__ = ()
+    
+    @staticmethod
+    def to_row(item: DiagnosticCode) -> list:
+        """Fixed-schema cache encoding of a code."""
+        return [
+            item.id,
+            item.organization_id,
+            item.code,
+            item.description,
+            item.category,
+            item.subcategory,
+            item.severity,
+            item.is_active,
+            item.extra_data,
+            item.created_at.isoformat() if item.created_at else None,
+            item.updated_at.isoformat() if item.updated_at else None,
+        ]
+    
+    @classmethod
+    def from_row(cls, row: list) -> "CachedDiagnosticCode":
+        created_at, updated_at = row[9], row[10]
+        return cls._make((
+            *row[:9],
+            datetime.fromisoformat(created_at) if created_at else None,
+            datetime.fromisoformat(updated_at) if updated_at else None,
+        ))
+
+
+# What read paths return: live ORM rows on a cache miss, cached copies on a hit
+CodeRecord = Union[DiagnosticCode, CachedDiagnosticCode]
+
 
 class DiagnosticCodeService:
     """Service for managing diagnostic codes."""
@@ -19,6 +87,55 @@ class DiagnosticCodeService:
     def __init__(self, db: Session):
         self.db = db
     
+    @staticmethod
+    def catalog_tag(organization_id: Optional[int] = None) -> str:
+        """Cache invalidation tag for an organization's catalog (None = all orgs)."""
+        if organization_id is None:
+            return "codes:all"
+        return f"codes:org:{organization_id}"
+    
+    def catalog_version(self, organization_id: Optional[int] = None) -> int:
+        """Data version of an organization's catalog; changes on every code write."""
+        return cache.get_generation(self.catalog_tag(organization_id))
+    
+    async def acatalog_version(self, organization_id: Optional[int] = None) -> int:
+        """Async version of catalog_version()."""
+        return await cache.aget_generation(self.catalog_tag(organization_id))
+    
+    async def ashared_catalog_version(self, organization_id: Optional[int] = None) -> Optional[int]:
+        """
+        catalog_version() when every worker sees the same value (stored in
+        Redis), else None. Only a shared version may be handed to clients,
+        e.g. in ETags.
+        """
+        return await cache.aget_shared_generation(self.catalog_tag(organization_id))
+    
+    @classmethod
+    def bump_catalog_versions(cls, organization_ids) -> None:
+        """One generation bump per tenant, regardless of how many codes changed."""
+        tags = {cls.catalog_tag(org_id) for org_id in organization_ids if org_id is not None}
+        # Cross-organization lookups (organization_id=None) depend on every write
+        tags.add(cls.catalog_tag(None))
+        cache.bump_generation(*sorted(tags))
+    
+    def invalidate_caches(self, *organization_ids: Optional[int]) -> None:
+        """
+        Invalidate cached lists, counts and lookups for the given organizations
+        plus any whose writes were committed while invalidation was deferred.
+        
+        Committed code writes invalidate on their own (see
+        _invalidate_committed_writes); call this after deferred writes or
+        raw SQL that bypasses the change log.
+        """
+        self.db.info.pop(_DEFER_INVALIDATION, None)
+        organizations = self.db.info.pop(_DEFERRED_WRITES, set()) | set(organization_ids)
+        self.bump_catalog_versions(organizations)
+    
+    def _defer_invalidation(self, defer_invalidation: bool) -> None:
+        """Hold back invalidation of this session's commits until invalidate_caches()."""
+        if defer_invalidation:
+            self.db.info[_DEFER_INVALIDATION] = True
+    
     def _get_cache_key(self, prefix: str, **kwargs) -> str:
         """Generate cache key from parameters."""
         key_parts = [prefix]
@@ -27,56 +144,69 @@ class DiagnosticCodeService:
                 key_parts.append(f"{k}:{v}")
         return ":".join(key_parts)
     
-    def get_codes(
+    @staticmethod
+    def _filter_fingerprint(**filters) -> str:
+        """Stable short hash of a filter set, used to bind cursors to their query."""
+        normalized = {k: v for k, v in sorted(filters.items()) if v is not None}
+        digest = hashlib.sha1(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+        return digest[:16]
+    
+    @staticmethod
+    def encode_cursor(last_id: int, **filters) -> str:
+        """Encode an opaque keyset cursor pointing after ``last_id``."""
+        payload = {"id": last_id, "f": DiagnosticCodeService._filter_fingerprint(**filters)}
+        raw = json.dumps(payload, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+    
+    @staticmethod
+    def decode_cursor(token: str, **filters) -> int:
+        """
+        Decode a keyset cursor and return the last seen id.
+        
+        Raises:
+            ValueError: If the cursor is malformed or was issued for other filters
+        """
+        try:
+            padded = token + "=" * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            last_id = int(payload["id"])
+            fingerprint = payload["f"]
+        except Exception:
+            raise ValueError("Invalid pagination cursor")
+        
+        if fingerprint != DiagnosticCodeService._filter_fingerprint(**filters):
+            raise ValueError("Pagination cursor does not match the current filters")
+        
+        return last_id
+    
+    def _apply_filters(
         self,
-        skip: int = 0,
-        limit: int = 100,
+        query,
         search: Optional[str] = None,
         category: Optional[str] = None,
         severity: Optional[str] = None,
         is_active: Optional[bool] = None,
         organization_id: Optional[int] = None,
-    ) -> List[DiagnosticCode]:
-        """Get list of diagnostic codes with optional filters."""
-        # Try cache first
-        cache_key = self._get_cache_key(
-            "codes:list",
-            skip=skip,
-            limit=limit,
-            search=search,
-            category=category,
-            severity=severity,
-            is_active=is_active,
-            organization_id=organization_id
-        )
-        
-        cached = cache.get(cache_key)
-        if cached is not None:
-            # Convert dict back to DiagnosticCode objects
-            return [DiagnosticCode(**item) for item in cached]
-        
-        # Query database with optimizations
-        # Eager load relationships to prevent N+1 queries
-        query = self.db.query(DiagnosticCode).options(
-            selectinload(DiagnosticCode.organization)
-        )
-        
-        # Apply filters (uses indexes for optimal performance)
+    ):
+        """Apply list filters; shared by get_codes and count_codes so both agree."""
         if search:
-            # Use full-text search for description (utilizes GIN index on description_tsv)
             # For code search, use ILIKE with pattern matching (utilizes index on code)
             search_pattern = f"%{search}%"
             
-            # Convert search term to tsquery format (handle spaces and special chars)
-            search_tsquery = " & ".join(search.split())
+            if is_postgresql(self.db):
+                # Full-text match on the weighted document
+                # (utilizes GIN index idx_diagnostic_codes_org_search_tsv)
+                description_match = _SEARCH_TSV.op("@@")(self._tsquery(search))
+            else:
+                # No tsvector column outside PostgreSQL (e.g. SQLite in tests)
+                description_match = DiagnosticCode.description.ilike(search_pattern)
             
             query = query.filter(
                 or_(
                     DiagnosticCode.code.ilike(search_pattern),
-                    # Full-text search on description using tsvector (much faster for text search)
-                    text("description_tsv @@ to_tsquery('english', :search_term)")
+                    description_match,
                 )
-            ).params(search_term=search_tsquery)
+            )
         
         if category:
             # Utilizes idx_diagnostic_codes_category
@@ -95,158 +225,505 @@ class DiagnosticCodeService:
         if organization_id is not None:
             query = query.filter(DiagnosticCode.organization_id == organization_id)
         
-        # Order by indexed column for better performance
-        query = query.order_by(DiagnosticCode.id)
-        
-        results = query.offset(skip).limit(limit).all()
-        
-        # Cache results (convert to dict for JSON serialization)
-        cache_data = [
-            {
-                "id": item.id,
-                "code": item.code,
-                "description": item.description,
-                "category": item.category,
-                "subcategory": item.subcategory,
-                "severity": item.severity,
-                "is_active": item.is_active,
-                "created_at": item.created_at.isoformat() if item.created_at else None,
-                "updated_at": item.updated_at.isoformat() if item.updated_at else None,
-            }
-            for item in results
+        return query
+    
+    @staticmethod
+    def _tsquery(search: str):
+        """
+        tsquery for user input: web-search syntax (quotes, OR, -term) or, as
+        the user types, all words with the last one as a prefix.
+        
+        Neither form can raise a syntax error on punctuation.
+        """
+        words = _WORD_RE.findall(search.lower())
+        query = func.websearch_to_tsquery("english", search)
+        if words:
+            prefix = " & ".join(words[:-1] + [f"{words[-1]}:*"])
+            query = query.op("||")(func.to_tsquery("english", prefix))
+        return query
+    
+    def _relevance_order(self, search: str) -> list:
+        """ORDER BY clauses putting the best matches for search first."""
+        if is_postgresql(self.db):
+            # Cover density ranking over the weighted document
+            return [func.ts_rank_cd(_SEARCH_TSV, self._tsquery(search)).desc(), DiagnosticCode.id]
+        # No tsvector outside PostgreSQL: exact code, code prefix, then the rest
+        return [
+            case(
+                (func.lower(DiagnosticCode.code) == search.lower(), 0),
+                (DiagnosticCode.code.ilike(f"{search}%"), 1),
+                else_=2,
+            ),
+            DiagnosticCode.id,
         ]
-        cache.set(cache_key, cache_data, ttl=settings.CACHE_TTL)
-        
-        return results
     
-    def count_codes(
+    def get_codes(
         self,
+        skip: int = 0,
+        limit: int = 100,
         search: Optional[str] = None,
         category: Optional[str] = None,
         severity: Optional[str] = None,
         is_active: Optional[bool] = None,
         organization_id: Optional[int] = None,
-    ) -> int:
-        """Count diagnostic codes with optional filters."""
-        query = self.db.query(func.count(DiagnosticCode.id))
-        
-        # Apply same filters as get_codes
-        if search:
-            search_pattern = f"%{search}%"
-            query = query.filter(
-                or_(
-                    DiagnosticCode.code.ilike(search_pattern),
-                    DiagnosticCode.description.ilike(search_pattern),
-                )
-            )
+        after_id: Optional[int] = None,
+        sort: str = "id",
+    ) -> List[CodeRecord]:
+        """
+        Get list of diagnostic codes with optional filters.
+        
+        When ``after_id`` is given, keyset pagination is used: rows are read
+        from the id index starting right after ``after_id`` and ``skip`` is
+        ignored, so page cost stays flat regardless of depth.
+        
+        ``sort="relevance"`` orders search results best match first
+        (offset pagination only; cursors follow id order).
+        """
+        if after_id is not None:
+            skip = 0
+        
+        params = dict(
+            skip=skip,
+            limit=limit,
+            after_id=after_id,
+            search=search,
+            category=category,
+            severity=severity,
+            is_active=is_active,
+            organization_id=organization_id,
+            sort=sort,
+        )
+        # The leader of a recompute gets live ORM rows; everyone else gets cached rows
+        fresh: List[List[DiagnosticCode]] = []
+        
+        cached = cache.get_or_set(
+            self._get_cache_key(f"codes:list:g{self.catalog_version(organization_id)}", **params),
+            self._list_loader(fresh, params),
+            ttl=settings.CACHE_TTL,
+            stale_key=self._get_cache_key("codes:list:stale", **params),
+        )
+        return fresh[0] if fresh else self._from_cache(cached)
+    
+    async def aget_codes(
+        self,
+        skip: int = 0,
+        limit: int = 100,
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        severity: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        organization_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        sort: str = "id",
+    ) -> List[CodeRecord]:
+        """Async version of get_codes(); cache I/O does not block the event loop."""
+        if after_id is not None:
+            skip = 0
+        
+        params = dict(
+            skip=skip,
+            limit=limit,
+            after_id=after_id,
+            search=search,
+            category=category,
+            severity=severity,
+            is_active=is_active,
+            organization_id=organization_id,
+            sort=sort,
+        )
+        fresh: List[List[DiagnosticCode]] = []
+        
+        version = await self.acatalog_version(organization_id)
+        cached = await cache.aget_or_set(
+            self._get_cache_key(f"codes:list:g{version}", **params),
+            self._list_loader(fresh, params),
+            ttl=settings.CACHE_TTL,
+            stale_key=self._get_cache_key("codes:list:stale", **params),
+        )
+        return fresh[0] if fresh else self._from_cache(cached)
+    
+    def _list_loader(self, fresh: List[List[DiagnosticCode]], params: dict):
+        """Build the cache loader for a listing; live rows are stashed in ``fresh``."""
+        def load() -> List[dict]:
+            results = self._query_codes(**params)
+            fresh.append(results)
+            # Cache results as fixed-schema rows
+            return [CachedDiagnosticCode.to_row(item) for item in results]
+        return load
+    
+    @staticmethod
+    def _from_cache(cached: List[list]) -> List[CachedDiagnosticCode]:
+        """Rehydrate cached rows into lightweight read-only records."""
+        return [CachedDiagnosticCode.from_row(row) for row in cached]
+    
+    def _query_codes(
+        self,
+        skip: int,
+        limit: int,
+        after_id: Optional[int],
+        sort: str = "id",
+        **filters,
+    ) -> List[CodeRecord]:
+        """Run the listing query against the database."""
+        # Query database with optimizations
+        # Eager load relationships to prevent N+1 queries
+        query = self.db.query(DiagnosticCode).options(
+            selectinload(DiagnosticCode.organization)
+        )
         
-        if category:
-            query = query.filter(DiagnosticCode.category == category)
+        # Apply filters (uses indexes for optimal performance)
+        query = self._apply_filters(query, **filters)
         
-        if severity:
-            query = query.filter(DiagnosticCode.severity == severity)
+        # Keyset pagination: seek past the last seen id instead of OFFSET
+        # Utilizes idx_diagnostic_codes_org_id_id
+        if after_id is not None:
+            query = query.filter(DiagnosticCode.id > after_id)
         
-        if is_active is not None:
-            query = query.filter(DiagnosticCode.is_active == is_active)
+        if sort == "relevance" and filters.get("search") and after_id is None:
+            query = query.order_by(*self._relevance_order(filters["search"]))
+        else:
+            # Order by indexed column for better performance
+            query = query.order_by(DiagnosticCode.id)
         
-        # Organization filtering
-        if organization_id is not None:
-            query = query.filter(DiagnosticCode.organization_id == organization_id)
-        
-        return query.scalar()
+        return query.offset(skip).limit(limit).all()
+    
+    def count_codes(
+        self,
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        severity: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        organization_id: Optional[int] = None,
+    ) -> int:
+        """Count diagnostic codes with optional filters (exact, cached per filter set)."""
+        filters = dict(
+            search=search,
+            category=category,
+            severity=severity,
+            is_active=is_active,
+            organization_id=organization_id
+        )
+        return cache.get_or_set(
+            self._get_cache_key(f"codes:count:g{self.catalog_version(organization_id)}", **filters),
+            lambda: self._apply_filters(self.db.query(func.count(DiagnosticCode.id)), **filters).scalar(),
+            ttl=settings.CACHE_TTL,
+        )
+    
+    async def acount_codes(
+        self,
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        severity: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        organization_id: Optional[int] = None,
+    ) -> int:
+        """Async version of count_codes()."""
+        filters = dict(
+            search=search,
+            category=category,
+            severity=severity,
+            is_active=is_active,
+            organization_id=organization_id
+        )
+        version = await self.acatalog_version(organization_id)
+        return await cache.aget_or_set(
+            self._get_cache_key(f"codes:count:g{version}", **filters),
+            lambda: self._apply_filters(self.db.query(func.count(DiagnosticCode.id)), **filters).scalar(),
+            ttl=settings.CACHE_TTL,
+        )
+    
+    def estimate_count(self, organization_id: Optional[int] = None) -> Optional[int]:
+        """
+        Planner row estimate for the unfiltered (per-organization) listing,
+        cached per catalog version.
+        
+        Returns None when no estimate is available (non-PostgreSQL backends).
+        """
+        if not is_postgresql(self.db):
+            return None
+        return cache.get_or_set(
+            self._get_cache_key(
+                f"codes:estimate:g{self.catalog_version(organization_id)}", organization_id=organization_id
+            ),
+            lambda: self._explain_count(organization_id),
+            ttl=settings.CACHE_TTL,
+        )
+    
+    async def aestimate_count(self, organization_id: Optional[int] = None) -> Optional[int]:
+        """Async version of estimate_count()."""
+        if not is_postgresql(self.db):
+            return None
+        version = await self.acatalog_version(organization_id)
+        return await cache.aget_or_set(
+            self._get_cache_key(f"codes:estimate:g{version}", organization_id=organization_id),
+            lambda: self._explain_count(organization_id),
+            ttl=settings.CACHE_TTL,
+        )
+    
+    def _explain_count(self, organization_id: Optional[int]) -> Optional[int]:
+        """Run EXPLAIN for the unfiltered listing; None (logged) if it fails."""
+        query = self._apply_filters(
+            self.db.query(DiagnosticCode.id),
+            organization_id=organization_id,
+        )
+        sql = query.statement.compile(
+            dialect=self.db.get_bind().dialect,
+            compile_kwargs={"literal_binds": True},
+        )
+        try:
+            # Savepoint: a failed EXPLAIN must not abort the caller's transaction
+            with self.db.begin_nested():
+                plan = self.db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"])
+        except Exception:
+            # get_total() falls back to the exact count
+            logger.exception("Count estimate failed")
+            return None
+    
+    def get_total(
+        self,
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        severity: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        organization_id: Optional[int] = None,
+    ) -> Tuple[int, bool]:
+        """
+        Total for a listing, returned as ``(total, is_estimate)``.
+        
+        Unfiltered listings whose planner estimate exceeds
+        ``COUNT_ESTIMATE_THRESHOLD`` use the estimate instead of a full COUNT(*);
+        everything else gets the cached exact count.
+        """
+        unfiltered = not search and not category and not severity and is_active is None
+        if unfiltered:
+            estimate = self.estimate_count(organization_id)
+            if estimate is not None and estimate >= settings.COUNT_ESTIMATE_THRESHOLD:
+                return estimate, True
+        
+        total = self.count_codes(
+            search=search,
+            category=category,
+            severity=severity,
+            is_active=is_active,
+            organization_id=organization_id,
+        )
+        return total, False
+    
+    async def aget_total(
+        self,
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        severity: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        organization_id: Optional[int] = None,
+    ) -> Tuple[int, bool]:
+        """Async version of get_total()."""
+        unfiltered = not search and not category and not severity and is_active is None
+        if unfiltered:
+            estimate = await self.aestimate_count(organization_id)
+            if estimate is not None and estimate >= settings.COUNT_ESTIMATE_THRESHOLD:
+                return estimate, True
+        
+        total = await self.acount_codes(
+            search=search,
+            category=category,
+            severity=severity,
+            is_active=is_active,
+            organization_id=organization_id,
+        )
+        return total, False
     
-    def get_code_by_id(self, code_id: int, organization_id: Optional[int] = None) -> Optional[DiagnosticCode]:
+    def get_code_by_id(self, code_id: int, organization_id: Optional[int] = None) -> Optional[CodeRecord]:
         """Get diagnostic code by ID."""
         # Try cache first
-        cache_key = f"codes:id:{code_id}:org:{organization_id}"
+        cache_key = self._code_cache_key(code_id, organization_id, self.catalog_version(organization_id))
         cached = cache.get(cache_key)
         if cached:
-            return DiagnosticCode(**cached)
+            return CachedDiagnosticCode.from_row(cached)
         
+        result = self._query_code_by_id(code_id, organization_id)
+        if result:
+            # Cache single code
+            cache.set(cache_key, CachedDiagnosticCode.to_row(result), ttl=settings.CACHE_TTL)
+        
+        return result
+    
+    async def aget_code_by_id(self, code_id: int, organization_id: Optional[int] = None) -> Optional[CodeRecord]:
+        """Async version of get_code_by_id()."""
+        version = await self.acatalog_version(organization_id)
+        cache_key = self._code_cache_key(code_id, organization_id, version)
+        cached = await cache.aget(cache_key)
+        if cached:
+            return CachedDiagnosticCode.from_row(cached)
+        
+        result = self._query_code_by_id(code_id, organization_id)
+        if result:
+            await cache.aset(cache_key, CachedDiagnosticCode.to_row(result), ttl=settings.CACHE_TTL)
+        
+        return result
+    
+    @staticmethod
+    def _code_cache_key(code_id: int, organization_id: Optional[int], version: int) -> str:
+        return f"codes:id:{code_id}:org:{organization_id}:g{version}"
+    
+    def _query_code_by_id(self, code_id: int, organization_id: Optional[int]) -> Optional[CodeRecord]:
         query = self.db.query(DiagnosticCode).filter(DiagnosticCode.id == code_id)
         
         # Organization filtering
         if organization_id is not None:
             query = query.filter(DiagnosticCode.organization_id == organization_id)
         
-        result = query.first()
-        
-        if result:
-            # Cache single code
-            cache_data = {
-                "id": result.id,
-                "code": result.code,
-                "description": result.description,
-                "category": result.category,
-                "subcategory": result.subcategory,
-                "severity": result.severity,
-                "is_active": result.is_active,
-                "created_at": result.created_at.isoformat() if result.created_at else None,
-                "updated_at": result.updated_at.isoformat() if result.updated_at else None,
-            }
-            cache.set(cache_key, cache_data, ttl=settings.CACHE_TTL)
-        
-        return result
+        return query.first()
+    
+    def _get_persistent_code(self, code_id: int) -> Optional[CodeRecord]:
+        """Load a session-attached row for writes (cache hits are detached copies)."""
+        return self.db.query(DiagnosticCode).filter(DiagnosticCode.id == code_id).first()
     
-    def get_code_by_code(self, code: str, organization_id: Optional[int] = None) -> Optional[DiagnosticCode]:
+    def get_code_by_code(self, code: str, organization_id: Optional[int] = None) -> Optional[CodeRecord]:
         """Get diagnostic code by code string."""
         query = self.db.query(DiagnosticCode).filter(DiagnosticCode.code == code)
         if organization_id is not None:
             query = query.filter(DiagnosticCode.organization_id == organization_id)
         return query.first()
     
-    def create_code(self, code_data: DiagnosticCodeCreate, organization_id: int) -> DiagnosticCode:
-        """Create a new diagnostic code."""
+    def get_changes(
+        self,
+        organization_id: int,
+        since: str = "0",
+        limit: int = 500,
+    ) -> Tuple[List[Tuple[int, str, int, Optional[DiagnosticCode]]], str, bool]:
+        """
+        Get code changes after change token `since`, for delta sync.
+        
+        Returns ((sequence, operation, code_id, code) entries, next_since, has_more).
+        Several changes to one code within the page collapse into its latest;
+        code is None for deletes. Changes committed behind a still-running
+        transaction are left for a later call (see changes_after).
+        Raises ValueError for a malformed token.
+        """
+        changes, _ = changes_after(self.db, organization_id, parse_cursor(since), limit + 1)
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        if not changes:
+            return [], since, False
+        
+        latest = {change.diagnostic_code_id: change for change in changes}
+        upserted_ids = [
+            code_id for code_id, change in latest.items() if change.operation == CodeChange.UPSERT
+        ]
+        codes = {}
+        if upserted_ids:
+            codes = {
+                code.id: code
+                for code in self.db.query(DiagnosticCode).filter(DiagnosticCode.id.in_(upserted_ids))
+            }
+        
+        entries = []
+        for change in sorted(latest.values(), key=lambda change: change.cursor):
+            # A code deleted after this page was written is sent as a tombstone already
+            code = codes.get(change.diagnostic_code_id)
+            operation = CodeChange.UPSERT if code is not None else CodeChange.DELETE
+            entries.append((change.id, operation, change.diagnostic_code_id, code))
+        return entries, format_cursor(changes[-1].cursor), has_more
+    
+    def create_code(
+        self,
+        code_data: DiagnosticCodeCreate,
+        organization_id: int,
+        defer_invalidation: bool = False,
+        before_commit: Optional[Callable[[DiagnosticCode], None]] = None,
+    ) -> DiagnosticCode:
+        """
+        Create a new diagnostic code.
+        
+        ``before_commit`` is called with the flushed row just before the
+        commit, for writes that must commit with it (webhook outbox rows).
+        """
         # Check organization code limit
         from app.services.organization_service import OrganizationService
         if not OrganizationService.check_code_limit(self.db, organization_id):
             raise ValueError(f"Organization has reached maximum code limit")
         
         db_code = DiagnosticCode(**code_data.model_dump(), organization_id=organization_id)
+        self._defer_invalidation(defer_invalidation)
         
         self.db.add(db_code)
+        if before_commit is not None:
+            self.db.flush()
+            before_commit(db_code)
         self.db.commit()
         self.db.refresh(db_code)
         
-        # Invalidate list caches
-        cache.delete_pattern("codes:list:*")
-        
         return db_code
     
     def update_code(
         self,
         code_id: int,
-        code_data: DiagnosticCodeUpdate
-    ) -> Optional[DiagnosticCode]:
-        """Update a diagnostic code."""
-        db_code = self.get_code_by_id(code_id)
+        code_data: DiagnosticCodeUpdate,
+        defer_invalidation: bool = False,
+        before_commit: Optional[Callable[[DiagnosticCode], None]] = None,
+    ) -> Optional[CodeRecord]:
+        """
+        Update a diagnostic code.
+        
+        Pass ``defer_invalidation=True`` when updating many codes and call
+        ``invalidate_caches()`` once afterwards. ``before_commit`` works as
+        in create_code().
+        """
+        db_code = self._get_persistent_code(code_id)
         if not db_code:
             return None
         
         update_data = code_data.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_code, field, value)
+        self._defer_invalidation(defer_invalidation)
         
+        if before_commit is not None:
+            self.db.flush()
+            before_commit(db_code)
         self.db.commit()
         self.db.refresh(db_code)
         
-        # Invalidate caches
-        cache.delete(f"codes:id:{code_id}")
-        cache.delete_pattern("codes:list:*")
-        
         return db_code
     
-    def delete_code(self, code_id: int) -> bool:
-        """Delete a diagnostic code."""
-        db_code = self.get_code_by_id(code_id)
+    def delete_code(
+        self,
+        code_id: int,
+        defer_invalidation: bool = False,
+        before_commit: Optional[Callable[[DiagnosticCode], None]] = None,
+    ) -> bool:
+        """Delete a diagnostic code (see update_code for the keyword arguments)."""
+        db_code = self._get_persistent_code(code_id)
         if not db_code:
             return False
         
+        self._defer_invalidation(defer_invalidation)
         self.db.delete(db_code)
+        if before_commit is not None:
+            before_commit(db_code)
         self.db.commit()
         
-        # Invalidate caches
-        cache.delete(f"codes:id:{code_id}")
-        cache.delete_pattern("codes:list:*")
-        
         return True
+
+
+# Every committed code write invalidates its catalog - service methods, version
+# restores, imports - because all of them leave code_changes rows behind.
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_writes(session):
+    organizations = session.info.pop(CATALOG_WRITES, None)
+    if not organizations:
+        return
+    if session.info.get(_DEFER_INVALIDATION):
+        session.info.setdefault(_DEFERRED_WRITES, set()).update(organizations)
+    else:
+        DiagnosticCodeService.bump_catalog_versions(organizations | session.info.pop(_DEFERRED_WRITES, set()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_writes(session):
+    session.info.pop(CATALOG_WRITES, None)
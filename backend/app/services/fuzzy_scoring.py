@@ -0,0 +1,303 @@
+"""
+Vectorized trigram similarity for fuzzy search.
+
+Where pg_trgm is unavailable, fuzzy search scores candidates in process.
+Scoring them one by one in Python does not scale, so FuzzyIndex keeps the
+catalog's trigrams as flat NumPy arrays (CSR layout) and computes the
+similarity of every code to a query in a handful of array operations.
+
+The arrays are never modified once built. Writes are applied by refresh()
+as a small delta index plus a mask of superseded rows, swapped in as one
+state object; scores keep a reference to the state they were computed on,
+so searches running on other threads are unaffected.
+"""
+import re
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models.code_change import START, Cursor, changes_after, latest_change_cursor
+from app.models.diagnostic_code import DiagnosticCode
+from app.services.catalog_index import MAX_INCREMENTAL_CHANGES, CatalogIndex, CatalogIndexRegistry
+
+# pg_trgm's default thresholds for the % and <% operators
+SIMILARITY_THRESHOLD = 0.3
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+# (id, code, description, category, severity, is_active) of an indexed code
+Row = Tuple[int, str, str, Optional[str], Optional[str], Optional[bool]]
+
+
+def words(text: Optional[str]) -> List[str]:
+    """Lowercase alphanumeric words, as pg_trgm splits them."""
+    return _WORD_RE.findall(text.lower()) if text else []
+
+
+def trigrams(text: str) -> Set[str]:
+    """Trigrams of a text, extracted the way pg_trgm does (per word, padded)."""
+    result = set()
+    for word in words(text):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def trigram_similarity(a: str, b: str) -> float:
+    """Python equivalent of pg_trgm similarity()."""
+    ta, tb = trigrams(a), trigrams(b)
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+class _Rows:
+    """Variable-length rows of ids flattened into NumPy arrays (CSR layout)."""
+
+    def __init__(self, rows: List[List[int]]):
+        self.sizes = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+        self.offsets = np.zeros(len(rows), dtype=np.int64)
+        if len(rows):
+            np.cumsum(self.sizes[:-1], out=self.offsets[1:])
+        self.values = np.fromiter(
+            (value for row in rows for value in row), dtype=np.int32, count=int(self.sizes.sum())
+        )
+        # Row number of every flat value, for per-row sums via bincount
+        self.row_of = np.repeat(np.arange(len(rows)), self.sizes)
+
+    def __len__(self):
+        return len(self.sizes)
+
+
+class _TrigramArrays:
+    """
+    Trigram arrays of a fixed set of codes.
+
+    Code similarity is the trigram Jaccard of the query and the whole code
+    (pg_trgm similarity()). Description similarity is, for each query word,
+    the best Jaccard against any description word, averaged over the query
+    words - a vectorizable approximation of word_similarity(). Description
+    words are scored once per distinct word, not once per code.
+    """
+
+    def __init__(self, rows: List[Row]):
+        self._trigram_ids: Dict[str, int] = {}
+        vocabulary: Dict[str, int] = {}
+
+        code_trigrams, description_words = [], []
+        for _, code, description, *_ in rows:
+            code_trigrams.append(self._ids(trigrams(code)))
+            description_words.append(
+                [vocabulary.setdefault(word, len(vocabulary)) for word in set(words(description))]
+            )
+
+        self.size = len(rows)
+        self.code_trigrams = _Rows(code_trigrams)
+        self.word_trigrams = _Rows([self._ids(trigrams(word)) for word in vocabulary])
+        self.description_words = _Rows(description_words)
+
+    def _ids(self, grams: Set[str]) -> List[int]:
+        return [self._trigram_ids.setdefault(gram, len(self._trigram_ids)) for gram in grams]
+
+    def _jaccard(self, grams: Set[str], rows: _Rows) -> np.ndarray:
+        """Trigram Jaccard of one query against every row of trigram ids."""
+        if not len(rows) or not grams:
+            return np.zeros(len(rows))
+        # Membership through a lookup table: one gather instead of np.isin's sort
+        query_mask = np.zeros(len(self._trigram_ids), dtype=bool)
+        query_mask[[self._trigram_ids[gram] for gram in grams if gram in self._trigram_ids]] = True
+        shared = np.bincount(rows.row_of, weights=query_mask[rows.values], minlength=len(rows))
+        union = rows.sizes + len(grams) - shared
+        return np.divide(shared, union, out=np.zeros(len(rows)), where=union > 0)
+
+    def similarities(self, query: str) -> np.ndarray:
+        """Similarity of every code to the query (0 below pg_trgm's thresholds)."""
+        if not self.size:
+            return np.zeros(0)
+
+        code_similarity = self._jaccard(trigrams(query), self.code_trigrams)
+
+        query_words = words(query)
+        description_similarity = np.zeros(self.size)
+        descriptions = self.description_words
+        if query_words and len(descriptions.values):
+            # reduceat over the starts of non-empty rows only: each segment is one row
+            has_words = descriptions.sizes > 0
+            starts = descriptions.offsets[has_words]
+            for word in query_words:
+                per_word = self._jaccard(trigrams(word), self.word_trigrams)
+                description_similarity[has_words] += np.maximum.reduceat(per_word[descriptions.values], starts)
+            description_similarity /= len(query_words)
+
+        return np.maximum(
+            np.where(code_similarity >= SIMILARITY_THRESHOLD, code_similarity, 0.0),
+            np.where(description_similarity >= WORD_SIMILARITY_THRESHOLD, description_similarity, 0.0),
+        )
+
+
+class _Columns(NamedTuple):
+    """Filter columns of a list of rows, as arrays."""
+
+    ids: np.ndarray
+    categories: np.ndarray
+    severities: np.ndarray
+    active: np.ndarray
+
+    @classmethod
+    def of(cls, rows: List[Row]) -> "_Columns":
+        return cls(
+            np.array([row[0] for row in rows], dtype=np.int64),
+            np.array([row[3] for row in rows], dtype=object),
+            np.array([row[4] for row in rows], dtype=object),
+            np.array([bool(row[5]) for row in rows], dtype=bool),
+        )
+
+
+class _State(NamedTuple):
+    """Everything a query reads: the built arrays plus the changes applied since."""
+
+    # False for rows superseded by the delta (updated or deleted codes)
+    live: np.ndarray
+    delta: _TrigramArrays
+    delta_rows: Tuple[Row, ...]
+    delta_slots: Dict[int, int]
+    # Base rows followed by delta rows
+    columns: _Columns
+
+
+class FuzzyScores:
+    """Similarities of one query, tied to the index state they were computed on."""
+
+    def __init__(self, index: "FuzzyIndex", state: _State, similarities: np.ndarray):
+        self._index = index
+        self._state = state
+        self.similarities = similarities
+
+    def top(
+        self,
+        limit: int,
+        category: Optional[str] = None,
+        severity: Optional[str] = None,
+        is_active: Optional[bool] = None,
+    ) -> List[Tuple[int, float]]:
+        """Best (code id, similarity) pairs among codes matching the filters."""
+        similarities, columns = self.similarities, self._state.columns
+        mask = similarities > 0
+        if category:
+            mask &= columns.categories == category
+        if severity:
+            mask &= columns.severities == severity
+        if is_active is not None:
+            mask &= columns.active == is_active
+        candidates = np.flatnonzero(mask)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-similarities[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-similarities[candidates], kind="stable")]
+        return [(int(columns.ids[slot]), float(similarities[slot])) for slot in candidates]
+
+    def of(self, code_id: int) -> float:
+        """Similarity of one code (0 if it is not indexed)."""
+        state = self._state
+        slot = state.delta_slots.get(code_id)
+        if slot is not None:
+            slot += len(state.live)
+        else:
+            slot = self._index.base_slots.get(code_id)
+            if slot is None or not state.live[slot]:
+                return 0.0
+        return float(self.similarities[slot])
+
+
+class FuzzyIndex(CatalogIndex):
+    """
+    Trigram arrays for one organization's catalog, refreshed from code_changes.
+
+    Changed codes are masked out of the base arrays and their current rows
+    kept in a delta index, rebuilt (small) on every refresh. The registry
+    rebuilds everything once the delta or the masked rows grow too large.
+    """
+
+    def __init__(self, rows: List[Row], organization_id: Optional[int] = None, cursor: Cursor = START):
+        self.organization_id = organization_id
+        # Last code change reflected in the index
+        self.cursor = cursor
+        self.base = _TrigramArrays(rows)
+        self.base_columns = _Columns.of(rows)
+        self.base_slots: Dict[int, int] = {row[0]: slot for slot, row in enumerate(rows)}
+        self._state = self._make_state(np.ones(len(rows), dtype=bool), ())
+
+    @classmethod
+    def build(cls, db: Session, organization_id: Optional[int] = None) -> "FuzzyIndex":
+        # Read the cursor first: changes racing with the load are re-applied
+        cursor = latest_change_cursor(db, organization_id)
+        return cls(cls._load(db, organization_id), organization_id, cursor)
+
+    @staticmethod
+    def _load(db: Session, organization_id: Optional[int], code_ids: Optional[List[int]] = None) -> List[Row]:
+        query = db.query(
+            DiagnosticCode.id,
+            DiagnosticCode.code,
+            DiagnosticCode.description,
+            DiagnosticCode.category,
+            DiagnosticCode.severity,
+            DiagnosticCode.is_active,
+        )
+        if organization_id is not None:
+            query = query.filter(DiagnosticCode.organization_id == organization_id)
+        if code_ids is not None:
+            query = query.filter(DiagnosticCode.id.in_(code_ids))
+        return [tuple(row) for row in query]
+
+    def _make_state(self, live: np.ndarray, delta_rows: Tuple[Row, ...]) -> _State:
+        delta_columns = _Columns.of(list(delta_rows))
+        return _State(
+            live=live,
+            delta=_TrigramArrays(list(delta_rows)),
+            delta_rows=delta_rows,
+            delta_slots={row[0]: slot for slot, row in enumerate(delta_rows)},
+            columns=_Columns(*(
+                np.concatenate([base, delta]) for base, delta in zip(self.base_columns, delta_columns)
+            )),
+        )
+
+    def __len__(self):
+        state = self._state
+        return int(state.live.sum()) + len(state.delta_rows)
+
+    def refresh(self, db: Session) -> bool:
+        """Apply code_changes recorded since the index was last refreshed."""
+        changes, self.behind = changes_after(db, self.organization_id, self.cursor, MAX_INCREMENTAL_CHANGES + 1)
+        if len(changes) > MAX_INCREMENTAL_CHANGES:
+            return False
+        if not changes:
+            return True
+
+        state = self._state
+        changed_ids = {change.diagnostic_code_id for change in changes}
+        # Current rows of the changed codes; deleted ones are simply absent
+        delta_rows = tuple(row for row in state.delta_rows if row[0] not in changed_ids) + tuple(
+            self._load(db, self.organization_id, list(changed_ids))
+        )
+        if len(delta_rows) > MAX_INCREMENTAL_CHANGES:
+            return False
+        live = state.live.copy()
+        live[[self.base_slots[code_id] for code_id in changed_ids if code_id in self.base_slots]] = False
+
+        self._state = self._make_state(live, delta_rows)
+        self.cursor = changes[-1].cursor
+        return True
+
+    def score(self, query: str) -> FuzzyScores:
+        """Similarity of every indexed code to the query."""
+        state = self._state
+        similarities = np.concatenate([
+            np.where(state.live, self.base.similarities(query), 0.0) if self.base.size else np.zeros(0),
+            state.delta.similarities(query),
+        ])
+        return FuzzyScores(self, state, similarities)
+
+
+# Global registry instance
+fuzzy_indexes = CatalogIndexRegistry(FuzzyIndex)
@@ -0,0 +1,177 @@
+"""
+Cache of LLM responses for AI search and symptom suggestions.
+
+Responses are stored under the normalized query within a scope: the prompt
+kind, the organization, its catalog version and the model name. A new
+catalog version or model therefore never reuses old answers. Values live in
+Redis (shared by workers) or, without Redis, in an in-process LRU.
+
+Clinical queries are often rephrased ("chest pain radiating to left arm" /
+"chest pain radiating to the left arm"). When AI_CACHE_SIMILARITY is set,
+an exact miss is embedded and compared with the queries already answered in
+its scope, and a close enough neighbour's response is reused. Embeddings
+barely move when one word flips the meaning ("type 1" / "type 2", "fever" /
+"no fever"), so a neighbour must also have the same negations, numbers and
+code-like tokens. Matching is off by default. The neighbour index is per
+process, so near-duplicates are matched against what this worker has seen.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.cache import LocalCache, cache
+from app.core.config import settings
+from app.services.diagnostic_code_service import DiagnosticCodeService
+from app.services.search_cache import normalize_query
+from app.services.semantic_search import get_embedder
+
+# Queries remembered per scope for near-duplicate matching, and scopes kept
+MAX_NEIGHBORS = 512
+MAX_SCOPES = 256
+
+_TOKEN_RE = re.compile(r"\w+(?:\.\w+)*")
+# Words that negate or qualify a finding, and numerals written as words
+_NEGATIONS = frozenset({"no", "not", "non", "without", "denies", "denied", "negative", "absent", "never", "none", "nor"})
+_NUMERALS = frozenset({"i", "ii", "iii", "iv", "v", "vi", "one", "two", "three", "first", "second", "third"})
+
+
+def decisive_terms(query: str) -> List[str]:
+    """Negations, numbers and code-like tokens (e.g. "e11.9") of a normalized query, sorted."""
+    return sorted(
+        token for token in _TOKEN_RE.findall(query)
+        if token in _NEGATIONS or token in _NUMERALS or any(char.isdigit() for char in token)
+    )
+
+
+class _NeighborIndex:
+    """Embeddings of the queries answered in one scope (oldest dropped first)."""
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+        # Swapped as one tuple so readers never see queries and vectors out of step
+        self._rows: Tuple[List[str], np.ndarray] = ([], np.zeros((0, dimensions), dtype=np.float32))
+
+    def add(self, query: str, vector: np.ndarray) -> None:
+        queries, vectors = self._rows
+        if query in queries:
+            return
+        self._rows = (
+            (queries + [query])[-MAX_NEIGHBORS:],
+            np.vstack([vectors, vector[None, :]])[-MAX_NEIGHBORS:],
+        )
+
+    def nearest(self, vector: np.ndarray) -> Optional[Tuple[str, float]]:
+        queries, vectors = self._rows
+        if not queries:
+            return None
+        scores = vectors @ vector
+        best = int(np.argmax(scores))
+        return queries[best], float(scores[best])
+
+
+class LLMResponseCache:
+    """Exact and near-duplicate lookup of cached LLM response texts."""
+
+    def __init__(self, similarity: Optional[float] = None):
+        self.similarity = settings.AI_CACHE_SIMILARITY if similarity is None else similarity
+        # Fallback store when Redis is unavailable
+        self._local = LocalCache(settings.AI_CACHE_LOCAL_SIZE, settings.AI_CACHE_TTL)
+        self._neighbors: "OrderedDict[str, _NeighborIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "near_hits": 0, "misses": 0}
+
+    @staticmethod
+    def model_name(model: Any) -> str:
+        return getattr(model, "model_name", None) or type(model).__name__
+
+    async def scope(self, kind: str, organization_id: Optional[int], model: Any, *extra: Any) -> str:
+        """Scope of a prompt: kind, organization, catalog version, model (and any extra inputs)."""
+        version = await cache.aget_generation(DiagnosticCodeService.catalog_tag(organization_id))
+        scope = f"{kind}:{organization_id}:g{version}:{self.model_name(model)}"
+        if extra:
+            scope += ":" + hashlib.sha1(repr(extra).encode()).hexdigest()[:16]
+        return scope
+
+    @staticmethod
+    def _key(scope: str, query: str) -> str:
+        return f"llm:{scope}:" + hashlib.sha1(query.encode()).hexdigest()
+
+    async def _load(self, key: str) -> Optional[str]:
+        if cache.aredis is not None:
+            return await cache.aget(key)
+        value = self._local.get(key)
+        return value if isinstance(value, str) else None
+
+    def _neighbor_index(self, scope: str, dimensions: int) -> _NeighborIndex:
+        with self._lock:
+            index = self._neighbors.get(scope)
+            if index is None or index.dimensions != dimensions:
+                index = self._neighbors[scope] = _NeighborIndex(dimensions)
+            self._neighbors.move_to_end(scope)
+            while len(self._neighbors) > MAX_SCOPES:
+                self._neighbors.popitem(last=False)
+            return index
+
+    def _near_duplicate(self, scope: str, query: str) -> Optional[str]:
+        """An answered query in the scope that means the same as this one, if any."""
+        with self._lock:
+            index = self._neighbors.get(scope)
+        if index is None:
+            return None
+        vector = get_embedder().embed([query])[0]
+        if index.dimensions != len(vector):
+            return None
+        match = index.nearest(vector)
+        if match is None or match[1] < self.similarity:
+            return None
+        if decisive_terms(match[0]) != decisive_terms(query):
+            return None
+        return match[0]
+
+    async def get(self, scope: str, query: str) -> Optional[str]:
+        """Cached response for the query, or for a near-duplicate query in the scope."""
+        query = normalize_query(query)
+        text = await self._load(self._key(scope, query))
+        if text is not None:
+            self._stats["hits"] += 1
+            return text
+
+        neighbor = self._near_duplicate(scope, query) if self.similarity > 0 else None
+        if neighbor is not None:
+            text = await self._load(self._key(scope, neighbor))
+            if text is not None:
+                self._stats["near_hits"] += 1
+                return text
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, scope: str, query: str, text: str) -> None:
+        query = normalize_query(query)
+        key = self._key(scope, query)
+        if cache.aredis is not None:
+            await cache.aset(key, text, ttl=settings.AI_CACHE_TTL)
+        else:
+            self._local.set(key, text)
+        if self.similarity > 0:
+            vector = get_embedder().embed([query])[0]
+            self._neighbor_index(scope, len(vector)).add(query, vector)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = sum(self._stats.values())
+        hits = self._stats["hits"] + self._stats["near_hits"]
+        return {**self._stats, "hit_ratio": round(hits / lookups, 4) if lookups else None}
+
+    def clear(self) -> None:
+        """Forget local entries and neighbour indexes (Redis entries expire on their own)."""
+        self._local.clear()
+        with self._lock:
+            self._neighbors.clear()
+        self._stats = {"hits": 0, "near_hits": 0, "misses": 0}
+
+
+# Global LLM response cache instance
+llm_cache = LLMResponseCache()
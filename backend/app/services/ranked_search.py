@@ -0,0 +1,198 @@
+"""
+BM25 ranked search over the code catalog.
+
+An in-process inverted index per organization: each term maps to compact
+arrays of (document slot, weighted term frequency). Queries accumulate BM25
+scores over the postings of their terms and keep the top k with a heap, so
+ranking no longer depends on which rows SQL happened to return first.
+"""
+import heapq
+import math
+from array import array
+from collections import Counter, namedtuple
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.code_change import Cursor, changes_after, latest_change_cursor
+from app.models.diagnostic_code import DiagnosticCode
+from app.services.catalog_index import MAX_INCREMENTAL_CHANGES, CatalogIndex, CatalogIndexRegistry, tokenize
+
+SearchDoc = namedtuple(
+    "SearchDoc",
+    ("id", "code", "description", "category", "subcategory", "severity", "is_active"),
+)
+
+# Term frequency weights per field (a simple BM25F): code hits matter most
+FIELD_WEIGHTS = (("code", 3.0), ("category", 1.0), ("subcategory", 1.0), ("description", 1.0))
+
+
+def _doc_terms(doc: SearchDoc) -> Counter:
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for token in tokenize(getattr(doc, field)):
+            terms[token] += weight
+    # The whole code too, so "E11.9" matches as one term
+    terms[doc.code.lower()] += FIELD_WEIGHTS[0][1]
+    return terms
+
+
+def query_terms(query: str) -> List[str]:
+    """Distinct terms of a query, including the whole query if it is one word."""
+    terms = tokenize(query)
+    whole = query.strip().lower()
+    if whole and " " not in whole:
+        terms.append(whole)
+    return list(dict.fromkeys(terms))
+
+
+class BM25Index(CatalogIndex):
+    """
+    Inverted index with BM25 scoring, updated incrementally from code_changes.
+
+    Documents live in append-only slots. Updates and deletes tombstone the
+    old slot (its postings are skipped) and updates append a new one; once
+    tombstones outnumber live documents the registry rebuilds the index.
+
+    refresh() edits the index in place while other threads search it, so
+    a slot's length is written before its postings, and search() reads each
+    document once, keeping what it read even if the slot is tombstoned later.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, organization_id: Optional[int], cursor: Cursor):
+        self.organization_id = organization_id
+        # Last code change reflected in the index
+        self.cursor = cursor
+        self.docs: List[Optional[SearchDoc]] = []
+        self.lengths = array("f")
+        self.slots: Dict[int, int] = {}
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.df: Counter = Counter()
+        self.total_length = 0.0
+
+    @classmethod
+    def build(cls, db: Session, organization_id: Optional[int] = None) -> "BM25Index":
+        # Read the cursor first: changes racing with the load are re-applied
+        # on the next refresh, which is harmless because upserts replace
+        index = cls(organization_id, latest_change_cursor(db, organization_id))
+        for doc in cls._load(db, organization_id):
+            index._add(doc)
+        return index
+
+    @staticmethod
+    def _load(db: Session, organization_id: Optional[int], code_ids: Optional[List[int]] = None):
+        query = db.query(
+            DiagnosticCode.id,
+            DiagnosticCode.code,
+            DiagnosticCode.description,
+            DiagnosticCode.category,
+            DiagnosticCode.subcategory,
+            DiagnosticCode.severity,
+            DiagnosticCode.is_active,
+        )
+        if organization_id is not None:
+            query = query.filter(DiagnosticCode.organization_id == organization_id)
+        if code_ids is not None:
+            query = query.filter(DiagnosticCode.id.in_(code_ids))
+        return [SearchDoc(*row) for row in query]
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _add(self, doc: SearchDoc) -> None:
+        slot = len(self.docs)
+        terms = _doc_terms(doc)
+        length = sum(terms.values())
+        # Document and length first: a concurrent search may meet the postings at once
+        self.docs.append(doc)
+        self.lengths.append(length)
+        self.total_length += length
+        self.slots[doc.id] = slot
+        for term, frequency in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = (array("I"), array("f"))
+            postings[0].append(slot)
+            postings[1].append(frequency)
+            self.df[term] += 1
+
+    def _remove(self, code_id: int) -> None:
+        slot = self.slots.pop(code_id, None)
+        if slot is None:
+            return
+        doc = self.docs[slot]
+        self.docs[slot] = None
+        for term in _doc_terms(doc):
+            self.df[term] -= 1
+        self.total_length -= self.lengths[slot]
+
+    def refresh(self, db: Session) -> bool:
+        """Apply code_changes recorded since the index was last refreshed."""
+        changes, self.behind = changes_after(db, self.organization_id, self.cursor, MAX_INCREMENTAL_CHANGES + 1)
+        if len(changes) > MAX_INCREMENTAL_CHANGES:
+            return False
+        if not changes:
+            return True
+        if len(self.docs) - len(self.slots) > len(self.slots):
+            return False
+
+        changed_ids = list({change.diagnostic_code_id for change in changes})
+        for code_id in changed_ids:
+            self._remove(code_id)
+        # Current rows of the changed codes; deleted ones are simply absent
+        for doc in self._load(db, self.organization_id, changed_ids):
+            self._add(doc)
+        self.cursor = changes[-1].cursor
+        return True
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        category: Optional[str] = None,
+        severity: Optional[str] = None,
+        is_active: Optional[bool] = None,
+    ) -> List[Tuple[SearchDoc, float]]:
+        """Top `limit` (document, BM25 score) pairs matching the filters."""
+        total = len(self.slots)
+        if not total:
+            return []
+        average_length = self.total_length / total
+        k1, b = self.k1, self.b
+        docs, lengths = self.docs, self.lengths
+
+        scores: Dict[int, float] = {}
+        found: Dict[int, SearchDoc] = {}
+        for term in query_terms(query):
+            postings = self.postings.get(term)
+            df = self.df.get(term, 0)
+            if postings is None or df <= 0:
+                continue
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for slot, frequency in zip(*postings):
+                doc = docs[slot]
+                if doc is None:
+                    continue
+                found[slot] = doc
+                norm = k1 * (1 - b + b * lengths[slot] / average_length)
+                scores[slot] = scores.get(slot, 0.0) + idf * frequency * (k1 + 1) / (frequency + norm)
+
+        def matches(doc: SearchDoc) -> bool:
+            return (
+                (not category or doc.category == category)
+                and (not severity or doc.severity == severity)
+                and (is_active is None or doc.is_active == is_active)
+            )
+
+        return heapq.nlargest(
+            limit,
+            ((found[slot], score) for slot, score in scores.items() if matches(found[slot])),
+            key=lambda item: item[1],
+        )
+
+
+# Global registry instance
+ranked_indexes = CatalogIndexRegistry(BM25Index)
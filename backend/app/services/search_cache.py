@@ -0,0 +1,78 @@
+"""
+Search result cache.
+
+The same popular queries ("diabetes", "hypertension") reach /search/advanced
+and /search/autocomplete over and over. Their encoded responses are cached
+under the normalized query, the filters, the organization and its catalog
+version. Code writes bump the version, so a write makes every cached result
+for that organization unreachable at once; the old entries just expire.
+"""
+import hashlib
+import json
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.cache import cache
+from app.core.config import settings
+from app.services.diagnostic_code_service import DiagnosticCodeService
+
+# Per-endpoint TTL setting names
+_TTL_SETTINGS = {
+    "advanced": "SEARCH_CACHE_TTL",
+    "autocomplete": "AUTOCOMPLETE_CACHE_TTL",
+}
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query (search is case-insensitive)."""
+    return " ".join(query.lower().split())
+
+
+class SearchResultCache:
+    """Encoded search responses in the shared cache, with hit counters per endpoint."""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, int]] = {
+            endpoint: {"hits": 0, "misses": 0} for endpoint in _TTL_SETTINGS
+        }
+
+    @staticmethod
+    def ttl(endpoint: str) -> int:
+        return getattr(settings, _TTL_SETTINGS[endpoint])
+
+    async def key(self, endpoint: str, organization_id: Optional[int], params: Dict[str, Any]) -> str:
+        """Cache key for a search: endpoint + org + catalog version + normalized params."""
+        version = await cache.aget_generation(DiagnosticCodeService.catalog_tag(organization_id))
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        return f"search:{endpoint}:{organization_id}:g{version}:{digest}"
+
+    async def get(
+        self, endpoint: str, organization_id: Optional[int], params: Dict[str, Any]
+    ) -> Tuple[str, Optional[bytes]]:
+        """(key, cached body or None); pass the key to set() on a miss."""
+        key = await self.key(endpoint, organization_id, params)
+        body = await cache.aget_bytes(key)
+        self._stats[endpoint]["hits" if body is not None else "misses"] += 1
+        return key, body
+
+    async def set(self, endpoint: str, key: str, body: bytes) -> bool:
+        return await cache.aset_bytes(key, body, ttl=self.ttl(endpoint))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and hit ratio per endpoint."""
+        stats: Dict[str, Any] = {}
+        for endpoint, counters in self._stats.items():
+            lookups = counters["hits"] + counters["misses"]
+            stats[endpoint] = {
+                **counters,
+                "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else None,
+                "ttl": self.ttl(endpoint),
+            }
+        return stats
+
+    def reset_stats(self) -> None:
+        for counters in self._stats.values():
+            counters.update(hits=0, misses=0)
+
+
+# Global search cache instance
+search_cache = SearchResultCache()
@@ -0,0 +1,112 @@
+"""
+Buffered search history writer.
+
+Recording a search used to cost several queries and commits inside the
+search request. Instead, requests drop (user, query) pairs into an
+in-memory buffer and a background thread writes them in batches: repeated
+searches are coalesced in the buffer and each batch is one insert plus one
+set-based trim.
+"""
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.services.search_service import SearchService
+
+
+class SearchHistoryWriter:
+    """Collects searches and writes them to recent_searches in the background."""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        flush_interval: Optional[float] = None,
+        max_pending: int = 1000,
+    ):
+        self._session_factory = session_factory
+        self.flush_interval = (
+            settings.SEARCH_HISTORY_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        )
+        # Flush early once this many distinct searches are waiting
+        self.max_pending = max_pending
+        # (user_id, query) -> time of the latest search, in first-seen order
+        self._pending: Dict[Tuple[int, str], datetime] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="search-history-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the writer thread and write whatever is still buffered."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def record(self, user_id: int, query: str) -> bool:
+        """
+        Buffer a search for the background writer.
+
+        Returns False when the writer is not running; callers then write the
+        search themselves.
+        """
+        if not self.running:
+            return False
+        key = (user_id, query)
+        with self._lock:
+            # Re-insert so a repeated search moves to the end (newest)
+            self._pending.pop(key, None)
+            self._pending[key] = datetime.utcnow()
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+        return True
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> int:
+        """Write all buffered searches; returns how many were written."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        db = self._session_factory()
+        try:
+            SearchService(db).record_searches(
+                [(user_id, query, searched_at) for (user_id, query), searched_at in batch.items()]
+            )
+        except Exception as e:
+            # History is best effort: drop the batch rather than retry forever
+            db.rollback()
+            print(f"Search history flush failed: {e}")
+            return 0
+        finally:
+            db.close()
+        return len(batch)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+# Global writer instance
+search_history = SearchHistoryWriter()
@@ -1,13 +1,20 @@
 """
 Advanced search service with autocomplete and fuzzy matching.
 """
-from typing import List, Optional, Dict, Any
-from sqlalchemy import func, or_, and_, desc
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional, Dict, Any, Tuple
+from sqlalchemy import func, or_, and_, desc, literal, select, insert, delete
 from sqlalchemy.orm import Session
-from difflib import SequenceMatcher
 
+from app.core.config import settings
+from app.db.database import is_postgresql
 from app.models.diagnostic_code import DiagnosticCode
 from app.models.search import RecentSearch, SavedSearch
+from app.services.catalog_index import catalog_indexes
+from app.services.fuzzy_scoring import fuzzy_indexes
+from app.services.ranked_search import ranked_indexes
 from app.schemas.search import (
     SearchSuggestion,
     SearchResult,
@@ -15,45 +22,41 @@ from app.schemas.search import (
 )
 
 
+@lru_cache(maxsize=512)
+def compile_highlighter(query: str) -> Optional[re.Pattern]:
+    """
+    One case-insensitive matcher for all terms of a query, compiled once.
+    
+    Longer terms come first in the alternation so they win over their own
+    prefixes; the regex engine then finds every term in a single pass.
+    """
+    terms = sorted({term for term in query.split() if term}, key=len, reverse=True)
+    if not terms:
+        return None
+    return re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+
+
 class SearchService:
     """Service for advanced search operations."""
 
     def __init__(self, db: Session):
         self.db = db
 
-    def get_autocomplete_suggestions(self, query: str, limit: int = 10) -> List[SearchSuggestion]:
+    def get_autocomplete_suggestions(
+        self, query: str, limit: int = 10, organization_id: Optional[int] = None
+    ) -> List[SearchSuggestion]:
         """Get autocomplete suggestions based on partial query."""
-        query_lower = query.lower()
-        
-        # Search in code, description, and category
-        results = self.db.query(DiagnosticCode).filter(
-            and_(
-                DiagnosticCode.is_active == True,
-                or_(
-                    func.lower(DiagnosticCode.code).like(f"{query_lower}%"),
-                    func.lower(DiagnosticCode.description).like(f"%{query_lower}%"),
-                    func.lower(DiagnosticCode.category).like(f"{query_lower}%")
-                )
-            )
-        ).limit(limit).all()
-        
-        suggestions = []
-        for code in results:
-            # Determine match type
-            match_type = "description"
-            if code.code.lower().startswith(query_lower):
-                match_type = "code"
-            elif code.category.lower().startswith(query_lower):
-                match_type = "category"
-            
-            suggestions.append(SearchSuggestion(
-                code=code.code,
-                description=code.description,
-                category=code.category,
+        # Served from the in-process prefix index; no per-keystroke table scan
+        index = catalog_indexes.get(self.db, organization_id)
+        return [
+            SearchSuggestion(
+                code=code,
+                description=description,
+                category=category,
                 match_type=match_type
-            ))
-        
-        return suggestions
+            )
+            for (code, description, category), match_type in index.suggest(query, limit)
+        ]
 
     def advanced_search(
         self,
@@ -63,9 +66,25 @@ class SearchService:
         category: Optional[str] = None,
         severity: Optional[str] = None,
         is_active: Optional[bool] = None,
-        limit: int = 20
+        limit: int = 20,
+        mode: str = "default",
+        organization_id: Optional[int] = None,
     ) -> List[SearchResult]:
-        """Advanced search with fuzzy matching and highlighting."""
+        """
+        Advanced search with fuzzy matching and highlighting.
+        
+        mode="ranked" scores the whole catalog with BM25 from the in-process
+        index instead of re-ranking a limited set of SQL matches.
+        """
+        if mode == "ranked":
+            index = ranked_indexes.get(self.db, organization_id)
+            return [
+                self._to_result(doc, score, query, highlight)
+                for doc, score in index.search(
+                    query, limit, category=category, severity=severity, is_active=is_active
+                )
+            ]
+        
         query_lower = query.lower()
         
         # Build base query
@@ -79,45 +98,106 @@ class SearchService:
             filters.append(DiagnosticCode.severity == severity)
         if is_active is not None:
             filters.append(DiagnosticCode.is_active == is_active)
+        if organization_id is not None:
+            filters.append(DiagnosticCode.organization_id == organization_id)
         
         if filters:
             db_query = db_query.filter(and_(*filters))
         
-        # Search condition
+        # Search condition (trigram-indexed on PostgreSQL)
         search_filter = or_(
-            func.lower(DiagnosticCode.code).like(f"%{query_lower}%"),
-            func.lower(DiagnosticCode.description).like(f"%{query_lower}%")
+            DiagnosticCode.code.ilike(f"%{query}%"),
+            DiagnosticCode.description.ilike(f"%{query}%")
         )
         
-        results = db_query.filter(search_filter).limit(limit * 2).all()  # Get more for fuzzy ranking
-        
-        # Calculate relevance scores and apply fuzzy matching
-        scored_results = []
-        for code in results:
-            score = self._calculate_relevance(code, query_lower, fuzzy)
-            
-            result = SearchResult(
-                id=code.id,
-                code=code.code,
-                description=code.description,
-                category=code.category,
-                severity=code.severity,
-                is_active=code.is_active,
-                relevance_score=score
+        if fuzzy:
+            candidates = self._fuzzy_candidates(
+                db_query, search_filter, query, limit * 2,
+                category=category, severity=severity, is_active=is_active, organization_id=organization_id,
             )
-            
-            # Add highlighting
-            if highlight:
-                result.highlighted_code = self._highlight_text(code.code, query)
-                result.highlighted_description = self._highlight_text(code.description, query)
-            
-            scored_results.append(result)
+        else:
+            candidates = [(code, 0.0) for code in db_query.filter(search_filter).limit(limit * 2).all()]
+        
+        # Calculate relevance scores
+        scored_results = [
+            self._to_result(code, self._calculate_relevance(code, query_lower, similarity), query, highlight)
+            for code, similarity in candidates
+        ]
         
         # Sort by relevance and limit
         scored_results.sort(key=lambda x: x.relevance_score, reverse=True)
         return scored_results[:limit]
 
-    def _calculate_relevance(self, code: DiagnosticCode, query: str, fuzzy: bool) -> float:
+    def _to_result(self, code, score: float, query: str, highlight: bool) -> SearchResult:
+        """Build a search result from a code row (ORM object or index document)."""
+        result = SearchResult(
+            id=code.id,
+            code=code.code,
+            description=code.description,
+            category=code.category,
+            severity=code.severity,
+            is_active=code.is_active,
+            relevance_score=score
+        )
+        
+        # Add highlighting
+        if highlight:
+            result.highlighted_code = self._highlight_text(code.code, query)
+            result.highlighted_description = self._highlight_text(code.description, query)
+        
+        return result
+
+    def _fuzzy_candidates(
+        self,
+        db_query,
+        search_filter,
+        query: str,
+        limit: int,
+        category: Optional[str] = None,
+        severity: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        organization_id: Optional[int] = None,
+    ) -> List[Tuple[DiagnosticCode, float]]:
+        """
+        Typo-tolerant candidates with their trigram similarity, best first.
+        
+        On PostgreSQL, pg_trgm retrieves and ranks them in the database: the
+        % and <% operators use the GIN trigram indexes, so misspelled queries
+        still find their codes. Elsewhere the whole catalog is scored at once
+        by the vectorized in-process FuzzyIndex.
+        """
+        if is_postgresql(self.db):
+            similarity = func.greatest(
+                func.similarity(DiagnosticCode.code, query),
+                func.word_similarity(query, DiagnosticCode.description),
+            ).label("similarity")
+            return db_query.add_columns(similarity).filter(
+                or_(
+                    search_filter,
+                    DiagnosticCode.code.op("%")(query),
+                    literal(query).op("<%")(DiagnosticCode.description),
+                )
+            ).order_by(similarity.desc()).limit(limit).all()
+        
+        scores = fuzzy_indexes.get(self.db, organization_id).score(query)
+        
+        # Literal substring matches always qualify, whatever their similarity
+        rows = {code.id: code for code in db_query.filter(search_filter).limit(limit).all()}
+        fuzzy_ids = [
+            code_id for code_id, _ in scores.top(limit, category=category, severity=severity, is_active=is_active)
+            if code_id not in rows
+        ]
+        if fuzzy_ids:
+            rows.update(
+                (code.id, code)
+                for code in self.db.query(DiagnosticCode).filter(DiagnosticCode.id.in_(fuzzy_ids))
+            )
+        
+        scored = [(code, scores.of(code.id)) for code in rows.values()]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+    def _calculate_relevance(self, code: DiagnosticCode, query: str, similarity: float = 0.0) -> float:
         """Calculate relevance score for search result."""
         score = 0.0
         
@@ -138,11 +218,8 @@ class SearchService:
             position = desc_lower.find(query)
             score += 20.0 / (position + 1)
         
-        # Fuzzy matching
-        if fuzzy:
-            code_similarity = SequenceMatcher(None, query, code_lower).ratio()
-            desc_similarity = SequenceMatcher(None, query, desc_lower).ratio()
-            score += (code_similarity * 10.0) + (desc_similarity * 5.0)
+        # Fuzzy matching (trigram similarity, 0..1)
+        score += similarity * 15.0
         
         return score
 
@@ -152,42 +229,69 @@ class SearchService:
             return text
         
         # Case-insensitive replacement with <mark> tags
-        import re
-        pattern = re.compile(re.escape(query), re.IGNORECASE)
-        return pattern.sub(lambda m: f"<mark>{m.group(0)}</mark>", text)
+        pattern = compile_highlighter(query)
+        if pattern is None:
+            return text
+        return pattern.sub(r"<mark>\g<0></mark>", text)
 
     def track_search(self, user_id: int, query: str):
         """Track a user's search query."""
-        # Check if same query exists recently (within last 10 searches)
-        recent = self.db.query(RecentSearch).filter(
-            RecentSearch.user_id == user_id
-        ).order_by(desc(RecentSearch.created_at)).limit(10).all()
-        
-        # Don't duplicate if same query is in recent searches
-        if not any(s.query == query for s in recent):
-            search = RecentSearch(user_id=user_id, query=query)
-            self.db.add(search)
-            self.db.commit()
-        
-        # Keep only last 50 searches
-        total = self.db.query(func.count(RecentSearch.id)).filter(
-            RecentSearch.user_id == user_id
-        ).scalar()
+        self.record_searches([(user_id, query, datetime.utcnow())])
+
+    def _recent_ranked(self, user_ids):
+        """Recent searches of the given users, numbered newest first per user."""
+        return select(
+            RecentSearch.id,
+            RecentSearch.user_id,
+            RecentSearch.query,
+            func.row_number().over(
+                partition_by=RecentSearch.user_id,
+                order_by=(desc(RecentSearch.created_at), desc(RecentSearch.id)),
+            ).label("position"),
+        ).where(RecentSearch.user_id.in_(user_ids)).subquery()
+
+    def record_searches(self, searches: List[Tuple[int, str, datetime]]) -> int:
+        """
+        Write a batch of (user_id, query, searched_at) searches, oldest first.
         
-        if total > 50:
-            old_searches = self.db.query(RecentSearch).filter(
-                RecentSearch.user_id == user_id
-            ).order_by(RecentSearch.created_at).limit(total - 50).all()
-            
-            for s in old_searches:
-                self.db.delete(s)
-            self.db.commit()
+        Queries already among a user's last 10 searches are skipped, and each
+        user's history is trimmed to SEARCH_HISTORY_LIMIT with one DELETE.
+        Returns the number of rows inserted.
+        """
+        if not searches:
+            return 0
+        user_ids = {user_id for user_id, _, _ in searches}
+
+        ranked = self._recent_ranked(user_ids)
+        recent = set(
+            self.db.execute(
+                select(ranked.c.user_id, ranked.c.query).where(ranked.c.position <= 10)
+            ).all()
+        )
+        rows = []
+        for user_id, query, searched_at in searches:
+            if (user_id, query) not in recent:
+                recent.add((user_id, query))
+                rows.append({"user_id": user_id, "query": query, "created_at": searched_at})
+        if rows:
+            self.db.execute(insert(RecentSearch), rows)
+
+        ranked = self._recent_ranked(user_ids)
+        self.db.execute(
+            delete(RecentSearch).where(
+                RecentSearch.id.in_(
+                    select(ranked.c.id).where(ranked.c.position > settings.SEARCH_HISTORY_LIMIT)
+                )
+            ).execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        return len(rows)
 
     def get_recent_searches(self, user_id: int, limit: int = 10) -> List[RecentSearch]:
         """Get user's recent searches."""
         return self.db.query(RecentSearch).filter(
             RecentSearch.user_id == user_id
-        ).order_by(desc(RecentSearch.created_at)).limit(limit).all()
+        ).order_by(desc(RecentSearch.created_at), desc(RecentSearch.id)).limit(limit).all()
 
     def clear_recent_searches(self, user_id: int):
         """Clear all recent searches for a user."""
@@ -0,0 +1,256 @@
+"""
+Semantic retrieval over the code catalog.
+
+Every code is embedded once into a row of a NumPy matrix kept per
+organization; a query is embedded the same way and the top k codes by
+cosine similarity are one matrix-vector product away. AI search retrieves
+its candidates here instead of handing the LLM an arbitrary slice of the
+catalog.
+
+The index also keeps a compact one-line description of every code, so AI
+prompts are assembled from memory instead of re-querying and re-serializing
+rows per request.
+
+Embeddings come from a local sentence-transformers model when
+SEMANTIC_EMBEDDING_MODEL names one, and otherwise from a deterministic
+hashing vectorizer that needs no model files (and keeps tests offline).
+"""
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.code_change import Cursor, changes_after, latest_change_cursor
+from app.models.diagnostic_code import DiagnosticCode
+from app.services.catalog_index import MAX_INCREMENTAL_CHANGES, CatalogIndex, CatalogIndexRegistry
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # pragma: no cover - optional dependency
+    SentenceTransformer = None
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+# Words that carry no meaning in a clinical query ("pain in the chest")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in is it of on or the to with without".split()
+)
+
+# Rows embedded per call while building an index
+EMBED_BATCH_SIZE = 256
+
+
+class Embedder:
+    """Turns texts into L2-normalized vectors (one row per text)."""
+
+    name = "base"
+    dimensions = 0
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """
+    Feature hashing of words and character n-grams into a fixed-size vector.
+
+    Deterministic and dependency-free. Character n-grams let inflections
+    match ("diabetic" / "diabetes"); it knows nothing of synonyms, which is
+    what a real embedding model (or the LLM re-rank) adds.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimensions: int = 512, ngram: int = 4):
+        self.dimensions = dimensions
+        self.ngram = ngram
+
+    def _features(self, text: str) -> Counter:
+        features = Counter()
+        for word in _WORD_RE.findall(text.lower()):
+            if word in STOP_WORDS:
+                continue
+            features["w:" + word] += 1.0
+            padded = f"<{word}>"
+            for i in range(max(len(padded) - self.ngram + 1, 1)):
+                features["g:" + padded[i:i + self.ngram]] += 0.5
+        return features
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text).items():
+                digest = zlib.crc32(feature.encode())
+                # Low bits pick the column, the top bit the sign (limits collision bias)
+                sign = -1.0 if digest & 0x80000000 else 1.0
+                vectors[row, digest % self.dimensions] += sign * weight
+        return _normalize(vectors)
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """A local sentence-transformers model (e.g. all-MiniLM-L6-v2)."""
+
+    def __init__(self, model_name: str):
+        self.name = model_name
+        self._model = SentenceTransformer(model_name)
+        self.dimensions = self._model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self._model.encode(list(texts), batch_size=EMBED_BATCH_SIZE, convert_to_numpy=True)
+        return _normalize(vectors.astype(np.float32, copy=False))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+_embedder: Optional[Embedder] = None
+
+
+def get_embedder() -> Embedder:
+    """The configured embedder, loaded once per process."""
+    global _embedder
+    if _embedder is None:
+        _embedder = HashingEmbedder(settings.SEMANTIC_HASH_DIMENSIONS)
+        model_name = settings.SEMANTIC_EMBEDDING_MODEL
+        if model_name:
+            if SentenceTransformer is None:
+                print("sentence-transformers is not installed; using the hashing embedder.")
+            else:
+                try:
+                    _embedder = SentenceTransformerEmbedder(model_name)
+                except Exception as e:
+                    print(f"Embedding model {model_name} failed to load: {e}. Using the hashing embedder.")
+    return _embedder
+
+
+def set_embedder(embedder: Optional[Embedder]) -> None:
+    """Swap the embedder (None = reload from settings); indexes must be cleared."""
+    global _embedder
+    _embedder = embedder
+
+
+def code_text(code: str, description: str, category: Optional[str], subcategory: Optional[str]) -> str:
+    """The text embedded for a code."""
+    return " ".join(part for part in (code, description, category, subcategory) if part)
+
+
+# Field order of context_line(), stated once at the top of a prompt's code list
+CONTEXT_HEADER = "code | description | category | subcategory | severity"
+
+
+def context_line(
+    code: str,
+    description: str,
+    category: Optional[str],
+    subcategory: Optional[str],
+    severity: Optional[str],
+) -> str:
+    """A code as one compact prompt line (fields as in CONTEXT_HEADER)."""
+    return " | ".join(" ".join((part or "").split()) for part in (code, description, category, subcategory, severity))
+
+
+class SemanticIndex(CatalogIndex):
+    """
+    Embedding matrix of one organization's active codes.
+
+    Row i of `vectors` embeds code `ids[i]`; `context` maps code ids to
+    (code, context_line). Refreshes re-embed only the codes changed since
+    `cursor` (see app.models.code_change) and swap in new arrays, so
+    concurrent searches always see a consistent pair.
+    """
+
+    def __init__(self, organization_id: Optional[int], cursor: Cursor, embedder: Embedder):
+        self.organization_id = organization_id
+        self.cursor = cursor
+        self.embedder = embedder
+        self._rows = (np.zeros(0, dtype=np.int64), np.zeros((0, embedder.dimensions), dtype=np.float32))
+        self.context: Dict[int, Tuple[str, str]] = {}
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._rows[0]
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._rows[1]
+
+    @classmethod
+    def build(cls, db: Session, organization_id: Optional[int] = None) -> "SemanticIndex":
+        index = cls(organization_id, latest_change_cursor(db, organization_id), get_embedder())
+        index._append(cls._load(db, organization_id))
+        return index
+
+    @staticmethod
+    def _load(db: Session, organization_id: Optional[int], code_ids: Optional[List[int]] = None):
+        query = db.query(
+            DiagnosticCode.id,
+            DiagnosticCode.code,
+            DiagnosticCode.description,
+            DiagnosticCode.category,
+            DiagnosticCode.subcategory,
+            DiagnosticCode.severity,
+        ).filter(DiagnosticCode.is_active == True)
+        if organization_id is not None:
+            query = query.filter(DiagnosticCode.organization_id == organization_id)
+        if code_ids is not None:
+            query = query.filter(DiagnosticCode.id.in_(code_ids))
+        return query.all()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _append(self, rows, keep: Optional[np.ndarray] = None) -> None:
+        """Embed and add rows, first dropping existing rows where keep is False."""
+        ids, vectors = self._rows
+        if keep is not None:
+            ids, vectors = ids[keep], vectors[keep]
+        blocks = [
+            self.embedder.embed([code_text(*row[1:5]) for row in rows[start:start + EMBED_BATCH_SIZE]])
+            for start in range(0, len(rows), EMBED_BATCH_SIZE)
+        ]
+        self._rows = (
+            np.concatenate([ids, np.array([row[0] for row in rows], dtype=np.int64)]),
+            np.concatenate([vectors, *blocks]),
+        )
+        for row in rows:
+            self.context[row[0]] = (row[1], context_line(*row[1:]))
+
+    def refresh(self, db: Session) -> bool:
+        """Re-embed codes changed since the index was last refreshed."""
+        if self.embedder is not get_embedder():
+            return False
+        changes, self.behind = changes_after(db, self.organization_id, self.cursor, MAX_INCREMENTAL_CHANGES + 1)
+        if len(changes) > MAX_INCREMENTAL_CHANGES:
+            return False
+        if not changes:
+            return True
+
+        changed_ids = list({change.diagnostic_code_id for change in changes})
+        for code_id in changed_ids:
+            self.context.pop(code_id, None)
+        # Current active rows of the changed codes; deleted ones are simply absent
+        self._append(self._load(db, self.organization_id, changed_ids), keep=~np.isin(self.ids, changed_ids))
+        self.cursor = changes[-1].cursor
+        return True
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """Top `limit` (code id, cosine similarity) pairs with positive similarity."""
+        ids, vectors = self._rows
+        if not len(ids) or limit <= 0:
+            return []
+        scores = vectors @ self.embedder.embed([query])[0]
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(ids[row]), float(scores[row])) for row in candidates]
+
+
+# Global registry instance
+semantic_indexes = CatalogIndexRegistry(SemanticIndex)
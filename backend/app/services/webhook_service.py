@@ -1,16 +1,19 @@
 """
 Service for managing webhooks and delivering events.
+
+Events are not delivered inside the request that raises them: they are
+queued in the webhook_outbox table, in the same transaction as the change,
+and delivered by the webhook worker (app.services.webhook_worker).
 """
 import hmac
 import hashlib
 import time
 import json
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
-import httpx
-import asyncio
-from app.models.webhook import Webhook, WebhookDelivery
+from app.core.http_client import http_client
+from app.models.webhook import Webhook, WebhookDelivery, WebhookOutbox
 from app.schemas.webhook import WebhookCreate, WebhookUpdate
 
 
@@ -94,52 +97,55 @@ class WebhookService:
         return True
     
     @staticmethod
-    async def trigger_webhooks(
+    def _get_active_webhooks_for_event(db: Session, event_type: str) -> List[Webhook]:
+        """Active webhooks subscribed to an event type."""
+        # Matched in Python: the events JSON array has no portable containment operator
+        webhooks = db.query(Webhook).filter(Webhook.is_active == True).order_by(Webhook.id).all()
+        return [webhook for webhook in webhooks if event_type in (webhook.events or [])]
+    
+    @staticmethod
+    def enqueue_event(
         db: Session,
         event_type: str,
-        payload: Dict[str, Any]
+        payload: Dict[str, Any],
+        webhooks: Optional[Iterable[Webhook]] = None
     ) -> int:
-        """Trigger all active webhooks for a given event type."""
-        # Get all active webhooks that listen to this event
-        # Using .any() instead of .contains() for JSON array compatibility
-        from sqlalchemy import func, cast
-        from sqlalchemy.dialects.postgresql import JSONB
-        
-        webhooks = db.query(Webhook).filter(
-            Webhook.is_active == True,
-            func.jsonb_contains(
-                cast(Webhook.events, JSONB),
-                cast([event_type], JSONB)
-            )
-        ).all()
-        
-        triggered_count = 0
-        for webhook in webhooks:
-            try:
-                await WebhookService._deliver_webhook(db, webhook, event_type, payload)
-                triggered_count += 1
-            except Exception as e:
-                print(f"Error triggering webhook {webhook.id}: {str(e)}")
+        """
+        Queue an event for delivery without committing.
+        
+        The outbox rows commit (or roll back) with the caller's transaction.
+        ``webhooks`` defaults to every active webhook subscribed to the event.
+        Returns the number of rows queued.
+        """
+        if webhooks is None:
+            webhooks = WebhookService._get_active_webhooks_for_event(db, event_type)
         
-        return triggered_count
+        queued = 0
+        for webhook in webhooks:
+            db.add(WebhookOutbox(webhook_id=webhook.id, event_type=event_type, payload=payload))
+            queued += 1
+        return queued
     
     @staticmethod
-    async def _deliver_webhook(
+    async def trigger_webhooks(
         db: Session,
-        webhook: Webhook,
         event_type: str,
-        payload: Dict[str, Any],
-        attempt_number: int = 1
-    ) -> WebhookDelivery:
-        """Deliver a webhook event with retry logic."""
-        start_time = time.time()
-        
-        # Prepare headers
-        headers = webhook.headers or {}
+        payload: Dict[str, Any]
+    ) -> int:
+        """Queue an event for all subscribed webhooks and commit (delivery is asynchronous)."""
+        queued = WebhookService.enqueue_event(db, event_type, payload)
+        if queued:
+            db.commit()
+        return queued
+    
+    @staticmethod
+    def _headers(webhook: Webhook, event_type: str, payload: Dict[str, Any], delivery_id: str) -> Dict[str, str]:
+        headers = dict(webhook.headers or {})
         headers['Content-Type'] = 'application/json'
         headers['User-Agent'] = 'DiagnosticCodeAssistant-Webhook/1.0'
         headers['X-Webhook-Event'] = event_type
-        headers['X-Webhook-Delivery'] = str(time.time())
+        # Same id on every attempt of an event, so receivers can drop duplicates
+        headers['X-Webhook-Delivery'] = delivery_id
         
         # Add HMAC signature if secret is configured
         if webhook.secret:
@@ -150,8 +156,27 @@ class WebhookService:
                 hashlib.sha256
             ).hexdigest()
             headers['X-Webhook-Signature'] = f'sha256={signature}'
+        return headers
+    
+    @staticmethod
+    async def _deliver_webhook(
+        webhook: Webhook,
+        event_type: str,
+        payload: Dict[str, Any],
+        attempt_number: int = 1,
+        delivery_id: Optional[str] = None
+    ) -> WebhookDelivery:
+        """
+        Make one delivery attempt and return its (unsaved) delivery record.
+        
+        Retries are scheduled by the webhook worker, not slept on here; see
+        record_delivery() for saving the result.
+        """
+        start_time = time.time()
+        headers = WebhookService._headers(
+            webhook, event_type, payload, delivery_id or str(start_time)
+        )
         
-        # Create delivery record
         delivery = WebhookDelivery(
             webhook_id=webhook.id,
             event_type=event_type,
@@ -160,59 +185,43 @@ class WebhookService:
         )
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
+            # Pooled keep-alive connections, shared by all deliveries
+            async with http_client.host_slot(webhook.url):
+                response = await http_client.get().post(
                     webhook.url,
                     json=payload,
                     headers=headers,
                     timeout=webhook.timeout_seconds
                 )
-                
-                duration_ms = int((time.time() - start_time) * 1000)
-                
-                delivery.status_code = response.status_code
-                delivery.response_body = response.text[:1000]  # Limit to 1000 chars
-                delivery.duration_ms = duration_ms
-                delivery.is_success = response.status_code < 400
-                delivery.delivered_at = datetime.utcnow()
-                
-                # Update webhook statistics
-                webhook.total_triggers += 1
-                webhook.last_triggered_at = datetime.utcnow()
-                webhook.last_status_code = response.status_code
-                
-                if not delivery.is_success:
-                    webhook.failed_triggers += 1
-                    
-                    # Retry if configured and attempts remain
-                    if attempt_number < webhook.retry_count:
-                        await asyncio.sleep(2 ** attempt_number)  # Exponential backoff
-                        return await WebhookService._deliver_webhook(
-                            db, webhook, event_type, payload, attempt_number + 1
-                        )
-                
+            
+            delivery.status_code = response.status_code
+            delivery.response_body = response.text[:1000]  # Limit to 1000 chars
+            delivery.is_success = response.status_code < 400
+            delivery.delivered_at = datetime.utcnow()
         except Exception as e:
-            duration_ms = int((time.time() - start_time) * 1000)
-            delivery.error_message = str(e)[:500]
-            delivery.duration_ms = duration_ms
+            delivery.error_message = (str(e) or type(e).__name__)[:500]
             delivery.is_success = False
-            
-            webhook.total_triggers += 1
-            webhook.failed_triggers += 1
-            webhook.last_triggered_at = datetime.utcnow()
-            
-            # Retry on exception
-            if attempt_number < webhook.retry_count:
-                await asyncio.sleep(2 ** attempt_number)
-                return await WebhookService._deliver_webhook(
-                    db, webhook, event_type, payload, attempt_number + 1
-                )
         
+        delivery.duration_ms = int((time.time() - start_time) * 1000)
+        return delivery
+    
+    @staticmethod
+    def record_delivery(db: Session, delivery: WebhookDelivery) -> None:
+        """Add a delivery record and update its webhook's statistics (no commit)."""
         db.add(delivery)
-        db.commit()
-        db.refresh(delivery)
         
-        return delivery
+        # Counters are incremented in SQL: several workers may record at once
+        values = {
+            Webhook.total_triggers: Webhook.total_triggers + 1,
+            Webhook.last_triggered_at: datetime.utcnow(),
+        }
+        if not delivery.is_success:
+            values[Webhook.failed_triggers] = Webhook.failed_triggers + 1
+        if delivery.status_code is not None:
+            values[Webhook.last_status_code] = delivery.status_code
+        db.query(Webhook).filter(Webhook.id == delivery.webhook_id).update(
+            values, synchronize_session=False
+        )
     
     @staticmethod
     def get_deliveries(
@@ -0,0 +1,266 @@
+"""
+Webhook worker: delivers the events queued in the webhook outbox.
+
+API requests only add rows to webhook_outbox (in the transaction of the
+change that raised the event), so a slow or failing subscriber never holds
+up a write. Worker processes drain the table:
+
+* Each process keeps up to WEBHOOK_WORKER_CONCURRENCY deliveries in flight.
+* Only the oldest queued event of each webhook is eligible, so one
+  endpoint receives its events in order while others proceed in parallel.
+* A claimed event is leased (locked_until); if its worker dies, the event
+  becomes due again when the lease expires. On PostgreSQL concurrent
+  claims skip each other's rows with FOR UPDATE SKIP LOCKED.
+* Failed attempts are rescheduled with exponential backoff in the row
+  itself, so retries survive restarts. After the webhook's retry_count
+  attempts the event is marked failed and the next one goes out.
+* Claiming and settling use the blocking database session, so they run in
+  worker threads; the event loop (an API process's, with the embedded
+  worker) only ever waits on the HTTP deliveries.
+
+By default each API process also runs a worker (WEBHOOK_EMBEDDED_WORKER),
+so a plain deployment delivers webhooks. To move deliveries off the API
+processes, set WEBHOOK_EMBEDDED_WORKER=false there and run a pool of
+worker processes as its own service:
+
+    python -m app.services.webhook_worker --processes 2 --concurrency 16
+
+Delivery is at least once; X-Webhook-Delivery carries the outbox id, which
+is the same on every attempt of an event.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Set
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.http_client import http_client
+from app.db.database import SessionLocal, is_postgresql
+from app.models.webhook import Webhook, WebhookDelivery, WebhookOutbox
+from app.services.webhook_service import WebhookService
+
+logger = logging.getLogger(__name__)
+
+
+class _Job(NamedTuple):
+    """A claimed outbox row, with its webhook detached from the claiming session."""
+
+    outbox_id: int
+    attempts: int
+    event_type: str
+    payload: dict
+    webhook: Webhook
+
+
+def retry_delay(attempts: int) -> int:
+    """Seconds before the next attempt of an event that has failed `attempts` times."""
+    return min(2 ** attempts, settings.WEBHOOK_RETRY_MAX_DELAY)
+
+
+class WebhookWorker:
+    """Drains the webhook outbox with a bounded number of concurrent deliveries."""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        concurrency: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+        lease_seconds: Optional[int] = None,
+    ):
+        self._session_factory = session_factory
+        self.concurrency = settings.WEBHOOK_WORKER_CONCURRENCY if concurrency is None else concurrency
+        self.poll_interval = settings.WEBHOOK_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.lease_seconds = settings.WEBHOOK_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        self._stopping: Optional[asyncio.Event] = None
+
+    def claim(self, limit: int) -> List[_Job]:
+        """Lease up to `limit` due events, at most one per webhook."""
+        if limit <= 0:
+            return []
+        now = datetime.utcnow()
+        db: Session = self._session_factory()
+        try:
+            # Head of each webhook's queue; later events wait until it is settled
+            heads = select(func.min(WebhookOutbox.id)).where(
+                WebhookOutbox.status.in_([WebhookOutbox.PENDING, WebhookOutbox.PROCESSING])
+            ).group_by(WebhookOutbox.webhook_id)
+            query = db.query(WebhookOutbox).filter(
+                WebhookOutbox.id.in_(heads),
+                or_(
+                    and_(WebhookOutbox.status == WebhookOutbox.PENDING, WebhookOutbox.next_attempt_at <= now),
+                    # Lease expired: the worker that claimed it is gone
+                    and_(WebhookOutbox.status == WebhookOutbox.PROCESSING, WebhookOutbox.locked_until <= now),
+                ),
+            ).order_by(WebhookOutbox.next_attempt_at, WebhookOutbox.id).limit(limit)
+            if is_postgresql(db):
+                query = query.with_for_update(skip_locked=True)
+            rows = query.all()
+            if not rows:
+                db.rollback()
+                return []
+
+            webhooks = {
+                webhook.id: webhook
+                for webhook in db.query(Webhook).filter(Webhook.id.in_({row.webhook_id for row in rows}))
+            }
+            jobs = []
+            for row in rows:
+                webhook = webhooks.get(row.webhook_id)
+                if webhook is None or not webhook.is_active:
+                    # Deactivated since the event was queued: nothing to deliver
+                    db.delete(row)
+                    continue
+                row.status = WebhookOutbox.PROCESSING
+                row.locked_until = now + timedelta(seconds=self.lease_seconds)
+                jobs.append(_Job(row.id, row.attempts, row.event_type, row.payload, webhook))
+            for webhook in webhooks.values():
+                db.expunge(webhook)
+            db.commit()
+            return jobs
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def settle(self, job: _Job, delivery: WebhookDelivery) -> None:
+        """Record an attempt: remove a delivered event, reschedule or fail the rest."""
+        db: Session = self._session_factory()
+        try:
+            WebhookService.record_delivery(db, delivery)
+            if delivery.is_success:
+                db.query(WebhookOutbox).filter(WebhookOutbox.id == job.outbox_id).delete(
+                    synchronize_session=False
+                )
+            else:
+                attempts = job.attempts + 1
+                values = {
+                    WebhookOutbox.attempts: attempts,
+                    WebhookOutbox.locked_until: None,
+                    WebhookOutbox.last_error: delivery.error_message or f"HTTP {delivery.status_code}",
+                }
+                if attempts >= max(job.webhook.retry_count, 1):
+                    values[WebhookOutbox.status] = WebhookOutbox.FAILED
+                else:
+                    values[WebhookOutbox.status] = WebhookOutbox.PENDING
+                    values[WebhookOutbox.next_attempt_at] = datetime.utcnow() + timedelta(
+                        seconds=retry_delay(attempts)
+                    )
+                db.query(WebhookOutbox).filter(WebhookOutbox.id == job.outbox_id).update(
+                    values, synchronize_session=False
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def process(self, job: _Job) -> bool:
+        """Deliver one claimed event; returns whether the receiver accepted it."""
+        delivery = await WebhookService._deliver_webhook(
+            job.webhook, job.event_type, job.payload, job.attempts + 1, delivery_id=str(job.outbox_id)
+        )
+        accepted = bool(delivery.is_success)
+        try:
+            await asyncio.to_thread(self.settle, job, delivery)
+        except Exception:
+            # The lease expires and the event is retried
+            logger.exception(f"Error recording webhook delivery {job.outbox_id}")
+        return accepted
+
+    async def drain(self) -> int:
+        """Deliver due events until none are left; returns the number of attempts made."""
+        attempts = 0
+        while True:
+            jobs = await asyncio.to_thread(self.claim, self.concurrency)
+            if not jobs:
+                return attempts
+            await asyncio.gather(*(self.process(job) for job in jobs))
+            attempts += len(jobs)
+
+    def stop(self) -> None:
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def run(self) -> None:
+        """Claim and deliver events until stop(); in-flight deliveries are finished."""
+        self._stopping = asyncio.Event()
+        in_flight: Set[asyncio.Task] = set()
+        while not self._stopping.is_set():
+            free = self.concurrency - len(in_flight)
+            try:
+                jobs = await asyncio.to_thread(self.claim, free)
+            except Exception:
+                logger.exception("Error claiming webhook events")
+                jobs = []
+            for job in jobs:
+                task = asyncio.create_task(self.process(job))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+            if len(jobs) < free:
+                # Nothing more is due: wait for the next poll (or stop)
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            elif in_flight:
+                # Every slot is busy: wait for one to free up
+                await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+
+        if in_flight:
+            await asyncio.wait(in_flight)
+
+
+def _run_process(concurrency: int) -> None:
+    """Entry point of one worker process."""
+    worker = WebhookWorker(concurrency=concurrency)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, worker.stop)
+        try:
+            await worker.run()
+        finally:
+            await http_client.close()
+
+    asyncio.run(main())
+
+
+def run_pool(processes: int, concurrency: int) -> None:
+    """Run `processes` worker processes until they are terminated."""
+    pool = [
+        multiprocessing.Process(target=_run_process, args=(concurrency,), name=f"webhook-worker-{n}")
+        for n in range(processes)
+    ]
+    for process in pool:
+        process.start()
+    try:
+        for process in pool:
+            process.join()
+    except KeyboardInterrupt:
+        for process in pool:
+            process.terminate()
+        for process in pool:
+            process.join()
+
+
+# Global worker instance (run in-process by the API when WEBHOOK_EMBEDDED_WORKER is set)
+webhook_worker = WebhookWorker()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deliver queued webhook events.")
+    parser.add_argument("--processes", type=int, default=settings.WEBHOOK_WORKER_PROCESSES)
+    parser.add_argument("--concurrency", type=int, default=settings.WEBHOOK_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+    print(f"Starting {args.processes} webhook worker(s), {args.concurrency} deliveries each")
+    run_pool(args.processes, args.concurrency)
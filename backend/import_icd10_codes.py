@@ -14,7 +14,10 @@ from sqlalchemy import create_engine, select
 from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.models.diagnostic_code import DiagnosticCode
+from app.models.code_change import CodeChange, record_bulk_changes
 from app.models.organization import Organization
+# Also registers the hook that invalidates catalog caches on every committed batch
+from app.services.diagnostic_code_service import DiagnosticCodeService
 
 # CMS ICD-10-CM codes download URL (2024 version)
 ICD10_URL = "https://www.cms.gov/files/zip/2024-code-descriptions-tabular-order.zip"
@@ -179,6 +182,8 @@ def import_codes_to_database(codes, organization_id: int = 1):
         
         # Clear existing codes (optional - remove if you want to keep sample codes)
         print("Clearing existing codes...")
+        # Bulk statements skip ORM events, so log the delta-sync changes explicitly
+        record_bulk_changes(session, session.query(DiagnosticCode), CodeChange.DELETE)
         session.query(DiagnosticCode).delete()
         session.commit()
         
@@ -202,11 +207,22 @@ def import_codes_to_database(codes, organization_id: int = 1):
             ]
             
             session.bulk_save_objects(db_codes)
+            record_bulk_changes(
+                session,
+                session.query(DiagnosticCode).filter(
+                    DiagnosticCode.organization_id == organization_id,
+                    DiagnosticCode.code.in_([code['code'] for code in batch]),
+                ),
+                CodeChange.UPSERT,
+            )
             session.commit()
             
             total_imported += len(batch)
             print(f"Imported {total_imported}/{len(codes)} codes...")
         
+        # Running API workers must not keep serving (or 304-ing) the old catalog
+        DiagnosticCodeService(session).invalidate_caches(organization_id)
+        
         print(f"\n✅ Successfully imported {total_imported} ICD-10 codes!")
         
         # Show statistics
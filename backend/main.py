@@ -8,6 +8,7 @@ from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.exceptions import RequestValidationError
 from sqlalchemy.exc import SQLAlchemyError
 from starlette.exceptions import HTTPException as StarletteHTTPException
+import asyncio
 from contextlib import asynccontextmanager
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -16,7 +17,15 @@ import sentry_sdk
 
 from app.api.v1.api import api_router
 from app.core.config import settings
-from app.db.database import create_db_and_tables
+from app.core.cache import cache
+from app.core.http_client import http_client
+from app.db.database import create_db_and_tables, SessionLocal
+from app.services.catalog_index import catalog_indexes
+from app.services.ranked_search import ranked_indexes
+from app.services.search_history import search_history
+from app.services.semantic_search import semantic_indexes
+from app.services.ai_search import shutdown_llm_executor
+from app.services.webhook_worker import webhook_worker
 from app.middleware.security import SecurityHeadersMiddleware
 from app.core.exception_handlers import (
     http_exception_handler,
@@ -42,11 +51,27 @@ limiter = Limiter(key_func=get_remote_address, default_limits=["100/minute"])
 async def lifespan(app: FastAPI):
     """Application lifespan events."""
     # Startup - skip DB creation during tests
+    webhook_task = None
+    await http_client.start()
     if not os.getenv("TESTING"):
         create_db_and_tables()
+        # Build search indexes in the background; lookups build on demand meanwhile
+        catalog_indexes.warm(SessionLocal)
+        ranked_indexes.warm(SessionLocal, include_all=False)
+        semantic_indexes.warm(SessionLocal, include_all=False)
+        search_history.start()
+        # Turned off when dedicated worker processes deliver the webhooks
+        if settings.WEBHOOK_EMBEDDED_WORKER:
+            webhook_task = asyncio.create_task(webhook_worker.run())
     yield
     # Shutdown
-    pass
+    if webhook_task is not None:
+        webhook_worker.stop()
+        await webhook_task
+    search_history.stop()
+    shutdown_llm_executor()
+    await http_client.close()
+    await cache.close()
 
 
 app = FastAPI(
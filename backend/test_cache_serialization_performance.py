@@ -0,0 +1,97 @@
+"""
+Micro-benchmark for cache value encodings.
+Compares the old dict-per-item JSON format against fixed-schema rows with
+JSON / msgpack and optional compression, for a typical 100-item list page.
+"""
+import json
+import time
+from datetime import datetime, timedelta
+
+from app.core.serialization import CacheCodec, available_compressions, available_serializers
+from app.models import DiagnosticCode
+from app.services.diagnostic_code_service import CachedDiagnosticCode
+
+ITERATIONS = 2000
+PAGE_SIZE = 100
+
+
+class _Row:
+    """Stand-in for a DiagnosticCode row."""
+
+    def __init__(self, i: int):
+        now = datetime(2024, 1, 1) + timedelta(minutes=i)
+        self.id = i
+        self.organization_id = 1
+        self.code = f"E{i:04d}"
+        self.description = f"Engine sensor {i} reported a value outside the expected operating range"
+        self.category = "Engine"
+        self.subcategory = "Sensors"
+        self.severity = "medium"
+        self.is_active = True
+        self.extra_data = None
+        self.created_at = now
+        self.updated_at = now
+
+
+def _legacy_dict(item) -> dict:
+    return {
+        "id": item.id,
+        "organization_id": item.organization_id,
+        "code": item.code,
+        "description": item.description,
+        "category": item.category,
+        "subcategory": item.subcategory,
+        "severity": item.severity,
+        "is_active": item.is_active,
+        "created_at": item.created_at.isoformat(),
+        "updated_at": item.updated_at.isoformat(),
+    }
+
+
+def bench_legacy_json(page):
+    """Old format: list of dicts as JSON text, rehydrated into transient ORM objects."""
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        raw = json.dumps([_legacy_dict(item) for item in page])
+        for item in json.loads(raw):
+            item["created_at"] = datetime.fromisoformat(item["created_at"])
+            item["updated_at"] = datetime.fromisoformat(item["updated_at"])
+            DiagnosticCode(**item)
+    return time.perf_counter() - start, len(raw.encode())
+
+
+def bench_codec(page, serializer: str, compression: str):
+    """New format: fixed-schema rows through CacheCodec."""
+    codec = CacheCodec(serializer=serializer, compression=compression, compress_min_bytes=0)
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        raw = codec.encode([CachedDiagnosticCode.to_row(item) for item in page])
+        [CachedDiagnosticCode.from_row(row) for row in codec.decode(raw)]
+    return time.perf_counter() - start, len(raw)
+
+
+def run_benchmarks():
+    page = [_Row(i) for i in range(PAGE_SIZE)]
+
+    print("\n" + "=" * 80)
+    print(f"CACHE SERIALIZATION BENCHMARK ({PAGE_SIZE} items x {ITERATIONS} round trips)")
+    print("=" * 80)
+    print(f"{'Format':<30} {'Total':>12} {'Per page':>12} {'Bytes':>10}")
+    print("-" * 80)
+
+    elapsed, size = bench_legacy_json(page)
+    print(f"{'json dicts (legacy)':<30} {elapsed*1000:>10.1f}ms {elapsed/ITERATIONS*1e6:>10.1f}us {size:>10}")
+
+    for serializer, serializer_ok in available_serializers().items():
+        for compression, compression_ok in available_compressions().items():
+            if not (serializer_ok and compression_ok):
+                continue
+            elapsed, size = bench_codec(page, serializer, compression)
+            label = f"{serializer} rows + {compression}"
+            print(f"{label:<30} {elapsed*1000:>10.1f}ms {elapsed/ITERATIONS*1e6:>10.1f}us {size:>10}")
+
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    run_benchmarks()
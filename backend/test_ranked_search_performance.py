@@ -0,0 +1,84 @@
+"""
+Performance test for BM25 ranked search.
+Compares the SQL + heuristic advanced search against the in-process BM25
+index, on the database configured in DATABASE_URL (run import_icd10_codes.py
+first to benchmark the full ICD-10 catalog).
+"""
+import time
+
+from app.db.database import SessionLocal
+from app.models import DiagnosticCode
+from app.services.ranked_search import BM25Index
+from app.services.search_service import SearchService
+
+QUERIES = [
+    "diabetes",
+    "type 2 diabetes mellitus",
+    "fracture of femur",
+    "hypertension",
+    "chronic kidney disease",
+    "unspecified",
+    "E11.9",
+    "pneumonia due to bacteria",
+]
+REPEATS = 20
+
+
+def bench_sql_search(service: SearchService, query: str):
+    """Current path: ILIKE filter, limit*2 rows, Python heuristic re-ranking."""
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        results = service.advanced_search(query, highlight=False)
+    return (time.perf_counter() - start) / REPEATS, results
+
+
+def bench_ranked_search(service: SearchService, query: str, organization_id):
+    """New path: BM25 over the in-process inverted index."""
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        results = service.advanced_search(query, highlight=False, mode="ranked", organization_id=organization_id)
+    return (time.perf_counter() - start) / REPEATS, results
+
+
+def run_performance_tests():
+    db = SessionLocal()
+    service = SearchService(db)
+    organization_id = db.query(DiagnosticCode.organization_id).limit(1).scalar()
+
+    print("\n" + "=" * 90)
+    print("RANKED SEARCH PERFORMANCE TEST")
+    print("=" * 90)
+
+    start = time.perf_counter()
+    index = BM25Index.build(db, organization_id)
+    print(f"Index build: {len(index)} codes, {len(index.postings)} terms in {(time.perf_counter() - start)*1000:.0f}ms")
+    # Warm the registry so timings below exclude the build
+    service.advanced_search("warmup", mode="ranked", organization_id=organization_id)
+
+    print(f"\n{'Query':<28} {'SQL':>10} {'Ranked':>10} {'Speedup':>9}  {'Top SQL':<10} {'Top ranked':<10}")
+    print("-" * 90)
+
+    total_sql = total_ranked = 0.0
+    for query in QUERIES:
+        sql_time, sql_results = bench_sql_search(service, query)
+        ranked_time, ranked_results = bench_ranked_search(service, query, organization_id)
+        total_sql += sql_time
+        total_ranked += ranked_time
+
+        speedup = sql_time / ranked_time if ranked_time > 0 else 0
+        top_sql = sql_results[0].code if sql_results else "-"
+        top_ranked = ranked_results[0].code if ranked_results else "-"
+        print(
+            f"{query:<28} {sql_time*1000:>8.2f}ms {ranked_time*1000:>8.2f}ms {speedup:>8.1f}x  "
+            f"{top_sql:<10} {top_ranked:<10}"
+        )
+
+    print("-" * 90)
+    print(f"{'AVERAGE':<28} {total_sql/len(QUERIES)*1000:>8.2f}ms {total_ranked/len(QUERIES)*1000:>8.2f}ms")
+    print("=" * 90)
+
+    db.close()
+
+
+if __name__ == "__main__":
+    run_performance_tests()
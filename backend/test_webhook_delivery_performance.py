@@ -0,0 +1,93 @@
+"""
+Performance test for webhook delivery.
+Compares one new httpx.AsyncClient per delivery (the previous behaviour)
+with the shared pooled client, against a local stub receiver. The stub
+answers over plain HTTP/1.1 on localhost, so only TCP handshakes are saved
+here; receivers behind TLS save the TLS handshake as well.
+"""
+import asyncio
+import time
+
+import httpx
+
+from app.core.http_client import http_client
+from app.models.webhook import Webhook
+from app.services.webhook_service import WebhookService
+
+DELIVERIES = 500
+CONCURRENCY = [1, 8, 32]
+PAYLOAD = {"id": 123, "code": "E11.9", "description": "Type 2 diabetes mellitus without complications"}
+
+RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 2\r\n\r\nOK"
+
+
+async def handle_receiver(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Minimal keep-alive HTTP/1.1 receiver: reads a request, answers 200 OK."""
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            writer.write(RESPONSE)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+async def deliver_with_new_client(webhook: Webhook):
+    """Previous path: a fresh client (and connection) for every attempt."""
+    headers = WebhookService._headers(webhook, "code.created", PAYLOAD, "bench")
+    async with httpx.AsyncClient() as client:
+        response = await client.post(webhook.url, json=PAYLOAD, headers=headers, timeout=webhook.timeout_seconds)
+    return response.status_code < 400
+
+
+async def deliver_with_shared_client(webhook: Webhook):
+    """New path: WebhookService._deliver_webhook on the pooled client."""
+    delivery = await WebhookService._deliver_webhook(webhook, "code.created", PAYLOAD)
+    return delivery.is_success
+
+
+async def bench(deliver, webhook: Webhook, concurrency: int):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with slots:
+            return await deliver(webhook)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(DELIVERIES)))
+    elapsed = time.perf_counter() - start
+    assert all(results), "stub receiver rejected a delivery"
+    return DELIVERIES / elapsed
+
+
+async def run_performance_tests():
+    server = await asyncio.start_server(handle_receiver, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    webhook = Webhook(id=1, url=f"http://127.0.0.1:{port}/hook", secret="bench-secret", timeout_seconds=30)
+
+    print("\n" + "=" * 70)
+    print("WEBHOOK DELIVERY PERFORMANCE TEST")
+    print("=" * 70)
+    print(f"{DELIVERIES} deliveries per run; HTTP/2 available: {http_client.http2}")
+    print(f"\n{'Concurrency':<14} {'New client':>16} {'Shared client':>16} {'Speedup':>9}")
+    print("-" * 70)
+
+    async with server:
+        for concurrency in CONCURRENCY:
+            before = await bench(deliver_with_new_client, webhook, concurrency)
+            after = await bench(deliver_with_shared_client, webhook, concurrency)
+            print(f"{concurrency:<14} {before:>12.0f}/sec {after:>12.0f}/sec {after / before:>8.1f}x")
+        await http_client.close()
+
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_performance_tests())
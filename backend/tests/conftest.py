@@ -25,6 +25,11 @@ from app.models.user import User
 from app.core.deps import get_current_active_user
 from app.core.deps import get_current_active_user
 from app.core.rbac import require_viewer, require_editor
+from app.services.catalog_index import catalog_indexes
+from app.services.fuzzy_scoring import fuzzy_indexes
+from app.services.ranked_search import ranked_indexes
+from app.services.semantic_search import semantic_indexes
+from app.services.llm_cache import llm_cache
 
 # Use in-memory SQLite database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -47,6 +52,12 @@ def db() -> Generator[Session, None, None]:
     finally:
         session.close()
         Base.metadata.drop_all(bind=engine)
+        # In-process indexes would otherwise outlive the per-test database
+        catalog_indexes.clear()
+        ranked_indexes.clear()
+        fuzzy_indexes.clear()
+        semantic_indexes.clear()
+        llm_cache.clear()
 
 
 @pytest.fixture(scope="function")
@@ -0,0 +1,350 @@
+"""
+Unit tests for semantic retrieval and AI search.
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.models.diagnostic_code import DiagnosticCode
+from app.schemas.diagnostic_code import DiagnosticCodeUpdate
+from app.services import ai_search
+from app.services.diagnostic_code_service import DiagnosticCodeService
+from app.services.llm_cache import LLMResponseCache, llm_cache
+from app.services.semantic_search import HashingEmbedder, SemanticIndex, get_embedder, semantic_indexes
+
+
+@pytest.fixture
+def catalog(db, test_org):
+    codes = [
+        DiagnosticCode(code="E11.9", description="Type 2 diabetes mellitus without complications",
+                       category="Endocrine", organization_id=test_org.id),
+        DiagnosticCode(code="I10", description="Essential (primary) hypertension",
+                       category="Circulatory", organization_id=test_org.id),
+        DiagnosticCode(code="J45.909", description="Unspecified asthma, uncomplicated",
+                       category="Respiratory", organization_id=test_org.id),
+        DiagnosticCode(code="R07.9", description="Chest pain, unspecified",
+                       category="Symptoms", organization_id=test_org.id),
+    ]
+    db.add_all(codes)
+    db.commit()
+    return {code.code: code for code in codes}
+
+
+class StubModel:
+    """Stands in for the Gemini model, answering with a fixed text."""
+
+    def __init__(self, text, delay=0.0):
+        self.text = text
+        self.delay = delay
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        # Blocking, like the real client
+        time.sleep(self.delay)
+        self.prompts.append(prompt)
+        return SimpleNamespace(text=self.text)
+
+
+@pytest.mark.unit
+class TestHashingEmbedder:
+    """Tests for the dependency-free embedder."""
+
+    def test_deterministic_unit_vectors(self):
+        """Test embeddings are reproducible and L2-normalized."""
+        embedder = HashingEmbedder(64)
+        first, second = embedder.embed(["chest pain"]), embedder.embed(["chest pain"])
+
+        assert np.array_equal(first, second)
+        assert np.linalg.norm(first[0]) == pytest.approx(1.0)
+
+    def test_inflections_are_similar(self):
+        """Test shared character n-grams make related word forms similar."""
+        vectors = HashingEmbedder().embed(["diabetic", "diabetes", "asthma"])
+
+        assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+
+    def test_stop_words_only(self):
+        """Test a text with no content words embeds to the zero vector."""
+        assert not HashingEmbedder(32).embed(["of the"]).any()
+
+
+@pytest.mark.unit
+class TestSemanticIndex:
+    """Tests for SemanticIndex."""
+
+    def test_top_k_by_cosine(self, db, test_org, catalog):
+        """Test the closest code ranks first and results stop at the limit."""
+        index = SemanticIndex.build(db, test_org.id)
+        results = index.search("diabetic patient", 2)
+
+        assert len(index) == 4
+        assert len(results) <= 2
+        assert results[0][0] == catalog["E11.9"].id
+
+    def test_refresh_reembeds_changed_codes(self, db, test_org, catalog):
+        """Test code writes are picked up without rebuilding the index."""
+        index = semantic_indexes.get(db, test_org.id)
+        service = DiagnosticCodeService(db)
+        service.update_code(catalog["I10"].id, DiagnosticCodeUpdate(description="Hyperglycemia"))
+        service.delete_code(catalog["J45.909"].id)
+
+        assert semantic_indexes.get(db, test_org.id) is index
+        assert len(index) == 3
+        assert index.context[catalog["I10"].id][1].startswith("I10 | Hyperglycemia | Circulatory")
+        assert catalog["J45.909"].id not in index.context
+        assert index.search("hyperglycemia", 1)[0][0] == catalog["I10"].id
+        assert catalog["J45.909"].id not in [code_id for code_id, _ in index.search("asthma", 4)]
+
+
+@pytest.mark.unit
+class TestAISearch:
+    """Tests for ai_search_codes."""
+
+    async def test_semantic_results_without_model(self, db, test_org, catalog, monkeypatch):
+        """Test retrieval works offline when no LLM is configured."""
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: None)
+
+        codes = await ai_search.ai_search_codes("asthma attack", db, 3, test_org.id)
+
+        assert codes[0].code == "J45.909"
+
+    async def test_model_reranks_candidates_only(self, db, test_org, catalog, monkeypatch):
+        """Test the LLM orders retrieved candidates and cannot add new codes."""
+        model = StubModel('Sure: ["I10", "Z99.9", "R07.9"]')
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: model)
+
+        codes = await ai_search.ai_search_codes("chest pain with hypertension", db, 3, test_org.id)
+
+        assert [code.code for code in codes][:2] == ["I10", "R07.9"]
+        assert "Z99.9" not in [code.code for code in codes]
+        assert "\nR07.9 | Chest pain, unspecified | Symptoms |  | " in model.prompts[0]
+
+    async def test_unparseable_answer_keeps_retrieval_order(self, db, test_org, catalog, monkeypatch):
+        """Test a malformed LLM answer degrades to semantic ranking."""
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: StubModel("no idea"))
+
+        codes = await ai_search.ai_search_codes("chest pain", db, 2, test_org.id)
+
+        assert codes[0].code == "R07.9"
+
+    async def test_scoped_to_organization(self, db, test_org, catalog, monkeypatch):
+        """Test other organizations' codes are never returned."""
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: None)
+
+        assert await ai_search.ai_search_codes("asthma", db, 5, test_org.id + 1) == []
+
+    async def test_llm_call_does_not_block_event_loop(self, db, test_org, catalog, monkeypatch):
+        """Test other coroutines keep running while the LLM call is in flight."""
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: StubModel('["R07.9"]', delay=0.2))
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            for _ in range(5):
+                await asyncio.sleep(0.02)
+                ticks += 1
+
+        async def search():
+            codes = await ai_search.ai_search_codes("chest pain", db, 1, test_org.id)
+            return codes, ticks
+
+        (codes, ticks_during_call), _ = await asyncio.gather(search(), ticker())
+
+        assert ticks_during_call == 5
+        assert [code.code for code in codes] == ["R07.9"]
+
+    async def test_slow_llm_times_out_to_retrieval_order(self, db, test_org, catalog, monkeypatch):
+        """Test a call over AI_TIMEOUT is abandoned and retrieval results returned."""
+        monkeypatch.setattr(settings, "AI_TIMEOUT", 0.05)
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: StubModel('["I10"]', delay=0.5))
+
+        start = time.perf_counter()
+        codes = await ai_search.ai_search_codes("chest pain", db, 1, test_org.id)
+
+        assert time.perf_counter() - start < 0.4
+        assert [code.code for code in codes] == ["R07.9"]
+
+    async def test_retrieval_runs_off_event_loop(self, db, test_org, catalog, monkeypatch):
+        """Test the index refresh and similarity search run in a worker thread."""
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: None)
+        get = semantic_indexes.get
+        threads = []
+
+        def recording_get(*args):
+            threads.append(threading.current_thread())
+            return get(*args)
+
+        monkeypatch.setattr(semantic_indexes, "get", recording_get)
+        codes = await ai_search.ai_search_codes("chest pain", db, 1, test_org.id)
+
+        assert threads and threads[0] is not threading.current_thread()
+        assert [code.code for code in codes] == ["R07.9"]
+
+
+@pytest.mark.unit
+class TestLLMResponseCache:
+    """Tests for caching LLM responses across AI requests."""
+
+    async def test_repeated_query_skips_model(self, db, test_org, catalog, monkeypatch):
+        """Test exact and rephrased repeats are answered from the cache."""
+        model = StubModel('["I10", "R07.9"]')
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: model)
+        monkeypatch.setattr(llm_cache, "similarity", 0.95)
+
+        first = await ai_search.ai_search_codes("Chest pain with hypertension", db, 2, test_org.id)
+        again = await ai_search.ai_search_codes("chest pain  with hypertension", db, 2, test_org.id)
+        rephrased = await ai_search.ai_search_codes("chest pain with the hypertension", db, 2, test_org.id)
+
+        assert len(model.prompts) == 1
+        assert [c.code for c in again] == [c.code for c in rephrased] == [c.code for c in first]
+        stats = llm_cache.get_stats()
+        assert (stats["hits"], stats["near_hits"], stats["misses"]) == (1, 1, 1)
+
+    async def test_near_duplicates_off_by_default(self):
+        """Test a rephrased query is not matched unless AI_CACHE_SIMILARITY is set."""
+        cache = LLMResponseCache()
+        await cache.set("rerank:1:g0:stub", "chest pain with hypertension", "answer")
+
+        assert await cache.get("rerank:1:g0:stub", "chest pain with the hypertension") is None
+
+    @pytest.mark.parametrize("cached, query", [
+        ("type 1 diabetes mellitus with diabetic chronic kidney disease and hyperglycemia",
+         "type 2 diabetes mellitus with diabetic chronic kidney disease and hyperglycemia"),
+        ("persistent cough with chest tightness shortness of breath wheezing at night fatigue and fever",
+         "persistent cough with chest tightness shortness of breath wheezing at night fatigue and no fever"),
+        ("follow-up for E10.9 with neuropathy, retinopathy, nephropathy and foot ulcer, stable on insulin pump",
+         "follow-up for E11.9 with neuropathy, retinopathy, nephropathy and foot ulcer, stable on insulin pump"),
+    ])
+    async def test_clinically_different_neighbours_miss(self, cached, query):
+        """Test neighbours above the threshold differing in negations, numbers or codes are not reused."""
+        cache = LLMResponseCache(similarity=0.95)
+        await cache.set("rerank:1:g0:stub", cached, "answer")
+        vectors = get_embedder().embed([cached, query])
+
+        assert float(vectors[0] @ vectors[1]) >= 0.95
+        assert await cache.get("rerank:1:g0:stub", query) is None
+
+    async def test_catalog_write_invalidates(self, db, test_org, catalog, monkeypatch):
+        """Test responses cached for an older catalog version are not reused."""
+        model = StubModel('["R07.9"]')
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: model)
+
+        await ai_search.ai_search_codes("chest pain", db, 1, test_org.id)
+        DiagnosticCodeService(db).update_code(catalog["R07.9"].id, DiagnosticCodeUpdate(severity="high"))
+        await ai_search.ai_search_codes("chest pain", db, 1, test_org.id)
+
+        assert len(model.prompts) == 2
+
+    async def test_suggestions_cache_explanation(self, db, test_org, catalog, monkeypatch):
+        """Test symptom suggestions reuse both the re-rank and the explanation."""
+        model = StubModel('["R07.9"]')
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: model)
+
+        first = await ai_search.get_ai_suggestions("chest pain", db, 1, test_org.id)
+        second = await ai_search.get_ai_suggestions("Chest pain", db, 1, test_org.id)
+
+        assert len(model.prompts) == 2
+        assert second["explanation"] == first["explanation"]
+
+
+@pytest.mark.unit
+class TestPromptContext:
+    """Tests for prompts built from the precomputed context."""
+
+    async def test_prompt_measured_and_compact(self, db, test_org, catalog, monkeypatch):
+        """Test prompts list one unindented line per candidate and are reported to hooks."""
+        model = StubModel('["R07.9"]')
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: model)
+        ai_search.prompt_metrics.reset()
+        recorded = []
+        hook = lambda kind, chars, seconds: recorded.append((kind, chars, seconds))
+        ai_search.prompt_metrics.add_hook(hook)
+        try:
+            await ai_search.ai_search_codes("chest pain", db, 1, test_org.id)
+            await ai_search.ai_search_codes("chest pain", db, 1, test_org.id)
+        finally:
+            ai_search.prompt_metrics.remove_hook(hook)
+
+        # Built once: the repeat is answered from the LLM response cache
+        assert [(kind, chars) for kind, chars, _ in recorded] == [("rerank", len(model.prompts[0]))]
+        code_lines = model.prompts[0].split("severity):\n")[1].split("\n\n")[0].splitlines()
+        assert code_lines[0].startswith("R07.9 | Chest pain")
+        assert not any(line.startswith(" ") for line in code_lines)
+        stats = ai_search.prompt_metrics.get_stats()["rerank"]
+        assert stats["prompts"] == 1
+        assert stats["avg_chars"] == len(model.prompts[0])
+
+
+class BatchStubModel(StubModel):
+    """Answers a batched prompt with one code (or explanation) per numbered query, by keyword."""
+
+    ANSWERS = {"chest": "R07.9", "asthma": "J45.909", "sugar": "E11.9"}
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        if "For each numbered case" in prompt:
+            cases = re.findall(r'^(\d+)\. Symptoms: "([^"]*)"', prompt, re.MULTILINE)
+            return SimpleNamespace(text=json.dumps({number: f"{symptoms} explained." for number, symptoms in cases}))
+        queries = prompt.split("Queries:\n")[1].split("\n\n")[0].splitlines()
+        answers = {
+            line.split(".")[0]: [code for word, code in self.ANSWERS.items() if word in line]
+            for line in queries
+        }
+        return SimpleNamespace(text=json.dumps(answers))
+
+
+@pytest.mark.unit
+class TestMicroBatching:
+    """Tests for batching concurrent AI prompts into one LLM call."""
+
+    async def test_concurrent_searches_share_one_call(self, db, test_org, catalog, monkeypatch):
+        """Test requests within the window are answered from a single batched prompt."""
+        monkeypatch.setattr(settings, "AI_BATCH_WINDOW", 0.05)
+        model = BatchStubModel("")
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: model)
+
+        results = await asyncio.gather(*(
+            ai_search.ai_search_codes(query, db, 1, test_org.id)
+            for query in ("chest pain", "asthma attack", "high blood sugar")
+        ))
+
+        assert len(model.prompts) == 1
+        assert [[code.code for code in codes] for codes in results] == [["R07.9"], ["J45.909"], ["E11.9"]]
+        # Candidates shared by several queries are listed once
+        code_lines = model.prompts[0].split("severity):\n")[1].split("\n\n")[0].splitlines()
+        assert len(code_lines) == len(set(code_lines))
+
+    async def test_full_batch_sent_without_waiting(self, db, test_org, catalog, monkeypatch):
+        """Test a batch reaching AI_BATCH_MAX_SIZE is sent before the window ends."""
+        monkeypatch.setattr(settings, "AI_BATCH_WINDOW", 5.0)
+        monkeypatch.setattr(settings, "AI_BATCH_MAX_SIZE", 2)
+        model = BatchStubModel("")
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: model)
+
+        results = await asyncio.wait_for(asyncio.gather(
+            ai_search.ai_search_codes("chest pain", db, 1, test_org.id),
+            ai_search.ai_search_codes("asthma attack", db, 1, test_org.id),
+        ), timeout=1.0)
+
+        assert [[code.code for code in codes] for codes in results] == [["R07.9"], ["J45.909"]]
+
+    async def test_batched_explanations_fan_out(self, db, test_org, catalog, monkeypatch):
+        """Test symptom suggestions batch their explanations and get their own text back."""
+        monkeypatch.setattr(settings, "AI_BATCH_WINDOW", 0.05)
+        model = BatchStubModel("")
+        monkeypatch.setattr(ai_search, "get_gemini_model", lambda: model)
+
+        first, second = await asyncio.gather(
+            ai_search.get_ai_suggestions("chest pain", db, 1, test_org.id),
+            ai_search.get_ai_suggestions("asthma attack", db, 1, test_org.id),
+        )
+
+        assert (first["explanation"], second["explanation"]) == ("chest pain explained.", "asthma attack explained.")
+        assert sum("For each numbered case" in prompt for prompt in model.prompts) == 1
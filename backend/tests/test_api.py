@@ -10,6 +10,12 @@ from app.models.diagnostic_code import DiagnosticCode
 class TestDiagnosticCodesAPI:
     """Tests for diagnostic codes API endpoints."""
 
+    @pytest.fixture
+    def shared_generations(self, monkeypatch):
+        """Treat generations as shared (Redis-backed), which ETags require."""
+        from app.core.cache import cache
+        monkeypatch.setattr(cache, "aget_shared_generation", cache.aget_generation)
+
     def test_get_codes_empty(self, client):
         """Test getting codes when database is empty."""
         response = client.get("/api/v1/diagnostic-codes")
@@ -125,6 +131,61 @@ class TestDiagnosticCodesAPI:
         data = response.json()
         assert len(data["items"]) == 5
 
+    def test_get_codes_with_cursor(self, client, db, test_org):
+        """Test keyset (cursor) pagination of codes."""
+        for i in range(7):
+            db.add(DiagnosticCode(code=f"C{i:02d}", description=f"Code {i}", organization_id=test_org.id))
+        db.commit()
+        
+        seen = []
+        response = client.get("/api/v1/diagnostic-codes?limit=3")
+        data = response.json()
+        seen.extend(item["code"] for item in data["items"])
+        while data["next_cursor"]:
+            response = client.get(f"/api/v1/diagnostic-codes?limit=3&after={data['next_cursor']}")
+            assert response.status_code == 200
+            data = response.json()
+            seen.extend(item["code"] for item in data["items"])
+        
+        assert seen == [f"C{i:02d}" for i in range(7)]
+
+    def test_get_codes_without_total(self, client, create_diagnostic_code):
+        """Test that clients can opt out of computing totals."""
+        response = client.get("/api/v1/diagnostic-codes?include_total=false")
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] is None
+        assert len(data["items"]) == 1
+
+    def test_get_codes_serves_cached_response(self, client, create_diagnostic_code, monkeypatch):
+        """Test repeat listings are served from the encoded response cache."""
+        from app.core.cache import cache
+        stored = {}
+
+        async def aget_bytes(key):
+            return stored.get(key)
+
+        async def aset_bytes(key, value, ttl=300):
+            stored[key] = value
+            return True
+
+        monkeypatch.setattr(cache, "aget_bytes", aget_bytes)
+        monkeypatch.setattr(cache, "aset_bytes", aset_bytes)
+
+        first = client.get("/api/v1/diagnostic-codes")
+        second = client.get("/api/v1/diagnostic-codes")
+
+        assert first.headers["X-Cache"] == "MISS"
+        assert second.headers["X-Cache"] == "HIT"
+        assert second.content == first.content
+        assert second.json()["items"][0]["code"] == create_diagnostic_code.code
+
+    def test_get_codes_with_invalid_cursor(self, client):
+        """Test that a malformed cursor is rejected."""
+        response = client.get("/api/v1/diagnostic-codes?after=garbage")
+        assert response.status_code == 400
+
     def test_get_codes_with_search(self, client, db, test_org):
         """Test searching codes."""
         codes_data = [
@@ -148,6 +209,19 @@ class TestDiagnosticCodesAPI:
         data = response.json()
         assert data["total"] == 1
 
+    def test_get_codes_sorted_by_relevance(self, client, db, test_org):
+        """Test relevance ordering puts the best match first and issues no cursor."""
+        for code, description in [("A10", "Mentions E10 in passing"), ("E10", "Type 1 diabetes mellitus")]:
+            db.add(DiagnosticCode(code=code, description=description, organization_id=test_org.id))
+        db.commit()
+        
+        response = client.get("/api/v1/diagnostic-codes?search=E10&sort=relevance&limit=2")
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert [item["code"] for item in data["items"]] == ["E10", "A10"]
+        assert data["next_cursor"] is None
+
     def test_get_codes_with_category_filter(self, client, db, test_org):
         """Test filtering by category."""
         codes_data = [
@@ -219,6 +293,80 @@ class TestDiagnosticCodesAPI:
         data = response.json()
         assert data["code"] == create_diagnostic_code.code
 
+    def test_conditional_get_returns_not_modified(self, client, create_diagnostic_code, shared_generations):
+        """Test If-None-Match with the current ETag yields an empty 304."""
+        for url in (
+            "/api/v1/diagnostic-codes",
+            f"/api/v1/diagnostic-codes/{create_diagnostic_code.id}",
+            f"/api/v1/diagnostic-codes/by-code/{create_diagnostic_code.code}",
+        ):
+            etag = client.get(url).headers["ETag"]
+            
+            response = client.get(url, headers={"If-None-Match": etag})
+            
+            assert response.status_code == 304
+            assert response.content == b""
+            assert response.headers["ETag"] == etag
+
+    def test_wildcard_if_none_match_on_missing_code(self, client, shared_generations):
+        """Test If-None-Match: * does not turn a missing code into a 304."""
+        for url in ("/api/v1/diagnostic-codes/99999", "/api/v1/diagnostic-codes/by-code/NONEXISTENT"):
+            response = client.get(url, headers={"If-None-Match": "*"})
+            
+            assert response.status_code == 404
+
+    def test_no_etag_without_shared_generation(self, client, create_diagnostic_code):
+        """Test process-local versions (no Redis) never yield ETags or 304s."""
+        url = f"/api/v1/diagnostic-codes/{create_diagnostic_code.id}"
+        response = client.get(url)
+        assert "ETag" not in response.headers
+
+        response = client.get(url, headers={"If-None-Match": "*"})
+        assert response.status_code == 200
+
+    def test_etag_changes_after_write(self, client, create_diagnostic_code, shared_generations):
+        """Test code writes invalidate previously issued ETags."""
+        url = f"/api/v1/diagnostic-codes/{create_diagnostic_code.id}"
+        etag = client.get(url).headers["ETag"]
+        
+        client.put(url, json={"severity": "high"})
+        response = client.get(url, headers={"If-None-Match": etag})
+        
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert response.json()["severity"] == "high"
+
+    def test_etag_changes_after_version_restore(self, client, db, create_diagnostic_code, test_user, shared_generations):
+        """Test writes outside DiagnosticCodeService also invalidate ETags."""
+        from app.services.version_service import VersionService
+        url = f"/api/v1/diagnostic-codes/{create_diagnostic_code.id}"
+        original = create_diagnostic_code.severity
+        version = VersionService.create_version(db, create_diagnostic_code, "CREATE", test_user.id)
+        client.put(url, json={"severity": "critical"})
+        etag = client.get(url).headers["ETag"]
+
+        VersionService.restore_version(db, create_diagnostic_code.id, version.id, version.created_by)
+
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["severity"] == original
+
+    def test_get_changes(self, client, create_diagnostic_code):
+        """Test the delta-sync feed returns current rows and a resume token."""
+        response = client.get("/api/v1/diagnostic-codes/changes?since=0")
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["has_more"] is False
+        assert data["changes"][0]["operation"] == "upsert"
+        assert data["changes"][0]["code"]["code"] == create_diagnostic_code.code
+        
+        response = client.get(f"/api/v1/diagnostic-codes/changes?since={data['next_since']}")
+        assert response.json()["changes"] == []
+        
+        response = client.get("/api/v1/diagnostic-codes/changes?since=bogus")
+        assert response.status_code == 400
+
     def test_get_code_by_code_string_not_found(self, client):
         """Test getting a non-existent code by code string."""
         response = client.get("/api/v1/diagnostic-codes/by-code/NONEXISTENT")
@@ -336,3 +484,55 @@ class TestDiagnosticCodesAPI:
         data = response.json()
         assert "openapi" in data
         assert "paths" in data
+
+
+class TestSearchAPI:
+    """Test search endpoints."""
+
+    @pytest.fixture
+    def cached_bytes(self, monkeypatch):
+        """Stand-in for the Redis byte cache, which is unavailable in tests."""
+        from app.core.cache import cache
+        stored = {}
+
+        async def aget_bytes(key):
+            return stored.get(key)
+
+        async def aset_bytes(key, value, ttl=300):
+            stored[key] = value
+            return True
+
+        monkeypatch.setattr(cache, "aget_bytes", aget_bytes)
+        monkeypatch.setattr(cache, "aset_bytes", aset_bytes)
+        return stored
+
+    def test_advanced_search_serves_cached_results(self, client, create_diagnostic_code, cached_bytes):
+        """Test equivalent queries share cached results until a code write."""
+        from app.services.search_cache import search_cache
+        search_cache.reset_stats()
+        url = "/api/v1/search/advanced"
+
+        first = client.get(url, params={"query": "Diabetes"})
+        second = client.get(url, params={"query": "  diabetes "})
+
+        assert first.headers["X-Cache"] == "MISS"
+        assert second.headers["X-Cache"] == "HIT"
+        assert second.json()[0]["code"] == create_diagnostic_code.code
+
+        client.put(f"/api/v1/diagnostic-codes/{create_diagnostic_code.id}", json={"severity": "high"})
+        third = client.get(url, params={"query": "diabetes"})
+
+        assert third.headers["X-Cache"] == "MISS"
+        assert third.json()[0]["severity"] == "high"
+        assert search_cache.get_stats()["advanced"]["hit_ratio"] == pytest.approx(1 / 3, abs=1e-4)
+
+    def test_autocomplete_serves_cached_suggestions(self, client, create_diagnostic_code, cached_bytes):
+        """Test repeated autocomplete queries are answered from the cache."""
+        url = "/api/v1/search/autocomplete"
+
+        first = client.get(url, params={"query": "E11"})
+        second = client.get(url, params={"query": "e11"})
+
+        assert first.headers["X-Cache"] == "MISS"
+        assert second.headers["X-Cache"] == "HIT"
+        assert second.json() == first.json()
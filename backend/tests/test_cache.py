@@ -0,0 +1,273 @@
+"""
+Unit tests for the cache layer.
+"""
+import asyncio
+import json
+import threading
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.core.cache import CacheService, LocalCache, INVALIDATION_CHANNEL
+from app.core.serialization import CacheCodec
+
+
+@pytest.fixture
+def two_tier_cache():
+    """CacheService wired to a mocked Redis client with the local tier enabled."""
+    service = CacheService()
+    service.redis = MagicMock()
+    service.local = LocalCache(max_size=100, ttl=30)
+    return service
+
+
+@pytest.mark.unit
+class TestLocalCache:
+    """Tests for the in-process LRU tier."""
+
+    def test_lru_eviction(self):
+        """Test least recently used entries are evicted first."""
+        local = LocalCache(max_size=2, ttl=30)
+        local.set("a", 1)
+        local.set("b", 2)
+        local.get("a")
+        local.set("c", 3)
+
+        assert local.get("a") == 1
+        assert local.get("c") == 3
+        assert len(local) == 2
+
+    def test_ttl_expiry(self, monkeypatch):
+        """Test entries expire after their TTL."""
+        clock = [1000.0]
+        monkeypatch.setattr("app.core.cache.time.monotonic", lambda: clock[0])
+        local = LocalCache(max_size=10, ttl=30)
+        local.set("a", 1, ttl=5)
+
+        clock[0] += 6
+
+        assert local.get("a") != 1
+        assert len(local) == 0
+
+    def test_delete_pattern(self):
+        """Test glob pattern deletes."""
+        local = LocalCache(max_size=10, ttl=30)
+        local.set("codes:list:a", 1)
+        local.set("codes:list:b", 2)
+        local.set("codes:id:1", 3)
+
+        assert local.delete_pattern("codes:list:*") == 2
+        assert len(local) == 1
+
+
+@pytest.mark.unit
+class TestTwoTierCache:
+    """Tests for CacheService with the local tier in front of Redis."""
+
+    def test_redis_hit_populates_local_tier(self, two_tier_cache):
+        """Test a Redis hit is served from memory on the next lookup."""
+        two_tier_cache.redis.get.return_value = json.dumps({"id": 1})
+
+        assert two_tier_cache.get("codes:id:1") == {"id": 1}
+        assert two_tier_cache.get("codes:id:1") == {"id": 1}
+
+        assert two_tier_cache.redis.get.call_count == 1
+        stats = two_tier_cache.get_stats()
+        assert stats["local"]["hits"] == 1
+        assert stats["redis"]["hits"] == 1
+
+    def test_delete_publishes_invalidation(self, two_tier_cache):
+        """Test deletes drop the local copy and notify other workers."""
+        two_tier_cache.set("codes:id:1", {"id": 1})
+        two_tier_cache.delete("codes:id:1")
+
+        two_tier_cache.redis.publish.assert_called_once()
+        channel, message = two_tier_cache.redis.publish.call_args[0]
+        assert channel == INVALIDATION_CHANNEL
+        assert json.loads(message)["key"] == "codes:id:1"
+        assert len(two_tier_cache.local) == 0
+
+    def test_remote_invalidation_drops_local_entry(self, two_tier_cache):
+        """Test invalidations from other workers are applied locally."""
+        two_tier_cache.local.set("codes:list:a", [1])
+        message = {"data": json.dumps({"src": "other-worker", "op": "pattern", "key": "codes:list:*"})}
+
+        two_tier_cache._handle_invalidation(message)
+
+        assert len(two_tier_cache.local) == 0
+
+    async def test_bytes_bypass_codec(self, two_tier_cache):
+        """Test encoded responses are stored and served without re-encoding."""
+        two_tier_cache.aredis = MagicMock()
+        two_tier_cache.aredis.setex = AsyncMock(return_value=True)
+        two_tier_cache.aredis.get = AsyncMock(return_value=b'{"items":[]}')
+
+        await two_tier_cache.aset_bytes("codes:response:a", b'{"items":[]}')
+        two_tier_cache.local.delete("codes:response:a")
+
+        assert await two_tier_cache.aget_bytes("codes:response:a") == b'{"items":[]}'
+        two_tier_cache.aredis.setex.assert_awaited_once_with("codes:response:a", 300, b'{"items":[]}')
+
+
+@pytest.mark.unit
+class TestGenerations:
+    """Tests for generation-based (tag) invalidation."""
+
+    def test_bump_changes_generation_without_redis(self):
+        """Test generations advance in-process when Redis is unavailable."""
+        service = CacheService()
+        service.redis = None
+
+        before = service.get_generation("codes:org:1")
+        service.bump_generation("codes:org:1")
+
+        assert service.get_generation("codes:org:1") > before
+
+    def test_bump_never_scans_keyspace(self, two_tier_cache):
+        """Test invalidation is O(1): no KEYS/SCAN, one counter write per tag."""
+        two_tier_cache.redis.set.return_value = False
+
+        two_tier_cache.bump_generation("codes:org:1", "codes:all")
+
+        two_tier_cache.redis.keys.assert_not_called()
+        two_tier_cache.redis.scan_iter.assert_not_called()
+        assert two_tier_cache.redis.incr.call_count == 2
+
+    async def test_shared_generation_only_from_redis(self):
+        """Test process-local and error-fallback generations are not reported as shared."""
+        service = CacheService()
+        service.aredis = None
+        service.local = None
+        assert await service.aget_shared_generation("codes:org:1") is None
+
+        service.aredis = AsyncMock()
+        service.aredis.get.side_effect = ConnectionError("down")
+        assert await service.aget_generation("codes:org:1") == 0
+        assert await service.aget_shared_generation("codes:org:1") is None
+
+        service.aredis.get.side_effect = None
+        service.aredis.get.return_value = b"42"
+        assert await service.aget_shared_generation("codes:org:1") == 42
+
+
+@pytest.mark.unit
+class TestSingleFlight:
+    """Tests for get_or_set stampede protection."""
+
+    def test_concurrent_misses_compute_once(self):
+        """Test concurrent misses for one key share a single recompute."""
+        service = CacheService()
+        service.redis = None
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.1)
+            return ["result"]
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(service.get_or_set("codes:list:x", loader)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert results == [["result"]] * 5
+
+    def test_waits_for_other_worker_lock(self, two_tier_cache, monkeypatch):
+        """Test a worker that loses the Redis lock reads the leader's value."""
+        monkeypatch.setattr("app.core.cache.time.sleep", lambda _: None)
+        two_tier_cache.redis.set.return_value = None
+        two_tier_cache.redis.get.side_effect = [None, None, json.dumps(["from-leader"])]
+        loader_calls = []
+
+        value = two_tier_cache.get_or_set("codes:list:y", lambda: loader_calls.append(1))
+
+        assert value == ["from-leader"]
+        assert loader_calls == []
+
+    async def test_async_concurrent_misses_compute_once(self):
+        """Test concurrent coroutines share one recompute without blocking the loop."""
+        service = CacheService()
+        service.redis = None
+        service.aredis = None
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"total": 3}
+
+        results = await asyncio.gather(
+            *(service.aget_or_set("codes:count:x", loader) for _ in range(5))
+        )
+
+        assert len(calls) == 1
+        assert results == [{"total": 3}] * 5
+
+    async def test_async_waiters_survive_leader_cancellation(self):
+        """Test a cancelled leader does not cancel the coroutines waiting on it."""
+        service = CacheService()
+        service.redis = None
+        service.aredis = None
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"total": 3}
+
+        leader = asyncio.create_task(service.aget_or_set("codes:count:y", loader))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(service.aget_or_set("codes:count:y", loader)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        results = await asyncio.gather(*waiters)
+        assert leader.cancelled()
+        assert results == [{"total": 3}] * 3
+        # One waiter took over as leader for the others
+        assert len(calls) == 2
+
+
+@pytest.mark.unit
+class TestCacheCodec:
+    """Tests for cache value encodings."""
+
+    @pytest.mark.parametrize("serializer", ["json", "msgpack"])
+    @pytest.mark.parametrize("compression", ["none", "zlib"])
+    def test_round_trip(self, serializer, compression):
+        """Test every configuration decodes what it encodes."""
+        codec = CacheCodec(serializer=serializer, compression=compression, compress_min_bytes=0)
+        value = [[1, 2, "E001", "Engine fault", None, True, "2024-01-01T00:00:00"]] * 20
+
+        assert codec.decode(codec.encode(value)) == value
+
+    def test_decodes_other_configurations(self):
+        """Test entries written with different settings stay readable."""
+        writer = CacheCodec(serializer="msgpack", compression="zlib", compress_min_bytes=0)
+        reader = CacheCodec(serializer="json")
+
+        assert reader.decode(writer.encode({"total": 5})) == {"total": 5}
+
+    def test_decodes_legacy_json(self):
+        """Test plain JSON written by older releases is still readable."""
+        codec = CacheCodec(serializer="msgpack")
+
+        assert codec.decode(b'{"total": 5}') == {"total": 5}
+        assert codec.decode('{"total": 5}') == {"total": 5}
+
+    def test_small_values_skip_compression(self):
+        """Test values below the threshold are stored uncompressed."""
+        codec = CacheCodec(serializer="json", compression="zlib", compress_min_bytes=1024)
+
+        assert codec.encode({"total": 5})[2:3] == b"-"
+
+    def test_unknown_serializer_rejected(self):
+        """Test misconfiguration fails loudly."""
+        with pytest.raises(ValueError):
+            CacheCodec(serializer="pickle")
@@ -0,0 +1,103 @@
+"""
+Unit tests for the in-process autocomplete index.
+"""
+import pytest
+
+from app.models.diagnostic_code import DiagnosticCode
+from app.schemas.diagnostic_code import DiagnosticCodeUpdate
+from app.services.catalog_index import AutocompleteIndex, catalog_indexes
+from app.services.diagnostic_code_service import DiagnosticCodeService
+from app.services.search_service import SearchService
+
+
+@pytest.fixture
+def index():
+    return AutocompleteIndex([
+        (1, "E11.9", "Type 2 diabetes mellitus without complications", "Endocrine"),
+        (2, "E10.9", "Type 1 diabetes mellitus without complications", "Endocrine"),
+        (3, "I10", "Essential (primary) hypertension", "Circulatory"),
+        (4, "ENG01", "Engine overheating", None),
+    ])
+
+
+@pytest.mark.unit
+class TestAutocompleteIndex:
+    """Tests for AutocompleteIndex."""
+
+    def test_code_prefix_ranks_first(self, index):
+        """Test code-prefix matches come before description matches."""
+        results = index.suggest("e")
+
+        assert [(entry[0], match_type) for entry, match_type in results] == [
+            ("E10.9", "code"),
+            ("E11.9", "code"),
+            ("ENG01", "code"),
+            ("I10", "description"),
+        ]
+
+    def test_category_prefix(self, index):
+        """Test category-prefix matches are reported as such."""
+        results = index.suggest("circ")
+
+        assert [(entry[0], match_type) for entry, match_type in results] == [("I10", "category")]
+
+    def test_description_word_prefixes(self, index):
+        """Test every query word must prefix a description word."""
+        results = index.suggest("type 2 diab")
+
+        assert [(entry[0], match_type) for entry, match_type in results] == [("E11.9", "description")]
+
+    def test_limit(self, index):
+        """Test results stop at the limit."""
+        assert len(index.suggest("e", limit=2)) == 2
+
+    def test_no_match(self, index):
+        """Test unknown prefixes return nothing."""
+        assert index.suggest("zzz") == []
+
+
+@pytest.mark.unit
+class TestCatalogIndexRegistry:
+    """Tests for index freshness."""
+
+    def test_rebuilds_after_write(self, db, create_diagnostic_code, test_org):
+        """Test a code write is visible to the next autocomplete lookup."""
+        search = SearchService(db)
+        assert search.get_autocomplete_suggestions("E11", organization_id=test_org.id)[0].match_type == "code"
+
+        DiagnosticCodeService(db).update_code(create_diagnostic_code.id, DiagnosticCodeUpdate(is_active=False))
+
+        assert search.get_autocomplete_suggestions("E11", organization_id=test_org.id) == []
+
+    def test_reuses_index_while_version_unchanged(self, db, create_diagnostic_code, test_org):
+        """Test lookups do not query the database while the catalog is unchanged."""
+        first = catalog_indexes.get(db, test_org.id)
+        db.commit()
+
+        assert catalog_indexes.get(db, test_org.id) is first
+
+    def test_any_committed_code_write_invalidates(self, db, create_diagnostic_code, test_org):
+        """Test code writes outside DiagnosticCodeService (restores, imports) still invalidate."""
+        first = catalog_indexes.get(db, test_org.id)
+        db.add(DiagnosticCode(code="X1", description="Unseen", organization_id=test_org.id))
+        db.commit()
+
+        index = catalog_indexes.get(db, test_org.id)
+        assert [code for (code, _, _), _ in index.suggest("X1", 5)] == ["X1"]
+
+    def test_refreshes_in_place_from_code_changes(self, db, create_diagnostic_code, test_org):
+        """Test writes are applied to the existing index instead of rebuilding it."""
+        first = catalog_indexes.get(db, test_org.id)
+        cross_org = catalog_indexes.get(db, None)
+        service = DiagnosticCodeService(db)
+        service.update_code(create_diagnostic_code.id, DiagnosticCodeUpdate(description="Cholera", category="Infectious"))
+        db.add(DiagnosticCode(code="E11.65", description="Type 2 diabetes with hyperglycemia", organization_id=test_org.id))
+        db.commit()
+
+        for organization_id, previous in ((test_org.id, first), (None, cross_org)):
+            index = catalog_indexes.get(db, organization_id)
+            assert index is previous
+            assert [code for (code, _, _), _ in index.suggest("E11", 5)] == ["E11.65", "E11.9"]
+            assert [(code, match) for (code, _, _), match in index.suggest("infect", 5)] == [("E11.9", "category")]
+            assert [code for (code, _, _), _ in index.suggest("type 2", 5)] == ["E11.65"]
+            assert [code for (code, _, _), _ in index.suggest("cholera", 5)] == ["E11.9"]
@@ -0,0 +1,74 @@
+"""
+Tests for the shared outgoing HTTP client.
+"""
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from app.core.config import settings
+from app.core.http_client import HTTPClientManager, http_client
+from app.models.webhook import Webhook
+from app.services.webhook_service import WebhookService
+
+
+@pytest.fixture
+async def manager():
+    manager = HTTPClientManager()
+    yield manager
+    await manager.close()
+
+
+class TestHTTPClientManager:
+    """Tests for the pooled client owned by the application."""
+
+    async def test_client_is_reused(self, manager: HTTPClientManager):
+        client = manager.get()
+        assert manager.get() is client
+        assert await manager.start() is client
+
+    async def test_close_then_get_creates_new_client(self, manager: HTTPClientManager):
+        client = manager.get()
+        await manager.close()
+        assert client.is_closed
+        assert manager.get() is not client
+
+    async def test_client_of_previous_loop_is_closed(self, manager: HTTPClientManager):
+        previous = await asyncio.to_thread(asyncio.run, manager.start())
+        client = manager.get()
+        await asyncio.sleep(0)
+
+        assert client is not previous
+        assert previous.is_closed
+
+    async def test_host_slot_limits_requests_per_host(self, manager: HTTPClientManager, monkeypatch):
+        monkeypatch.setattr(settings, "HTTP_CLIENT_MAX_PER_HOST", 2)
+        in_flight = {"a": 0, "b": 0}
+        peak = {"a": 0, "b": 0}
+
+        async def request(host: str):
+            async with manager.host_slot(f"https://{host}.example.com/hook"):
+                in_flight[host] += 1
+                peak[host] = max(peak[host], in_flight[host])
+                await asyncio.sleep(0.01)
+                in_flight[host] -= 1
+
+        await asyncio.gather(*(request(host) for host in "ab" * 5))
+        assert peak == {"a": 2, "b": 2}
+
+    async def test_deliveries_share_the_client(self):
+        webhook = Webhook(id=1, url="https://example.com/hook", timeout_seconds=5)
+        response = Mock(status_code=200, text="OK")
+
+        await http_client.close()
+        try:
+            with patch("httpx.AsyncClient.post", new_callable=AsyncMock, return_value=response) as mock_post, \
+                    patch.object(http_client, "_create", wraps=http_client._create) as create:
+                for _ in range(3):
+                    delivery = await WebhookService._deliver_webhook(webhook, "code.created", {"id": 1})
+                    assert delivery.is_success is True
+
+            assert mock_post.call_count == 3
+            create.assert_called_once()
+        finally:
+            await http_client.close()
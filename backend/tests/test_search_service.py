@@ -0,0 +1,259 @@
+"""
+Unit tests for SearchService.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.models.diagnostic_code import DiagnosticCode
+from app.models.search import RecentSearch
+from app.schemas.diagnostic_code import DiagnosticCodeUpdate
+from app.services.diagnostic_code_service import DiagnosticCodeService
+from app.services.ranked_search import ranked_indexes
+from app.services.fuzzy_scoring import FuzzyIndex, fuzzy_indexes, trigram_similarity
+from app.services.search_history import SearchHistoryWriter
+from app.services.search_service import SearchService, compile_highlighter
+
+
+@pytest.mark.unit
+class TestFuzzyIndex:
+    """Tests for the vectorized pg_trgm fallback."""
+
+    @pytest.fixture
+    def index(self):
+        return FuzzyIndex([
+            (1, "E11.9", "Type 2 diabetes mellitus without complications", "Endocrine", "low", True),
+            (2, "I10", "Essential (primary) hypertension", "Circulatory", "high", True),
+            (3, "E10.9", "Type 1 diabetes mellitus", "Endocrine", "low", False),
+            (4, "---", "", None, None, True),
+        ])
+
+    def test_matches_pg_trgm(self):
+        """Test similarity agrees with pg_trgm's documented example."""
+        assert trigram_similarity("word", "two words") == pytest.approx(4 / 11)
+
+    def test_code_similarity_matches_scalar(self, index):
+        """Test the batched code similarity equals the scalar definition."""
+        assert index.score("E11.8").of(1) == pytest.approx(trigram_similarity("E11.8", "E11.9"))
+
+    def test_description_typos(self, index):
+        """Test misspelled words still find the right descriptions."""
+        scores = index.score("diabetis melitus")
+
+        assert scores.of(1) >= 0.6 and scores.of(3) >= 0.6
+        assert scores.of(2) == 0.0
+        assert scores.of(4) == 0.0
+
+    def test_top_applies_filters(self, index):
+        """Test top() ranks and filters in the arrays."""
+        scores = index.score("diabetis melitus")
+
+        assert [code_id for code_id, _ in scores.top(5, is_active=True)] == [1]
+        assert len(scores.top(1)) == 1
+
+
+@pytest.mark.unit
+class TestAdvancedSearch:
+    """Tests for SearchService.advanced_search."""
+
+    @pytest.fixture
+    def codes(self, db, test_org):
+        for code, description in [
+            ("E11.9", "Type 2 diabetes mellitus without complications"),
+            ("I10", "Essential (primary) hypertension"),
+            ("J45.909", "Unspecified asthma, uncomplicated"),
+        ]:
+            db.add(DiagnosticCode(
+                code=code,
+                description=description,
+                category="General",
+                severity="low",
+                organization_id=test_org.id,
+            ))
+        db.commit()
+
+    def test_substring_search(self, db, codes):
+        """Test plain search matches substrings case-insensitively."""
+        results = SearchService(db).advanced_search("HYPERTENSION")
+
+        assert [r.code for r in results] == ["I10"]
+
+    def test_fuzzy_search_finds_typos(self, db, codes):
+        """Test fuzzy search retrieves codes a misspelled query never matches literally."""
+        service = SearchService(db)
+
+        assert service.advanced_search("diabetis mellitus") == []
+        results = service.advanced_search("diabetis mellitus", fuzzy=True)
+
+        assert results[0].code == "E11.9"
+        assert results[0].relevance_score > 0
+
+
+    def test_fuzzy_index_refreshes_incrementally(self, db, codes, test_org):
+        """Test writes reach the index incrementally while scores taken before stay consistent."""
+        index = fuzzy_indexes.get(db, test_org.id)
+        service = DiagnosticCodeService(db)
+        e11 = service.get_code_by_code("E11.9", test_org.id)
+        before = index.score("hyperglycemia")
+
+        service.update_code(e11.id, DiagnosticCodeUpdate(description="Hyperglycemia, unspecified"))
+        service.delete_code(service.get_code_by_code("I10", test_org.id).id)
+        after = fuzzy_indexes.get(db, test_org.id).score("hyperglycemia")
+
+        assert fuzzy_indexes.get(db, test_org.id) is index
+        assert before.top(5) == [] and before.of(e11.id) == 0.0
+        assert [code_id for code_id, _ in after.top(5)] == [e11.id]
+        assert index.score("hypertension").top(5) == []
+
+
+@pytest.mark.unit
+class TestRankedSearch:
+    """Tests for BM25 ranked search."""
+
+    @pytest.fixture
+    def codes(self, db, test_org):
+        for code, description, category in [
+            ("E11.9", "Type 2 diabetes mellitus without complications", "Endocrine"),
+            ("E10.9", "Type 1 diabetes mellitus without complications", "Endocrine"),
+            ("O24.4", "Gestational diabetes mellitus in pregnancy", "Pregnancy"),
+            ("I10", "Essential (primary) hypertension", "Circulatory"),
+        ]:
+            db.add(DiagnosticCode(
+                code=code,
+                description=description,
+                category=category,
+                severity="low",
+                organization_id=test_org.id,
+            ))
+        db.commit()
+
+    def test_ranks_by_relevance(self, db, codes, test_org):
+        """Test documents matching more query terms rank first."""
+        results = SearchService(db).advanced_search(
+            "type 2 diabetes", mode="ranked", organization_id=test_org.id
+        )
+
+        assert results[0].code == "E11.9"
+        assert {r.code for r in results} == {"E11.9", "E10.9", "O24.4"}
+        assert results[0].relevance_score > results[-1].relevance_score
+
+    def test_whole_code_query(self, db, codes, test_org):
+        """Test a code query ranks that code first."""
+        results = SearchService(db).advanced_search("E10.9", mode="ranked", organization_id=test_org.id)
+
+        assert results[0].code == "E10.9"
+
+    def test_filters(self, db, codes, test_org):
+        """Test filters apply to ranked results."""
+        results = SearchService(db).advanced_search(
+            "diabetes", mode="ranked", category="Pregnancy", organization_id=test_org.id
+        )
+
+        assert [r.code for r in results] == ["O24.4"]
+
+    def test_incremental_refresh(self, db, codes, test_org):
+        """Test code writes are applied to the existing index without a rebuild."""
+        service = SearchService(db)
+        index = ranked_indexes.get(db, test_org.id)
+        code_service = DiagnosticCodeService(db)
+        e11 = code_service.get_code_by_code("E11.9", test_org.id)
+
+        code_service.update_code(e11.id, DiagnosticCodeUpdate(description="Hyperglycemia, unspecified"))
+        code_service.delete_code(code_service.get_code_by_code("I10", test_org.id).id)
+
+        assert ranked_indexes.get(db, test_org.id) is index
+        assert "E11.9" not in [r.code for r in service.advanced_search("diabetes", mode="ranked", organization_id=test_org.id)]
+        assert [r.code for r in service.advanced_search("hyperglycemia", mode="ranked", organization_id=test_org.id)] == ["E11.9"]
+        assert service.advanced_search("hypertension", mode="ranked", organization_id=test_org.id) == []
+
+    def test_search_survives_concurrent_tombstone(self, db, codes, test_org):
+        """Test a code tombstoned by a refresh in the middle of a search does not break it."""
+        index = ranked_indexes.get(db, test_org.id)
+        e11 = DiagnosticCodeService(db).get_code_by_code("E11.9", test_org.id)
+        terms = []
+
+        class RacingPostings(dict):
+            def get(self, term, default=None):
+                terms.append(term)
+                if len(terms) == 2:
+                    # A refresh on another thread lands after the first term was scored
+                    index._remove(e11.id)
+                return super().get(term, default)
+
+        index.postings = RacingPostings(index.postings)
+        results = index.search("diabetes mellitus", 10, category=e11.category)
+
+        assert all(doc is not None for doc, _ in results)
+        assert "E11.9" in [doc.code for doc, _ in results]
+
+
+@pytest.mark.unit
+class TestHighlighting:
+    """Tests for search result highlighting."""
+
+    def test_highlights_every_term(self, db):
+        """Test each query term is marked, not just the literal full query."""
+        text = SearchService(db)._highlight_text("Type 2 diabetes mellitus", "diabetes TYPE")
+
+        assert text == "<mark>Type</mark> 2 <mark>diabetes</mark> mellitus"
+
+    def test_longest_term_wins(self, db):
+        """Test overlapping terms highlight the longer match."""
+        text = SearchService(db)._highlight_text("E11.9 and E11", "E11 E11.9")
+
+        assert text == "<mark>E11.9</mark> and <mark>E11</mark>"
+
+    def test_matcher_compiled_once_per_query(self, db):
+        """Test repeated highlights reuse the compiled matcher."""
+        compile_highlighter.cache_clear()
+        service = SearchService(db)
+        for text in ("Type 2 diabetes", "Type 1 diabetes", "Gestational diabetes"):
+            service._highlight_text(text, "diabetes")
+
+        assert compile_highlighter.cache_info().misses == 1
+
+
+@pytest.mark.unit
+class TestSearchHistory:
+    """Tests for batched search history writes."""
+
+    def test_skips_recent_duplicates(self, db, test_user):
+        """Test queries already among the last 10 searches are not stored again."""
+        service = SearchService(db)
+        times = [datetime.utcnow() + timedelta(seconds=i) for i in range(4)]
+        service.record_searches([(test_user.id, "diabetes", times[0]), (test_user.id, "asthma", times[1])])
+        inserted = service.record_searches([(test_user.id, "diabetes", times[2]), (test_user.id, "fracture", times[3])])
+
+        assert inserted == 1
+        assert [s.query for s in service.get_recent_searches(test_user.id)] == ["fracture", "asthma", "diabetes"]
+
+    def test_trims_to_history_limit(self, db, test_user):
+        """Test a batch trims the oldest searches beyond the limit in one go."""
+        service = SearchService(db)
+        start = datetime.utcnow()
+        limit = settings.SEARCH_HISTORY_LIMIT
+        service.record_searches(
+            [(test_user.id, f"query {i}", start + timedelta(seconds=i)) for i in range(limit + 5)]
+        )
+
+        assert db.query(RecentSearch).count() == limit
+        assert service.get_recent_searches(test_user.id, 1)[0].query == f"query {limit + 4}"
+        assert db.query(RecentSearch).filter(RecentSearch.query == "query 4").count() == 0
+
+    def test_writer_coalesces_buffered_searches(self, db, test_user):
+        """Test the writer buffers searches and writes repeated ones once."""
+        writer = SearchHistoryWriter(sessionmaker(bind=db.get_bind()), flush_interval=60)
+        assert writer.record(test_user.id, "diabetes") is False
+
+        writer.start()
+        try:
+            for query in ("diabetes", "asthma", "diabetes"):
+                assert writer.record(test_user.id, query)
+            assert writer.pending() == 2
+        finally:
+            writer.stop()
+
+        assert writer.pending() == 0
+        assert [s.query for s in SearchService(db).get_recent_searches(test_user.id)] == ["diabetes", "asthma"]
@@ -2,8 +2,8 @@
 Unit tests for DiagnosticCodeService.
 """
 import pytest
-from app.services.diagnostic_code_service import DiagnosticCodeService
-from app.schemas.diagnostic_code import DiagnosticCodeCreate, DiagnosticCodeUpdate
+from app.services.diagnostic_code_service import DiagnosticCodeService, CachedDiagnosticCode
+from app.schemas.diagnostic_code import DiagnosticCodeCreate, DiagnosticCodeUpdate, DiagnosticCodeResponse
 from app.models.diagnostic_code import DiagnosticCode
 
 
@@ -171,6 +171,33 @@ class TestDiagnosticCodeService:
         codes = service.get_codes(skip=5, limit=5)
         assert len(codes) == 5
 
+    def test_get_codes_with_cursor(self, db, test_org):
+        """Test keyset pagination of codes."""
+        service = DiagnosticCodeService(db)
+        
+        for i in range(7):
+            db.add(DiagnosticCode(code=f"C{i}", description=f"Code {i}", organization_id=test_org.id))
+        db.commit()
+        
+        first_page = service.get_codes(limit=3)
+        second_page = service.get_codes(limit=3, after_id=first_page[-1].id)
+        third_page = service.get_codes(limit=3, after_id=second_page[-1].id)
+        
+        assert [c.code for c in second_page] == ["C3", "C4", "C5"]
+        assert [c.code for c in third_page] == ["C6"]
+
+    def test_cursor_round_trip(self, db):
+        """Test cursors encode the last id and are bound to their filters."""
+        service = DiagnosticCodeService(db)
+        
+        token = service.encode_cursor(42, category="ENDOCRINE", organization_id=1)
+        
+        assert service.decode_cursor(token, category="ENDOCRINE", organization_id=1) == 42
+        with pytest.raises(ValueError):
+            service.decode_cursor(token, category="RESPIRATORY", organization_id=1)
+        with pytest.raises(ValueError):
+            service.decode_cursor("not-a-cursor")
+
     def test_count_codes(self, db, test_org):
         """Test counting codes."""
         service = DiagnosticCodeService(db)
@@ -212,6 +239,39 @@ class TestDiagnosticCodeService:
         count = service.count_codes(search="diabetes")
         assert count == 2
 
+    def test_get_total_exact_without_estimates(self, db, test_org):
+        """Test totals fall back to exact counts when no planner estimate exists."""
+        service = DiagnosticCodeService(db)
+        
+        for i in range(3):
+            db.add(DiagnosticCode(code=f"C{i}", description=f"Code {i}", organization_id=test_org.id))
+        db.commit()
+        
+        assert service.estimate_count(organization_id=test_org.id) is None
+        assert service.get_total(organization_id=test_org.id) == (3, False)
+
+    def test_count_estimate_cached_per_catalog_version(self, db, test_org, monkeypatch):
+        """Test the planner estimate runs once per catalog version, not per listing."""
+        from app.core.cache import cache
+        from app.services import diagnostic_code_service
+        
+        stored = {}
+        monkeypatch.setattr(cache, "get_or_set", lambda key, loader, **kwargs: stored.get(key) or stored.setdefault(key, loader()))
+        monkeypatch.setattr(diagnostic_code_service, "is_postgresql", lambda db: True)
+        explains = []
+        monkeypatch.setattr(
+            DiagnosticCodeService, "_explain_count", lambda self, organization_id: explains.append(organization_id) or 50000
+        )
+        service = DiagnosticCodeService(db)
+        
+        assert service.get_total(organization_id=test_org.id) == (50000, True)
+        assert service.get_total(organization_id=test_org.id) == (50000, True)
+        assert explains == [test_org.id]
+        
+        service.create_code(DiagnosticCodeCreate(code="N1", description="New"), organization_id=test_org.id)
+        assert service.get_total(organization_id=test_org.id) == (50000, True)
+        assert explains == [test_org.id, test_org.id]
+
     def test_update_code(self, db, create_diagnostic_code):
         """Test updating a code."""
         service = DiagnosticCodeService(db)
@@ -229,6 +289,26 @@ class TestDiagnosticCodeService:
         assert updated_code.code == create_diagnostic_code.code
         assert updated_code.category == create_diagnostic_code.category
 
+    def test_update_code_bumps_catalog_version(self, db, create_diagnostic_code, test_org):
+        """Test writes invalidate the organization's cached catalog."""
+        service = DiagnosticCodeService(db)
+        before = service.catalog_version(test_org.id)
+        
+        service.update_code(create_diagnostic_code.id, DiagnosticCodeUpdate(severity="high"))
+        
+        assert service.catalog_version(test_org.id) != before
+
+    def test_cached_row_round_trip(self, db, create_diagnostic_code):
+        """Test cached rows rehydrate into records the API schema accepts."""
+        row = CachedDiagnosticCode.to_row(create_diagnostic_code)
+        
+        cached = CachedDiagnosticCode.from_row(row)
+        
+        assert cached.code == create_diagnostic_code.code
+        assert cached.created_at == create_diagnostic_code.created_at
+        response = DiagnosticCodeResponse.model_validate(cached)
+        assert response.id == create_diagnostic_code.id
+
     def test_update_code_not_found(self, db):
         """Test updating a non-existent code."""
         service = DiagnosticCodeService(db)
@@ -261,6 +341,91 @@ class TestDiagnosticCodeService:
         deleted_code = service.get_code_by_id(code_id)
         assert deleted_code is None
 
+    def test_changes_track_writes_and_tombstones(self, db, create_diagnostic_code, test_org):
+        """Test the change feed reports upserts, then a tombstone after delete."""
+        service = DiagnosticCodeService(db)
+        code_id = create_diagnostic_code.id
+        
+        entries, since, has_more = service.get_changes(test_org.id)
+        assert [(op, cid) for _, op, cid, _ in entries] == [("upsert", code_id)]
+        assert has_more is False
+        
+        service.update_code(code_id, DiagnosticCodeUpdate(severity="high"))
+        entries, since, _ = service.get_changes(test_org.id, since=since)
+        assert entries[0][3].severity == "high"
+        
+        service.delete_code(code_id)
+        entries, since, _ = service.get_changes(test_org.id, since=since)
+        assert [(op, cid, code) for _, op, cid, code in entries] == [("delete", code_id, None)]
+        
+        assert service.get_changes(test_org.id, since=since) == ([], since, False)
+
+    def test_changes_paginate(self, db, test_org):
+        """Test change pages resume from next_since without gaps."""
+        service = DiagnosticCodeService(db)
+        for i in range(5):
+            db.add(DiagnosticCode(code=f"P{i}", description="Paged", organization_id=test_org.id))
+        db.commit()
+        
+        first, since, has_more = service.get_changes(test_org.id, limit=3)
+        second, _, has_more_after = service.get_changes(test_org.id, since=since, limit=3)
+        
+        assert has_more is True and has_more_after is False
+        assert [code.code for *_, code in first + second] == [f"P{i}" for i in range(5)]
+
+    def test_changes_wait_for_earlier_transactions(self, db, test_org, monkeypatch):
+        """Test a change committed before an older, still-running one is not skipped."""
+        from app.models import code_change
+        from app.services.catalog_index import catalog_indexes
+        from tests.conftest import TestingSessionLocal
+        
+        # Emulate PostgreSQL: each writer has a txid, readers only see txids below xmin
+        writer_txid, settled_txid = {}, {"xmin": None}
+        monkeypatch.setattr(code_change, "_writer_txid", lambda connection: writer_txid[connection.info["writer"]])
+        monkeypatch.setattr(code_change, "_settled_txid", lambda db: settled_txid["xmin"])
+        service = DiagnosticCodeService(db)
+        index = catalog_indexes.get(db, test_org.id)
+        
+        session_a, session_b = TestingSessionLocal(), TestingSessionLocal()
+        try:
+            # A takes change id 1 but is still running when B (id 2) commits
+            writer_txid["a"], writer_txid["b"] = 10, 11
+            session_a.connection().info["writer"] = "a"
+            session_a.add(DiagnosticCode(code="A1", description="First", organization_id=test_org.id))
+            session_a.flush()
+            settled_txid["xmin"] = 10
+            session_b.connection().info["writer"] = "b"
+            session_b.add(DiagnosticCode(code="B1", description="Second", organization_id=test_org.id))
+            session_b.commit()
+            
+            assert service.get_changes(test_org.id) == ([], "0", False)
+            assert code_change.changes_after(db, test_org.id, code_change.START, 10) == ([], True)
+            assert catalog_indexes.get(db, test_org.id) is index and index.behind
+            
+            session_a.commit()
+            settled_txid["xmin"] = 12
+        finally:
+            session_a.close()
+            session_b.close()
+        
+        entries, since, has_more = service.get_changes(test_org.id)
+        assert [code.code for *_, code in entries] == ["A1", "B1"]
+        assert since == "11:2" and has_more is False
+        assert service.get_changes(test_org.id, since=since) == ([], since, False)
+        assert catalog_indexes.get(db, test_org.id) is index and not index.behind
+        assert [entry[0][0] for entry in index.suggest("A1")] == ["A1"]
+
+    def test_change_tokens(self):
+        """Test change tokens round-trip and accept bare change ids."""
+        from app.models.code_change import START, format_cursor, parse_cursor
+        
+        assert parse_cursor(format_cursor((41, 7))) == (41, 7)
+        assert parse_cursor("0") == START and format_cursor(START) == "0"
+        assert parse_cursor("25") == (0, 25)
+        for token in ("", "x", "1:x", "-1:2", "1:2:3"):
+            with pytest.raises(ValueError):
+                parse_cursor(token)
+
     def test_delete_code_not_found(self, db):
         """Test deleting a non-existent code."""
         service = DiagnosticCodeService(db)
@@ -1,13 +1,16 @@
 """
 Tests for webhook service.
 """
+import asyncio
+import threading
 import pytest
-from datetime import datetime
-from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session, sessionmaker
 from unittest.mock import Mock, AsyncMock, patch
 
 from app.services.webhook_service import WebhookService
-from app.models.webhook import Webhook, WebhookDelivery
+from app.services.webhook_worker import WebhookWorker
+from app.models.webhook import Webhook, WebhookDelivery, WebhookOutbox
 from app.schemas.webhook import WebhookCreate
 
 
@@ -30,6 +33,18 @@ def test_webhook(db: Session, test_user):
     return webhook
 
 
+@pytest.fixture
+def worker(db: Session):
+    """A webhook worker using the test database."""
+    return WebhookWorker(session_factory=sessionmaker(bind=db.get_bind()), concurrency=4)
+
+
+def make_due(db: Session):
+    """Move every scheduled retry to now."""
+    db.query(WebhookOutbox).update({WebhookOutbox.next_attempt_at: datetime.utcnow()})
+    db.commit()
+
+
 class TestWebhookService:
     """Test suite for WebhookService."""
 
@@ -110,7 +125,6 @@ class TestWebhookService:
         deleted = db.query(Webhook).filter(Webhook.id == test_webhook.id).first()
         assert deleted is None
 
-    @pytest.mark.skip(reason="_get_active_webhooks_for_event method not implemented")
     def test_get_active_webhooks_for_event(self, db: Session, test_user):
         """Test filtering webhooks by event."""
         # Create webhooks with different events
@@ -200,7 +214,7 @@ class TestWebhookService:
         assert "Connection error" in delivery.error_message
 
     @pytest.mark.asyncio
-    async def test_webhook_retry_logic(self, db: Session, test_user):
+    async def test_webhook_retry_logic(self, db: Session, test_user, worker: WebhookWorker):
         """Test webhook retry with exponential backoff."""
         webhook = Webhook(
             name="Retry Webhook",
@@ -235,6 +249,10 @@ class TestWebhookService:
                 mock_post.side_effect = mock_post_side_effect
 
                 await WebhookService.trigger_webhooks(db, "code.created", payload)
+                # Each retry is scheduled in the outbox rather than slept on
+                for _ in range(3):
+                    make_due(db)
+                    await worker.drain()
 
                 # Should have retried 3 times
                 assert call_count == 3
@@ -340,7 +358,7 @@ class TestWebhookService:
         assert len(deliveries) == 5
 
     @pytest.mark.asyncio
-    async def test_webhook_timeout(self, db: Session, test_user):
+    async def test_webhook_timeout(self, db: Session, test_user, worker: WebhookWorker):
         """Test webhook request timeout."""
         webhook = Webhook(
             name="Timeout Webhook",
@@ -360,6 +378,7 @@ class TestWebhookService:
             mock_post.side_effect = httpx.TimeoutException("Request timed out")
 
             await WebhookService.trigger_webhooks(db, "code.created", payload)
+            await worker.drain()
 
         # Check delivery was logged with timeout error
         delivery = db.query(WebhookDelivery).filter(
@@ -392,3 +411,193 @@ class TestWebhookService:
         assert failure_count == 3
         assert success_count == 7
         assert failure_count == 3
+
+
+def ok_response(status_code=200):
+    response = Mock()
+    response.status_code = status_code
+    response.text = "OK"
+    return response
+
+
+class TestWebhookOutbox:
+    """Tests for the transactional outbox and the webhook worker."""
+
+    def make_webhook(self, db: Session, user, name="Hook", **kwargs):
+        webhook = Webhook(
+            name=name,
+            url=f"https://example.com/{name}",
+            events=kwargs.pop("events", ["code.created"]),
+            created_by=user.id,
+            **kwargs
+        )
+        db.add(webhook)
+        db.commit()
+        return webhook
+
+    def test_enqueue_commits_with_caller_transaction(self, db: Session, test_webhook: Webhook, test_user):
+        self.make_webhook(db, test_user, "Other", events=["code.deleted"])
+
+        assert WebhookService.enqueue_event(db, "code.created", {"id": 1}) == 1
+        db.rollback()
+        assert db.query(WebhookOutbox).count() == 0
+
+        WebhookService.enqueue_event(db, "code.created", {"id": 2})
+        db.commit()
+        row = db.query(WebhookOutbox).one()
+        assert row.webhook_id == test_webhook.id
+        assert row.payload == {"id": 2}
+        assert row.status == WebhookOutbox.PENDING
+        assert row.attempts == 0
+
+    def test_create_code_queues_event_without_delivering(self, client, db: Session, test_webhook: Webhook):
+        with patch('httpx.AsyncClient.post', new_callable=AsyncMock) as mock_post:
+            response = client.post(
+                "/api/v1/diagnostic-codes/",
+                json={"code": "W01", "description": "Webhook code", "category": "Test", "severity": "low"}
+            )
+            assert response.status_code == 201
+            mock_post.assert_not_called()
+
+        row = db.query(WebhookOutbox).one()
+        assert row.event_type == "code.created"
+        assert row.payload["code"] == "W01"
+
+    @pytest.mark.asyncio
+    async def test_worker_delivers_and_removes_event(self, db: Session, test_webhook: Webhook, worker: WebhookWorker):
+        await WebhookService.trigger_webhooks(db, "code.created", {"id": 7})
+        outbox_id = db.query(WebhookOutbox.id).scalar()
+
+        with patch('httpx.AsyncClient.post', new_callable=AsyncMock) as mock_post:
+            mock_post.return_value = ok_response()
+            assert await worker.drain() == 1
+
+        headers = mock_post.call_args[1]["headers"]
+        assert headers["X-Webhook-Delivery"] == str(outbox_id)
+        assert headers["X-Webhook-Signature"].startswith("sha256=")
+        assert db.query(WebhookOutbox).count() == 0
+
+        delivery = db.query(WebhookDelivery).one()
+        assert delivery.is_success is True
+        assert delivery.status_code == 200
+        db.refresh(test_webhook)
+        assert test_webhook.total_triggers == 1
+        assert test_webhook.failed_triggers == 0
+
+    @pytest.mark.asyncio
+    async def test_events_to_one_webhook_stay_in_order(self, db: Session, test_webhook: Webhook, test_user, worker: WebhookWorker):
+        other = self.make_webhook(db, test_user, "Other")
+        for n in range(3):
+            await WebhookService.trigger_webhooks(db, "code.created", {"n": n})
+
+        jobs = worker.claim(10)
+        # One event per webhook: the oldest
+        assert sorted((job.webhook.id, job.payload["n"]) for job in jobs) == [(test_webhook.id, 0), (other.id, 0)]
+
+        # While the head is leased or waiting for a retry, later events wait too
+        assert worker.claim(10) == []
+        job = next(job for job in jobs if job.webhook.id == test_webhook.id)
+        worker.settle(job, WebhookDelivery(webhook_id=test_webhook.id, event_type="code.created", payload={}, status_code=500, is_success=False))
+        assert worker.claim(10) == []
+
+        make_due(db)
+        assert [job.payload["n"] for job in worker.claim(10)] == [0]
+
+    @pytest.mark.asyncio
+    async def test_failed_attempts_are_rescheduled_then_failed(self, db: Session, test_user, worker: WebhookWorker):
+        webhook = self.make_webhook(db, test_user, retry_count=2)
+        await WebhookService.trigger_webhooks(db, "code.created", {"n": 0})
+        await WebhookService.trigger_webhooks(db, "code.created", {"n": 1})
+
+        with patch('httpx.AsyncClient.post', new_callable=AsyncMock) as mock_post:
+            mock_post.return_value = ok_response(503)
+            before = datetime.utcnow()
+            assert await worker.drain() == 1
+
+            row = db.query(WebhookOutbox).order_by(WebhookOutbox.id).first()
+            db.refresh(row)
+            assert row.status == WebhookOutbox.PENDING
+            assert row.attempts == 1
+            assert row.last_error == "HTTP 503"
+            assert row.next_attempt_at >= before + timedelta(seconds=2)
+
+            # Out of attempts: the event is failed and the next one goes out
+            make_due(db)
+            assert await worker.drain() == 2
+            db.refresh(row)
+            assert row.status == WebhookOutbox.FAILED
+            assert row.attempts == 2
+
+            mock_post.return_value = ok_response()
+            make_due(db)
+            assert await worker.drain() == 1
+
+        assert db.query(WebhookOutbox).one().id == row.id
+        assert [d.attempt_number for d in db.query(WebhookDelivery).order_by(WebhookDelivery.id)] == [1, 2, 1, 2]
+        db.refresh(webhook)
+        assert (webhook.total_triggers, webhook.failed_triggers) == (4, 3)
+
+    @pytest.mark.asyncio
+    async def test_expired_lease_is_claimed_again(self, db: Session, test_webhook: Webhook, worker: WebhookWorker):
+        await WebhookService.trigger_webhooks(db, "code.created", {"id": 1})
+        assert len(worker.claim(10)) == 1
+        assert worker.claim(10) == []
+
+        db.query(WebhookOutbox).update({WebhookOutbox.locked_until: datetime.utcnow() - timedelta(seconds=1)})
+        db.commit()
+        assert len(worker.claim(10)) == 1
+
+    @pytest.mark.asyncio
+    async def test_inactive_webhook_events_are_dropped(self, db: Session, test_webhook: Webhook, worker: WebhookWorker):
+        await WebhookService.trigger_webhooks(db, "code.created", {"id": 1})
+        test_webhook.is_active = False
+        db.commit()
+
+        assert worker.claim(10) == []
+        assert db.query(WebhookOutbox).count() == 0
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_bounded(self, db: Session, test_user):
+        for n in range(6):
+            self.make_webhook(db, test_user, f"Hook{n}")
+        await WebhookService.trigger_webhooks(db, "code.created", {"id": 1})
+        worker = WebhookWorker(session_factory=sessionmaker(bind=db.get_bind()), concurrency=2)
+
+        in_flight = peak = 0
+
+        async def slow_post(*args, **kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return ok_response()
+
+        with patch('httpx.AsyncClient.post', new_callable=AsyncMock) as mock_post:
+            mock_post.side_effect = slow_post
+            assert await worker.drain() == 6
+
+        assert peak == 2
+        assert db.query(WebhookOutbox).count() == 0
+        assert db.query(WebhookDelivery).filter(WebhookDelivery.is_success == True).count() == 6
+
+    @pytest.mark.asyncio
+    async def test_database_work_runs_off_event_loop(self, db: Session, test_webhook: Webhook, worker: WebhookWorker):
+        await WebhookService.trigger_webhooks(db, "code.created", {"id": 1})
+        loop_thread = threading.get_ident()
+        threads = []
+
+        def on_thread(method):
+            def wrapper(*args):
+                threads.append(threading.get_ident())
+                return method(*args)
+            return wrapper
+
+        worker.claim = on_thread(worker.claim)
+        worker.settle = on_thread(worker.settle)
+        with patch('httpx.AsyncClient.post', new_callable=AsyncMock) as mock_post:
+            mock_post.return_value = ok_response()
+            assert await worker.drain() == 1
+
+        # claim, settle, then the claim that finds nothing left
+        assert len(threads) == 3 and loop_thread not in threads